@@ -21,6 +21,10 @@ from epandda import taxonomy
 from epandda import bugReport
 from epandda import lithostratigraphy
 from epandda import annotations
+from epandda import connection
+from epandda import registry
+from epandda import annotation
+from pymongo.errors import PyMongoError
 
 from flask_cors import CORS, cross_origin
 import sys
@@ -31,7 +35,7 @@ sys.path.append(os.getcwd())
 sys.path.append(os.getcwd() + "/api")
 
 # load config file with database credentials, Etc.
-config = json.load(open('./config.json'));
+config = connection.getConfig()
 
 # Init
 app = Flask(__name__)
@@ -54,5 +58,16 @@ api.add_resource(bugReport.bugReport, '/bugReport')
 api.add_resource(lithostratigraphy.lithostratigraphy, '/lithostratigraphy')
 api.add_resource(annotations.annotations, '/annotations')
 
+# index endpoints for /query and the banner
+registry.build(app)
+
+# warn about (or create) missing annotation indexes, without which includeAnnotations scans the collection
+try:
+  missing = annotation.checkIndexes(connection.getClient().endpoints.annotations, config.get('create_annotation_indexes', False))
+  if len(missing) > 0:
+    print "WARNING: endpoints.annotations has no index on " + ", ".join(missing) + "; set create_annotation_indexes to create them"
+except PyMongoError as e:
+  print "WARNING: could not check annotation indexes: " + str(e)
+
 if __name__ == '__main__':
   app.run()
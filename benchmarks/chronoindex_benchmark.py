@@ -0,0 +1,70 @@
+import json
+import random
+import sys
+import time
+
+sys.path.append('.')
+from epandda.chronoindex import ChronoIntervalIndex
+
+#
+# Compare answering stratigraphy Ma-range searches ("units within [start, end] Ma") with the in-memory
+# interval index against a scan of every document, which is what the two-sided MongoDB range query
+# amounts to. With --mongo the MongoDB query against endpoints.chronoStratIndex (configured in
+# ./config.json) is timed too, and the index is built from that collection instead of synthetic units.
+#
+# Usage: python benchmarks/chronoindex_benchmark.py [units, default 50000] [searches, default 1000] [--mongo]
+#
+
+args = [a for a in sys.argv[1:] if a != '--mongo']
+useMongo = '--mongo' in sys.argv
+units = int(args[0]) if len(args) > 0 else 50000
+searches = int(args[1]) if len(args) > 1 else 1000
+
+def makeDocs():
+  random.seed(1)
+  docs = []
+  for i in xrange(units):
+    early = random.uniform(0, 541)
+    docs.append({"_id": i, "earlyBound": early, "lateBound": max(0, early - random.expovariate(1 / 5.0)), "pbdbGridFile": i, "idbGridFile": i})
+  return docs
+
+def makeRanges():
+  random.seed(2)
+  ranges = []
+  for i in xrange(searches):
+    start = random.uniform(0, 541)
+    ranges.append((start, max(0, start - random.expovariate(1 / 10.0))))
+  return ranges
+
+def scan(docs, start, end):
+  return [d for d in docs if d["earlyBound"] <= start and d["lateBound"] >= end]
+
+def timed(fn):
+  start = time.time()
+  found = 0
+  for r in ranges:
+    found += len(fn(r))
+  return time.time() - start, found
+
+if useMongo:
+  from pymongo import MongoClient
+  config = json.load(open('./config.json'))
+  collection = MongoClient(config['mongo_url']).endpoints.chronoStratIndex
+  docs = list(collection.find({}, {"_id": True, "earlyBound": True, "lateBound": True, "pbdbGridFile": True, "idbGridFile": True}))
+else:
+  docs = makeDocs()
+ranges = makeRanges()
+
+start = time.time()
+index = ChronoIntervalIndex(docs)
+print "indexed %d units in %.3fs" % (len(index), time.time() - start)
+
+print "%-16s %10s %10s" % ("variant", "total (s)", "matches")
+elapsed, found = timed(lambda r: scan(index.docs, r[0], r[1]))
+print "%-16s %10.3f %10d" % ("scan", elapsed, found)
+elapsed, found = timed(lambda r: index.search([r]))
+print "%-16s %10.3f %10d" % ("interval index", elapsed, found)
+
+if useMongo:
+  elapsed, found = timed(lambda r: list(collection.find({"earlyBound": {"$lte": r[0]}, "lateBound": {"$gte": r[1]}}, {"_id": True})))
+  print "%-16s %10.3f %10d" % ("mongo", elapsed, found)
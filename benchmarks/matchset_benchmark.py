@@ -0,0 +1,76 @@
+import multiprocessing
+import random
+import resource
+import sys
+import time
+import uuid
+
+sys.path.append('.')
+from epandda.matchset import MatchSet
+
+#
+# Compare building match lists by repeated list concatenation (then converting to sets to intersect them,
+# as the endpoints used to) with building and intersecting MatchSets.
+#
+# Each variant runs in its own process so peak memory (max RSS growth) can be reported per variant.
+#
+# Usage: python benchmarks/matchset_benchmark.py [ids per dimension, default 1000000] [files, default 50]
+#
+
+perDimension = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+files = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+#
+# Two overlapping dimensions (eg. taxon and locality), each sampled from a pool of twice as many ids and
+# split across the given number of match files
+#
+def makeLists(seed):
+  random.seed(seed)
+  pool = [str(uuid.UUID(int=random.getrandbits(128))) for i in xrange(perDimension * 2)]
+  dims = []
+  for d in range(2):
+    ids = random.sample(pool, perDimension)
+    size = len(ids) / files
+    dims.append([ids[i * size:(i + 1) * size] for i in range(files)])
+  return dims
+
+def concatenate(dims):
+  sets = []
+  for lists in dims:
+    matches = []
+    for ids in lists:
+      matches = matches + ids
+    sets.append(set(matches))
+
+  result = sets[0] | sets[1]
+  for s in sets:
+    result = result & s
+  return len(list(result))
+
+def matchSet(dims):
+  sets = []
+  for lists in dims:
+    matches = MatchSet()
+    for ids in lists:
+      matches.add('idigbio', ids)
+    sets.append(matches)
+  return MatchSet.intersection(sets).count('idigbio')
+
+def run(variant, queue):
+  dims = makeLists(1)
+  baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.time()
+  count = variant(dims)
+  elapsed = time.time() - start
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+  queue.put((count, elapsed, peak))
+
+if __name__ == '__main__':
+  print "%d ids per dimension in %d files" % (perDimension, files)
+  for name, variant in [('list concatenation', concatenate), ('MatchSet', matchSet)]:
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=run, args=(variant, queue))
+    p.start()
+    count, elapsed, peak = queue.get()
+    p.join()
+    print "%-20s %8.3fs  +%7.1f MB peak RSS  (%d in intersection)" % (name, elapsed, peak / 1024.0, count)
@@ -0,0 +1,80 @@
+import datetime
+import json
+import random
+import sys
+import time
+import uuid
+from bson import ObjectId, json_util
+from bson.decimal128 import Decimal128
+
+sys.path.append('.')
+from epandda import serializers
+
+#
+# Compare serializing a data response with the old path (bson.json_util round trip, then indented,
+# key-sorted stdlib json) against each installed serializer backend, indented and compact.
+#
+# Usage: python benchmarks/serializer_benchmark.py [records per source, default 5000] [repeats, default 5]
+#
+
+records = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+def makeResponse():
+  random.seed(1)
+  idb = []
+  pbdb = []
+  for i in xrange(records):
+    u = str(uuid.UUID(int=random.getrandbits(128)))
+    idb.append({
+      "uuid": u,
+      "url": "https://www.idigbio.org/portal/records/" + u,
+      "_id": ObjectId(),
+      "dwc:scientificName": "Aus bus " + str(i),
+      "dwc:genus": "Aus",
+      "dwc:country": "United States",
+      "dwc:stateProvince": "Wyoming",
+      "idigbio:geoPoint": {"lat": random.uniform(-90, 90), "lon": random.uniform(-180, 180)},
+      "idigbio:dateModified": datetime.datetime(2017, 1, 1) + datetime.timedelta(seconds=i)
+    })
+    pbdb.append({
+      "url": "https://paleobiodb.org/data1.2/occs/single.json?id=" + str(i) + "&show=full",
+      "occurrence_no": i,
+      "genus_name": "Aus",
+      "lat": Decimal128(str(random.uniform(-90, 90))[:10]),
+      "lng": Decimal128(str(random.uniform(-180, 180))[:10]),
+      "early_interval": "Maastrichtian",
+      "late_interval": "Maastrichtian"
+    })
+
+  return {
+    "counts": {"totalCount": records * 2, "idbCount": records, "pbdbCount": records},
+    "results": {"idigbio_resolved": idb, "pbdb_resolved": pbdb},
+    "criteria": {"scientific_name": "aus"},
+    "success": True
+  }
+
+def old(resp):
+  data = json.loads(json_util.dumps(resp, default=json_util.default))
+  return json.dumps(data, sort_keys=True, indent=4, separators=(',', ': ')).encode('utf8')
+
+def timed(fn):
+  best = None
+  for i in range(repeats):
+    start = time.time()
+    out = fn()
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best, len(out)
+
+resp = makeResponse()
+
+print "%-24s %10s %12s" % ("variant", "best (s)", "bytes")
+elapsed, size = timed(lambda: old(resp))
+print "%-24s %10.3f %12d" % ("json_util round trip", elapsed, size)
+
+for backend in serializers.availableBackends():
+  for compact in [False, True]:
+    elapsed, size = timed(lambda: serializers.dumps(resp, compact, backend))
+    print "%-24s %10.3f %12d" % (backend + (" compact" if compact else ""), elapsed, size)
@@ -0,0 +1,50 @@
+# Chronostratigraphic interval index tests
+import random
+import unittest
+
+from epandda.chronoindex import ChronoIntervalIndex
+
+class ChronoIndexTestCase(unittest.TestCase):
+
+  def scan(self, docs, ranges):
+    return [d for d in docs if any(isinstance(d.get("earlyBound"), float) and isinstance(d.get("lateBound"), float) and d["earlyBound"] <= start and d["lateBound"] >= end for start, end in ranges)]
+
+  def test_matches_scan(self):
+    random.seed(3)
+    docs = []
+    for i in range(2000):
+      early = round(random.uniform(0, 541), 1)
+      late = round(max(0, early - random.expovariate(1 / 8.0)), 1)
+      docs.append({"_id": i, "earlyBound": early, "lateBound": late})
+    index = ChronoIntervalIndex(docs)
+
+    for i in range(200):
+      start = round(random.uniform(0, 541), 1)
+      ranges = [(start, round(max(0, start - random.uniform(0, 30)), 1))]
+      if i % 3 == 0:
+        ranges.append((round(random.uniform(0, 541), 1), round(random.uniform(0, 100), 1)))
+      assert index.search(ranges) == self.scan(docs, ranges)
+
+  def test_collection_order(self):
+    docs = [{"_id": 1, "earlyBound": 80.0, "lateBound": 70.0}, {"_id": 2, "earlyBound": 72.0, "lateBound": 66.0}, {"_id": 3, "earlyBound": 75.0, "lateBound": 71.0}]
+    index = ChronoIntervalIndex(docs)
+    assert [d["_id"] for d in index.search([(83.6, 66.0)])] == [1, 2, 3]
+    assert [d["_id"] for d in index.search([(76.0, 66.0), (83.6, 70.0)])] == [1, 2, 3]
+    assert [d["_id"] for d in index.search([(76.0, 66.0)])] == [2, 3]
+
+  def test_edge_bounds(self):
+    docs = [{"_id": 1, "earlyBound": 72.1, "lateBound": 66.0}]
+    index = ChronoIntervalIndex(docs)
+    assert len(index.search([(72.1, 66.0)])) == 1
+    assert len(index.search([(72.0, 66.0)])) == 0
+    assert len(index.search([(72.1, 66.1)])) == 0
+
+  def test_unusual_docs(self):
+    docs = [{"_id": 1, "earlyBound": 60.0, "lateBound": 70.0}, {"_id": 2, "earlyBound": 65.0}, {"_id": 3, "earlyBound": None, "lateBound": 60.0}]
+    index = ChronoIntervalIndex(docs)
+    assert len(index) == 1
+    assert [d["_id"] for d in index.search([(100.0, 50.0)])] == [1]
+    assert [d["_id"] for d in index.search([(61.0, 69.0)])] == [1]
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,55 @@
+# Chronostratigraphic name resolver tests
+import unittest
+
+from epandda import chronostrat, chronoterms
+
+class ChronostratTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.resolver = chronostrat.ChronostratResolver(chronostrat.loadBundled(), 'file')
+
+  def test_exact(self):
+    entry = self.resolver.resolve("maastrichtian")
+    assert entry["name"] == "Maastrichtian"
+    assert entry["start_ma"] == 72.1
+    assert entry["end_ma"] == 66.0
+
+  def test_normalized(self):
+    assert self.resolver.resolve("Late Cretaceous")["name"] == "Upper Cretaceous"
+    assert self.resolver.resolve("early jurassic epoch")["name"] == "Lower Jurassic"
+    assert self.resolver.resolve("Campanian Stage")["name"] == "Campanian"
+
+  def test_fuzzy(self):
+    assert self.resolver.resolve("maastrictian")["name"] == "Maastrichtian"
+    assert self.resolver.resolve("cretacous")["name"] == "Cretaceous"
+    assert self.resolver.resolve("lower cretacious")["name"] == "Lower Cretaceous"
+    assert self.resolver.resolve("devonain")["name"] == "Devonian"
+
+  def test_no_match(self):
+    assert self.resolver.resolve("hell creek") is None
+    assert self.resolver.resolve("") is None
+
+  def test_range(self):
+    assert self.resolver.resolveRange("stage", "campanian", "maastrichtian") == (83.6, 66.0)
+    assert self.resolver.resolveRange("system", "jurassic", "jurassic") == (201.4, 143.1)
+    self.assertRaises(Exception, self.resolver.resolveRange, "stage", "campanian", "nosuchstage")
+
+  def test_range_forms(self):
+    assert chronoterms.splitRange("campanian to maastrichtian") == ("campanian", "maastrichtian")
+    assert chronoterms.splitRange("campanian-maastrichtian") == ("campanian", "maastrichtian")
+    assert chronoterms.splitRange(" upper cretaceous - paleocene ") == ("upper cretaceous", "paleocene")
+    assert chronoterms.splitRange("tortonian") == ("tortonian", "tortonian")
+    assert chronoterms.splitRange("campanian-") == ("campanian", "campanian")
+    for value in ["", "a-b-c", "campanian; maastrichtian", "to maastrichtian"]:
+      assert chronoterms.splitRange(value) is None, value
+
+    early, late = chronoterms.splitRange("campanian to maastrichtian")
+    assert self.resolver.resolveRange("stage", early, late) == (83.6, 66.0)
+
+  def test_lookup_entries(self):
+    resolver = chronostrat.ChronostratResolver([{"name": "Lancian", "start_ma": 68, "end_ma": 66}])
+    assert resolver.resolve("lancian")["start_ma"] == 68.0
+    assert len(resolver) == 1
+
+if __name__ == '__main__':
+  unittest.main()
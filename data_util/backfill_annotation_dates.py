@@ -0,0 +1,47 @@
+import json
+import sys
+from pymongo import MongoClient, UpdateOne
+
+sys.path.append('.')
+from epandda import annotation
+
+#
+# Add the annotatedAtDate field (annotatedAt as a BSON date) to annotations written before it existed,
+# then create the indexes the API looks annotations up by.
+#
+# Usage: python data_util/backfill_annotation_dates.py [--dry-run]
+#
+
+config = json.load(open('./config.json'))
+
+dryRun = '--dry-run' in sys.argv
+
+client = MongoClient(config['mongo_url'])
+annotations = client.endpoints.annotations
+
+updates = []
+stats = {'updated': 0, 'unparseable': 0}
+
+def flush():
+  if updates and not dryRun:
+    annotations.bulk_write(updates, ordered=False)
+  stats['updated'] += len(updates)
+  del updates[:]
+
+for anno in annotations.find({'annotatedAtDate': {'$exists': False}}, {'annotatedAt': True}):
+  date = annotation.parseAnnotatedAt(anno.get('annotatedAt'))
+  if date is None:
+    print "Could not parse annotatedAt for " + str(anno['_id']) + ": " + repr(anno.get('annotatedAt'))
+    stats['unparseable'] += 1
+    continue
+
+  updates.append(UpdateOne({'_id': anno['_id']}, {'$set': {'annotatedAtDate': date}}))
+  if len(updates) >= 1000:
+    flush()
+
+flush()
+
+if not dryRun:
+  annotation.checkIndexes(annotations, True)
+
+print json.dumps(stats, indent=2)
@@ -0,0 +1,72 @@
+import json
+import sys
+import gridfs
+from pymongo import MongoClient, ASCENDING
+
+sys.path.append('.')
+from epandda import indexversion, lithoclosure, postings
+
+#
+# Build the lithostratigraphic closure table (endpoints.lithoClosure) from endpoints.lithoStratIndex
+#
+# The table is written to a staging collection and renamed over the live one when complete, so the API
+# never reads a partial table. Merged match lists too long to store inline are written to GridFS as
+# posting lists; files of the previous table are deleted once it has been replaced. The index version is
+# bumped at the end so API processes drop cached responses.
+#
+# Usage: python data_util/build_litho_closure.py [--compress] [--dry-run]
+#
+
+config = json.load(open('./config.json'))
+
+compress = '--compress' in sys.argv
+dryRun = '--dry-run' in sys.argv
+
+client = MongoClient(config['mongo_url'])
+grid = gridfs.GridFS(client.endpoints)
+
+closure = lithoclosure.buildClosure(list(client.endpoints.lithoStratIndex.find()))
+stats = {'units': len(closure), 'files': 0, 'largestClosure': max([len(c['units']) for c in closure] or [0])}
+
+if dryRun:
+  print json.dumps(stats, indent=2)
+  sys.exit(0)
+
+#
+# Store a merged match list in GridFS, as a posting list if possible
+#
+def storeMatches(ids):
+  try:
+    data = postings.encode(ids, compress)
+  except ValueError:
+    data = json.dumps(ids)
+  stats['files'] += 1
+  return grid.put(data, metadata={'lithoClosure': True})
+
+oldFiles = [f['_id'] for f in client.endpoints['fs.files'].find({'metadata.lithoClosure': True}, {'_id': True})]
+
+staging = client.endpoints[lithoclosure.COLLECTION + '_build']
+staging.drop()
+
+batch = []
+for doc in closure:
+  for field, fileField in [('idb_matches', 'idbGridFile'), ('pbdb_matches', 'pbdbGridFile')]:
+    if len(doc[field]) > lithoclosure.CLOSURE_INLINE_LIMIT:
+      doc[fileField] = storeMatches(doc.pop(field))
+
+  batch.append(doc)
+  if len(batch) >= 500:
+    staging.insert_many(batch)
+    batch = []
+if len(batch) > 0:
+  staging.insert_many(batch)
+
+staging.create_index([('normName', ASCENDING), ('rank', ASCENDING)])
+staging.rename(lithoclosure.COLLECTION, dropTarget=True)
+
+for fileId in oldFiles:
+  grid.delete(fileId)
+
+indexversion.bump(client)
+
+print json.dumps(stats, indent=2)
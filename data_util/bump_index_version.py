@@ -0,0 +1,19 @@
+import json
+import sys
+from pymongo import MongoClient
+
+sys.path.append('.')
+from epandda import indexversion
+
+#
+# Mark the endpoint indexes as rebuilt. Run this after an index rebuild has finished; API processes
+# pick up the new version within index_version_check_seconds and drop caches built from the old indexes.
+#
+
+config = json.load(open('./config.json'))
+
+client = MongoClient(config['mongo_url'])
+
+version = indexversion.bump(client)
+
+print "Index version is now " + version
@@ -0,0 +1,98 @@
+import json
+import sys
+import gridfs
+from pymongo import MongoClient
+
+sys.path.append('.')
+from epandda import postings
+
+#
+# Convert JSON GridFS match files referenced by the endpoint indexes to the binary posting list format
+#
+# Each converted file is written as a new GridFS file and the index documents are re-pointed at it.
+# Old files are only deleted (with --delete-old) once every index document has been updated, so the API
+# keeps serving from the old files while the conversion runs. Files holding ids that can't be stored as
+# posting lists are left as JSON; the API reads both formats.
+#
+# Usage: python data_util/convert_grid_postings.py [--compress] [--delete-old] [--dry-run]
+#
+
+config = json.load(open('./config.json'))
+
+compress = '--compress' in sys.argv
+deleteOld = '--delete-old' in sys.argv
+dryRun = '--dry-run' in sys.argv
+
+client = MongoClient(config['mongo_url'])
+grid = gridfs.GridFS(client.endpoints)
+
+indexes = [client.endpoints.taxonIndex, client.endpoints.localityIndex, client.endpoints.chronoStratIndex]
+
+converted = {}
+skipped = set()
+stats = {'files': 0, 'skipped': 0, 'bytesBefore': 0, 'bytesAfter': 0, 'documents': 0}
+
+#
+# Return id of converted copy of a grid file, converting it if this hasn't been done yet
+#
+def convert(fileId):
+  if fileId in converted:
+    return converted[fileId]
+  if fileId in skipped:
+    return fileId
+
+  old = grid.get(fileId)
+  data = old.read()
+
+  if postings.isPostingList(data):
+    skipped.add(fileId)
+    return fileId
+
+  try:
+    encoded = postings.encode(json.loads(data), compress)
+  except ValueError:
+    print "Leaving " + str(fileId) + " as JSON"
+    skipped.add(fileId)
+    stats['skipped'] += 1
+    return fileId
+
+  stats['files'] += 1
+  stats['bytesBefore'] += len(data)
+  stats['bytesAfter'] += len(encoded)
+
+  if dryRun:
+    converted[fileId] = fileId
+    return fileId
+
+  newId = grid.put(encoded, filename=old.filename, metadata={'format': 'postings', 'version': postings.VERSION, 'convertedFrom': fileId})
+  converted[fileId] = newId
+  return newId
+
+for index in indexes:
+  print "Converting match files for " + index.name
+
+  for doc in index.find({'$or': [{'pbdbGridFile': {'$exists': True}}, {'idbGridFile': {'$exists': True}}]}, {'pbdbGridFile': True, 'idbGridFile': True}):
+    update = {}
+
+    for field in ['pbdbGridFile', 'idbGridFile']:
+      if field not in doc:
+        continue
+
+      if type(doc[field]) is list:
+        newIds = [convert(f) for f in doc[field]]
+      else:
+        newIds = convert(doc[field])
+
+      if newIds != doc[field]:
+        update[field] = newIds
+
+    if update and not dryRun:
+      index.update_one({'_id': doc['_id']}, {'$set': update})
+      stats['documents'] += 1
+
+if deleteOld and not dryRun:
+  for oldId in converted:
+    grid.delete(oldId)
+
+print json.dumps(stats, indent=2)
+print "Run data_util/bump_index_version.py so API processes drop cached match lists."
@@ -0,0 +1,21 @@
+import json
+import sys
+from pymongo import MongoClient
+
+sys.path.append('.')
+from epandda import materializedstats
+
+#
+# Recompute the statistics served by /stats (record totals and distinct counts of each place type)
+# and store them in endpoints.apiStats. API processes also do this in the background every
+# stats_refresh_seconds; run this after loading new data to update the figures straight away.
+#
+
+config = json.load(open('./config.json'))
+
+client = MongoClient(config['mongo_url'])
+
+doc = materializedstats.materialize(client)
+
+print json.dumps(doc['counts'], indent=2)
+print "Computed in " + str(doc['durationSeconds']) + " seconds"
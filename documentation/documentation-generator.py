@@ -1,12 +1,15 @@
 # 
 # This generates a static endpoint documentation page for the ePANDDA website
-# It is refreshed daily/weekly so it should be up to date as it pulls from the endpoints themselves
+# It is refreshed daily/weekly so it should be up to date as it reads the endpoint catalog the API
+# writes at startup (catalog_path in the API config)
+#
+# Usage: python documentation-generator.py [catalog path, default ../static/api-catalog.json]
 #
 
-import requests
+import sys
 import json
 
-banner = requests.get('https://api.epandda.org/')
+catalog = json.load(open(sys.argv[1] if len(sys.argv) > 1 else '../static/api-catalog.json'))
 
 doc = open('../../site/endpoint_doc_temp.html', 'w')
 
@@ -19,8 +22,8 @@ endpoint_doc = '''
 </div>
 '''
 
-if banner.status_code == 200:
-	data = banner.json()
+if 'banner' in catalog:
+	data = catalog['banner']
 	
 	end_sections = []
 
@@ -28,13 +31,10 @@ if banner.status_code == 200:
 		print endpoint
 		if endpoint in ['/']:
 			continue
-		route = 'https://api.epandda.org/' + endpoint['url']
-		description = requests.get(route)
-		
-		if description.status_code == 200:
+		if endpoint['url'] in catalog['descriptions']:
 			if len(endpoint['url'][1:]) < 1:
 				continue
-			params = description.json()
+			params = catalog['descriptions'][endpoint['url']]
 			desc = params['description'] if 'description' in params else 'This is a temporary description'
 			point_row = '''
 <div class="row">
@@ -87,7 +87,7 @@ if banner.status_code == 200:
 
 			end_sections.append(endpoint_section)
 		else:
-			print "ERROR " + str(description.status_code)
+			print "ERROR no description for " + endpoint['url']
 		
 	point_html = ' '.join(end_sections)
 
@@ -5,15 +5,27 @@
 # Simple function to fascilitate construction of annotations for ePANDDA and iDigBio Consumption
 
 import json
+import re
 import time
 import datetime
 import uuid
+from bson import ObjectId
+
+# fields annotations are looked up by
+INDEXED_FIELDS = ['hasBody.@id', 'hasTarget.@id', 'annotatedAtDate']
+
+# date index also orders annotations with the same date, for stable listing
+INDEX_KEYS = {'annotatedAtDate': [('annotatedAtDate', 1), ('_id', 1)]}
+
+# format of annotatedAt strings
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 def create(target, body):
 
   # Timestamp and annotation uuid
   anno_uuid = uuid.uuid4()
-  datestamp = datetime.datetime.fromtimestamp( time.time() ).strftime('%Y-%m-%d %H:%M:%S %Z')
+  annotated_at = datetime.datetime.fromtimestamp( int(time.time()) )
+  datestamp = annotated_at.strftime(DATE_FORMAT + ' %Z')
 
   target_uuid = str(target['uuid'])
 
@@ -22,6 +34,9 @@ def create(target, body):
   open_annotation['@id'] = "urn:uuid:" + str(anno_uuid)
   open_annotation['@type'] = "oa:Annotation"
   open_annotation['annotatedAt'] = str(datestamp)
+
+  # same time as a BSON date, for indexed date range queries; not part of the annotation served by the API
+  open_annotation['annotatedAtDate'] = annotated_at
   open_annotation['annotatedBy'] = {
     "@id": "https://epandda.org", 
     "@type": "foaf:Project",
@@ -50,3 +65,75 @@ def create(target, body):
   }
 
   return open_annotation
+
+#
+# Return annotatedAtDate value for an annotatedAt string, or None if it can't be parsed
+#
+def parseAnnotatedAt(annotated_at):
+  try:
+    return datetime.datetime.strptime(annotated_at.strip()[:19], DATE_FORMAT)
+  except (ValueError, AttributeError):
+    return None
+
+#
+# Return [start, end) datetime range covered by a date given as YYYY, YYYY-MM or YYYY-MM-DD
+#
+def dateRange(date):
+  parts = date.strip().split('-')
+  try:
+    if len(parts) == 1:
+      start = datetime.datetime(int(parts[0]), 1, 1)
+      return start, datetime.datetime(start.year + 1, 1, 1)
+    if len(parts) == 2:
+      start = datetime.datetime(int(parts[0]), int(parts[1]), 1)
+      return start, datetime.datetime(start.year + (start.month // 12), start.month % 12 + 1, 1)
+    if len(parts) == 3:
+      start = datetime.datetime(int(parts[0]), int(parts[1]), int(parts[2]))
+      return start, start + datetime.timedelta(days=1)
+  except ValueError:
+    pass
+  return None
+
+#
+# Check that the fields annotations are looked up by are indexed, creating missing indexes if create
+# is set. Returns list of fields that are (still) missing an index.
+#
+def checkIndexes(collection, create=False):
+
+  indexed = set()
+  for index in collection.list_indexes():
+    indexed.add(index['key'].keys()[0])
+
+  missing = [f for f in INDEXED_FIELDS if f not in indexed]
+  if create:
+    for f in missing:
+      collection.create_index(INDEX_KEYS.get(f, f))
+    missing = []
+
+  return missing
+
+#
+# Export watermarks identify the last annotation exported, as <YYYYMMDDHHMMSS>-<ObjectId>
+#
+def makeWatermark(anno):
+  return anno['annotatedAtDate'].strftime('%Y%m%d%H%M%S') + '-' + str(anno['_id'])
+
+#
+# Return query for annotations to export after a since value: either a watermark (annotations after
+# it), or a date or annotatedAt time (annotations at or after it). Returns None if since isn't valid.
+#
+def sinceQuery(since):
+  since = since.strip()
+
+  m = re.match(r'^(\d{14})-([0-9a-f]{24})$', since)
+  if m:
+    date = datetime.datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
+    return {'$or': [{'annotatedAtDate': {'$gt': date}}, {'annotatedAtDate': date, '_id': {'$gt': ObjectId(m.group(2))}}]}
+
+  date = parseAnnotatedAt(since.replace('t', ' ').replace('T', ' '))
+  if date is None:
+    dates = dateRange(since)
+    if dates is None:
+      return None
+    date = dates[0]
+  return {'annotatedAtDate': {'$gte': date}}
@@ -1,5 +1,15 @@
 import re
+import time
+import threading
+import zlib
+from flask import Response, stream_with_context
 from mongo import mongoBasedResource
+import annotation
+import serializers
+
+# unfiltered total, cached for annotation_count_ttl_seconds
+_total = {'count': None, 'at': 0}
+_totalLock = threading.Lock()
 
 #
 #
@@ -29,40 +39,48 @@ class annotations(mongoBasedResource):
             'parameters': {},
           }
 
+          # date filters are range scans on the indexed annotatedAtDate field
           for p in ['annotationDate', 'annotationDateAfter', 'annotationDateBefore']:  
  
             if params[p]:
 
+              dates = annotation.dateRange(params[p])
+              if dates is None:
+                raise Exception({p: "Invalid date " + params[p] + "; use YYYY-MM-DD"})
+
               if 'annotationDate' == p:
-                annoQuery.append({"annotatedAt": { '$regex': params[p]} })
+                annoQuery.append({"annotatedAtDate": { '$gte': dates[0], '$lt': dates[1]} })
 
               if 'annotationDateAfter' == p:
-                annoQuery.append({"annotatedAt": { '$gte': params[p]} }) 
+                annoQuery.append({"annotatedAtDate": { '$gte': dates[0]} }) 
             
               if 'annotationDateBefore' == p:
-                print "annotation Date Before: " + str(params[p])
-                annoQuery.append({"annotatedAt": { '$lte': params[p]} })
+                annoQuery.append({"annotatedAtDate": { '$lt': dates[0]} })
 
               criteria['parameters'][p] = str(params[p]).lower()
 
+          # bulk export
+          if params['stream'] in ['true', '1']:
+            if params['since']:
+              since = annotation.sinceQuery(params['since'])
+              if since is None:
+                raise Exception({'since': "Invalid since value " + params['since'] + "; use a watermark or YYYY-MM-DD"})
+              annoQuery.append(since)
+            return self.respondWithExport(annotations, annoQuery)
+
           d = []
- 
-          # Total Count:
-          annoCount = annotations.find({}).count()
 
           if annoQuery:
-            res = annotations.find({"$and":  annoQuery }, {'_id': False}).skip(offset).limit(limit)
-            annoCount = res.count()
-
+            query = {"$and": annoQuery}
+            annoCount = annotations.count_documents(query)
           else:
             # Allows for optional Date param since you can't $and on nothing.
-            res = annotations.find({}, {'_id': False}).skip(offset).limit(limit)
-            
-
+            query = {}
+            annoCount = self.totalCount(annotations)
 
-          if res:
-              for i in res:
-                  d.append(i)
+          res = annotations.find(query, {'_id': False, 'annotatedAtDate': False}).sort([('annotatedAtDate', 1), ('_id', 1)]).skip(offset).limit(limit)
+          for i in res:
+              d.append(i)
 
 
           counts = {'totalCount': annoCount, 'annotationsCount': len(d)}
@@ -77,6 +95,74 @@ class annotations(mongoBasedResource):
           return self.respondWithDescription()
             
 
+    #
+    # Stream every annotation matching query as a JSON-LD array (format=jsonld, the default) or NDJSON
+    # (format=ndjson), optionally gzip compressed (gzip=true). Annotations are read with a batched cursor
+    # in (annotatedAtDate, _id) order, so memory use is constant whatever the size of the collection.
+    #
+    # NDJSON exports end with a {"watermark": ...} line; passing it as since resumes the export after the
+    # last annotation exported. For JSON-LD, since can be the annotatedAt time of the last annotation
+    # (annotations at that time are exported again).
+    #
+    def respondWithExport(self, annotations, query):
+        ndjson = self.params.get('format') == 'ndjson'
+        compress = self.params.get('gzip') in ['true', '1']
+        batchSize = self.config.get('annotation_export_batch_size', 1000)
+
+        def generate():
+            cursor = annotations.find({"$and": query} if query else {}, no_cursor_timeout=True).sort([('annotatedAtDate', 1), ('_id', 1)]).batch_size(batchSize)
+            try:
+                # with nothing new to export, the since value passed in is still the place to resume from
+                watermark = self.params.get('since')
+                count = 0
+                lines = []
+                for anno in cursor:
+                    if 'annotatedAtDate' in anno:
+                        watermark = annotation.makeWatermark(anno)
+                        del anno['annotatedAtDate']
+                    del anno['_id']
+
+                    if ndjson:
+                        lines.append(serializers.dumps(anno, True) + "\n")
+                    else:
+                        lines.append(("[\n" if count == 0 else ",\n") + serializers.dumps(anno, True))
+                    count += 1
+                    if len(lines) >= batchSize:
+                        yield "".join(lines)
+                        lines = []
+
+                if ndjson:
+                    lines.append(serializers.dumps({"watermark": watermark}, True) + "\n")
+                else:
+                    lines.append("[]\n" if count == 0 else "\n]\n")
+                yield "".join(lines)
+            finally:
+                cursor.close()
+
+        def gzipped(chunks):
+            gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            for chunk in chunks:
+                data = gz.compress(chunk)
+                if data:
+                    yield data
+            yield gz.flush()
+
+        body = gzipped(generate()) if compress else generate()
+        resp = Response(stream_with_context(body), status=200, mimetype="application/x-ndjson" if ndjson else "application/ld+json")
+        if compress:
+            resp.headers['Content-Encoding'] = 'gzip'
+        return resp
+
+    #
+    # Return total number of annotations, counting them at most once every annotation_count_ttl_seconds
+    #
+    def totalCount(self, annotations):
+        with _totalLock:
+            if _total['count'] is None or time.time() - _total['at'] > self.config.get('annotation_count_ttl_seconds', 300):
+                _total['count'] = annotations.count_documents({})
+                _total['at'] = time.time()
+            return _total['count']
+
     def description(self):
         return {
             'name': 'Annotations',
@@ -89,7 +175,7 @@ class annotations(mongoBasedResource):
                     "label": "Annotation Date",
                     "type": "text",
                     "required": False,
-                    "description": "Filter annotation results by provided date ( simple date match ). Format annotationDate=YYYY-MM-DD"
+                    "description": "Filter annotation results by provided date, month or year. Format annotationDate=YYYY-MM-DD, YYYY-MM or YYYY"
                 },
                 {
                     "name": "annotationDateAfter",
@@ -104,6 +190,27 @@ class annotations(mongoBasedResource):
                     "type": "text",
                     "required": False,
                     "description": "Filter annotation results before provided date. Format annotationDateBefore=YYYY-MM-DD"
+                },
+                {
+                    "name": "stream",
+                    "label": "Bulk Export",
+                    "type": "boolean",
+                    "required": False,
+                    "description": "Stream all matching annotations in one response rather than a page. Use format=jsonld (default) for a JSON-LD array or format=ndjson for one annotation per line"
+                },
+                {
+                    "name": "since",
+                    "label": "Export Since",
+                    "type": "text",
+                    "required": False,
+                    "description": "With stream, export annotations after the watermark ending a previous NDJSON export, or at or after a date (YYYY-MM-DD) or annotatedAt time"
+                },
+                {
+                    "name": "gzip",
+                    "label": "Gzip Export",
+                    "type": "boolean",
+                    "required": False,
+                    "description": "With stream, gzip compress the export"
                 }
             ]
         }
@@ -1,17 +1,28 @@
-from flask import request, Response
+from flask import request, Response, stream_with_context
 from flask_restful import Resource, Api
-import json
-from pymongo import MongoClient
-from bson import Binary, Code, json_util, BSON, ObjectId
-from bson.json_util import dumps
+from werkzeug.http import parse_cache_control_header
+from bson import ObjectId
+import collections
 import datetime
-import importlib
-import inspect
 from sources import idigbio
 from sources import paleobio
 from sources import paleobio_refs
 import re
+import time
 import annotation
+import connection
+import indexversion
+import registry
+import resultsets
+import responsecache
+import serializers
+
+# Cache-Control values used when the cache_control config setting doesn't override them
+DEFAULT_CACHE_CONTROL = {
+    'data': 'public, max-age=300',
+    'description': 'public, max-age=86400',
+    'error': 'no-cache'
+}
 
 #
 # Base class for API resource
@@ -19,14 +30,19 @@ import annotation
 #
 
 class baseResource(Resource):
+    # Set to cache complete responses, keyed on normalized parameters (see responsecache.py), and
+    # to answer conditional GET requests with 304 Not Modified
+    cacheResponses = False
+
+    # Set by /query to have respondWithMatches() return raw match sets instead of a resolved page
+    matchesOnly = False
+
     def __init__(self):
         super(baseResource, self).__init__()
 
-        # Load API config
-        self.config = json.load(open('./config.json'))
-
-        self.client = MongoClient("mongodb://" + self.config['mongodb_user'] + ":" + self.config['mongodb_password'] + "@" + self.config['mongodb_host'])
-        #self.client = MongoClient("mongodb://127.0.0.1")
+        # API config and MongoClient are shared by all resources in the process
+        self.config = connection.getConfig()
+        self.client = connection.getClient()
         self.idigbio = self.client.idigbio.occurrence
         self.pbdb = self.client.pbdb.pbdb_occurrences
         self.refs = self.client.pbdb.pbdb_refs
@@ -43,6 +59,9 @@ class baseResource(Resource):
 
         self.returnResponse = True
 
+        # Expiry (epoch seconds) of the result set saved for this request's continuation token, if any
+        self.resultSetExpires = None
+
         self.sources = {
             "idigbio": idigbio.idigbio(),
             "paleobio": paleobio.paleobio(),
@@ -58,117 +77,133 @@ class baseResource(Resource):
     #
     # Resolve underlying data source ids (from iDigBio, PBDB, Etc.) to URLs the end-user can use
     #
+    # Only the requested page (offset/limit, applied to each source separately) is resolved. A limit
+    # below 1 resolves every id after offset.
+    #
     def resolveReferences(self, data, pbdb_type='occs', show_type='full'):
-
-        resolved_references = {"idigbio_resolved" : [], "pbdb_resolved": [] }
-
-        idigbio_fields = self.getFieldsForSource("idigbio", True)
-        paleobio_fields = self.getFieldsForSource("paleobio", True)
-
-        if "refs" == pbdb_type:
-          paleobio_fields = self.getFieldsForSource("paleobio_refs", True) 
-
         offset = self.offset()
         limit = self.limit()
 
-        idigbio_ids = []
-        pbdb_ids = []
-
-        # Could params this if need be?
-        use_UUID = True
+        idigbio_ids = self.pageWindow([item["matches"]["idigbio"] for item in data], offset, limit)
+        pbdb_ids = self.pageWindow([item["matches"]["pbdb"] for item in data], offset, limit)
 
-        for item in data:
-            if len(idigbio_ids) < offset + limit:
+        return self.resolveIds(idigbio_ids, pbdb_ids, pbdb_type, show_type)
 
-                if ObjectId.is_valid( item["matches"]["idigbio"] ):
-                  use_UUID = False
-
-                idigbio_ids = idigbio_ids + item["matches"]["idigbio"]
-
-            if len(pbdb_ids) < offset + limit:
-
-                if ObjectId.is_valid( item["matches"]["pbdb"] ):
-                  use_UUID = False
-
-                pbdb_ids = pbdb_ids + item["matches"]["pbdb"]
-
-            if (len(idigbio_ids) >= offset + limit) and (len(pbdb_ids) >= offset + limit):
-                 break
-
-        if offset > 0:
-            idigbio_ids = idigbio_ids[offset:]
-            pbdb_ids = pbdb_ids[offset:]
-
-        if limit > 0:
-            idigbio_ids = idigbio_ids[offset:limit]
-            pbdb_ids = pbdb_ids[offset:limit]
-
-        # Double limiting? 
-        if not use_UUID:
-            idigbio_ids = map(lambda id: ObjectId(id), idigbio_ids[0:limit])
-            pbdb_ids = map(lambda id: ObjectId(id), pbdb_ids[0:limit])
-
-            #
-            # resolve idigbio refs
-            #
-            m = self.idigbio.find({"_id": {"$in" : idigbio_ids}})
-        else:
-            m = self.idigbio.find({"idigbio:uuid": {"$in" : idigbio_ids}})
-            idigbio_records = {}
-
-            for i in m:
-                idigbio_records[i['idigbio:uuid']] = i
+    #
+    # Resolve a page of iDigBio and PBDB ids
+    #
+    def resolveIds(self, idigbio_ids, pbdb_ids, pbdb_type='occs', show_type='full'):
 
-            pbdb_ids = [ int(pbdb_id) for pbdb_id in pbdb_ids ]
+        resolved_references = {"idigbio_resolved" : [], "pbdb_resolved": [] }
 
-            if "refs" == pbdb_type:
+        idigbio_fields = self.getFieldsForSource("idigbio", True)
+        paleobio_fields = self.getFieldsForSource("paleobio", True)
 
-              print "making refs query"
-              pbdb_ids_str = [ str(pbdb_id) for pbdb_id in pbdb_ids ]
-              p = self.refs.find({"pid": {"$in": pbdb_ids_str}}, {"_id": False})
-              pbdb_records = {}
-              for i in p:
-                pbdb_records[ int(i['pid']) ] = i
+        if "refs" == pbdb_type:
+          paleobio_fields = self.getFieldsForSource("paleobio_refs", True) 
+          show_type = 'both'
 
-            else: 
-              p = self.pbdb.find({"occurrence_no": {"$in" : pbdb_ids}})
-              pbdb_records = {}
-              for i in p:
-                 pbdb_records[i['occurrence_no']] = i
+        # fields=none returns ids and URLs only, without reading any records
+        if self.params.get('fields') == 'none':
+            idigbio_fields = None
+            paleobio_fields = None
+
+        #
+        # resolve idigbio refs
+        #
+        idigbio_records = {}
+        if len(idigbio_ids) > 0 and idigbio_fields is not None:
+            if ObjectId.is_valid(idigbio_ids[0]):
+                m = self.idigbio.find({"_id": {"$in" : [ObjectId(id) for id in idigbio_ids]}}, self.projection(idigbio_fields))
+                for i in m:
+                    idigbio_records[str(i['_id'])] = i
+            else:
+                m = self.idigbio.find({"idigbio:uuid": {"$in" : idigbio_ids}}, self.projection(idigbio_fields, "idigbio:uuid"))
+                for i in m:
+                    idigbio_records[i['idigbio:uuid']] = i
 
         resolved = []
         for idb_uuid in idigbio_ids:
             row = {"uuid": str(idb_uuid), "url": "https://www.idigbio.org/portal/records/" + str(idb_uuid)}
 
-            if idigbio_fields is not None:
+            if idigbio_fields is not None and idb_uuid in idigbio_records:
                 for f in idigbio_fields:
-                	if idb_uuid in idigbio_records:
-                		if f in idigbio_records[idb_uuid]:
-                			row[f] = idigbio_records[idb_uuid][f]
+                    if f in idigbio_records[idb_uuid]:
+                        row[f] = idigbio_records[idb_uuid][f]
             resolved.append(row)
 
         resolved_references["idigbio_resolved"] = resolved
 
-        if 'refs' == pbdb_type:
-          show_type = 'both'
+        #
+        # resolve pbdb refs
+        #
+        pbdb_records = {}
+        if len(pbdb_ids) > 0:
+            if ObjectId.is_valid(pbdb_ids[0]):
+                if paleobio_fields is not None:
+                    p = self.pbdb.find({"_id": {"$in" : [ObjectId(id) for id in pbdb_ids]}}, self.projection(paleobio_fields))
+                    for i in p:
+                        pbdb_records[str(i['_id'])] = i
+            elif "refs" == pbdb_type:
+                pbdb_ids = [ int(pbdb_id) for pbdb_id in pbdb_ids ]
+                if paleobio_fields is not None:
+                    p = self.refs.find({"pid": {"$in": [ str(pbdb_id) for pbdb_id in pbdb_ids ]}}, self.projection(paleobio_fields, "pid", False))
+                    for i in p:
+                        pbdb_records[ int(i['pid']) ] = i
+            else:
+                pbdb_ids = [ int(pbdb_id) for pbdb_id in pbdb_ids ]
+                if paleobio_fields is not None:
+                    p = self.pbdb.find({"occurrence_no": {"$in" : pbdb_ids}}, self.projection(paleobio_fields, "occurrence_no", False))
+                    for i in p:
+                        pbdb_records[i['occurrence_no']] = i
 
         resolved = []
-        for mitem in data:
-
-          for pbdbid in pbdb_ids:
+        for pbdbid in pbdb_ids:
             row = {"url": 'https://paleobiodb.org/data1.2/' + pbdb_type + '/single.json?id=' + str(pbdbid) + '&show=' + show_type }
 
-            if paleobio_fields is not None:
+            if paleobio_fields is not None and pbdbid in pbdb_records:
                 for f in paleobio_fields:
                     if f in pbdb_records[pbdbid]:
                         row[f] = pbdb_records[pbdbid][f]
-            
             resolved.append(row)
 
         resolved_references["pbdb_resolved"] = resolved
 
         return resolved_references
 
+    #
+    # Return Mongo projection fetching only the given fields of a source record, plus the key
+    # field records are matched on
+    #
+    def projection(self, fields, key_field=None, include_id=True):
+        projection = {"_id": include_id}
+        for f in fields:
+            projection[f] = True
+        if key_field is not None:
+            projection[key_field] = True
+        return projection
+
+    #
+    # Return the ids at [offset, offset + limit) of a sequence of id lists, as if the lists were
+    # concatenated, without concatenating them. A limit below 1 returns everything after offset.
+    #
+    def pageWindow(self, id_lists, offset, limit):
+        window = []
+        for ids in id_lists:
+            if offset >= len(ids):
+                offset -= len(ids)
+                continue
+
+            if limit > 0:
+                window.extend(ids[offset:offset + limit - len(window)])
+                if len(window) >= limit:
+                    break
+            else:
+                window.extend(ids[offset:])
+            offset = 0
+
+        return window
+
     #
     # Set parameter data directly
     #
@@ -209,9 +244,20 @@ class baseResource(Resource):
         desc.append({"name": "offset"})
         desc.append({"name": "limit"})
 
+        # always pull continuation token for paging through materialized result sets
+        desc.append({"name": "cursor"})
+
         # always pull in source field lists
         desc.append({"name": "idigbio_fields"})
         desc.append({"name": "paleobio_fields"})
+        desc.append({"name": "fields"})
+
+        # always pull streaming export options
+        desc.append({"name": "format"})
+        desc.append({"name": "stream"})
+
+        # always pull option to attach annotations to their PBDB rows
+        desc.append({"name": "inlineAnnotations"})
 
         self.params = {}
 
@@ -220,8 +266,9 @@ class baseResource(Resource):
         for p in desc:
             # JSON blob
             if r_as_json is not None:
-                if(p['name'] in r_as_json):
-                    self.params[p['name']] = r_as_json[p['name']].lower()
+                # JSON values may be numbers or booleans (eg. "limit": 10); they're used as strings like any other
+                if(p['name'] in r_as_json and r_as_json[p['name']] is not None):
+                    self.params[p['name']] = unicode(r_as_json[p['name']]).lower()
                     c = c + 1
                 else:
                     self.params[p['name']] = None
@@ -253,17 +300,16 @@ class baseResource(Resource):
     # Validate parameter values
     #
     def getFieldsForSource(self, source, defaultToAll=False):
-        ucFields = {'idigbio:geopoint': 'idigbio:geoPoint', 'dwc:scientificname': 'dwc:scientificName'}
         if source in self.sources:
             fields_available_in_source = self.sources[source].availableFields()
             if source + "_fields" in self.params and self.params[source + "_fields"] is not None and len(self.params[source + "_fields"]) > 0:
-                fields = re.split("[,; ]", self.params[source + "_fields"])
-		i = 0
-                for field in fields:
-		    if field in ucFields:
-                        fields[i] = ucFields[field]
-                    i += 1
-                return list(set(fields) & set(fields_available_in_source))
+                # parameter values are lower-cased, so match them to the source's field names case-insensitively
+                available = dict((f.lower(), f) for f in fields_available_in_source)
+                fields = []
+                for field in re.split("[,; ]", self.params[source + "_fields"]):
+                    if field.lower() in available and available[field.lower()] not in fields:
+                        fields.append(available[field.lower()])
+                return fields
             elif defaultToAll:
                 return fields_available_in_source
 
@@ -340,19 +386,13 @@ class baseResource(Resource):
     # Return data object as string
     #
     def serialize(self, data):
-        return dumps(data)
+        return serializers.dumps(data)
 
     #
-    # Return data object as JSON. Can handle Mongo cursors.
+    # Return data object as JSON-friendly values. Can handle Mongo cursors.
     #
     def toJson(self, data):
-        # Serialize Mongo cursor as JSON
-        json_data = json.loads(dumps(data, sort_keys=True, indent=4, default=json_util.default))
-
-        # Kill _id keys (and maybe some others too soon...)
-        #for record in json_data:
-        #  record.pop('_id', None)
-        return json_data
+        return serializers.convert(data)
 
 
     #
@@ -361,9 +401,11 @@ class baseResource(Resource):
     #
     def get(self):
         try:
-            return self.process()
+            if self.getCursor():
+                return self.respondWithCursor(self.getCursor())
+            return self.processWithCache()
         except Exception as e:
-            return self.respondWithError(e.args[0])
+            return self.respondWithError(self.errorsFor(e))
 
     #
     # Default handler for POST requests
@@ -372,9 +414,109 @@ class baseResource(Resource):
     def post(self):
         #return self.process()
         try:
-            return self.process()
+            if self.getCursor():
+                return self.respondWithCursor(self.getCursor())
+            return self.processWithCache()
         except Exception as e:
-            return self.respondWithError(e.args[0])
+            return self.respondWithError(self.errorsFor(e))
+
+    #
+    # Return the {parameter: message} errors carried by an exception. Unexpected exceptions (without
+    # an errors dict) are reported under GENERAL.
+    #
+    def errorsFor(self, e):
+        if len(e.args) > 0 and type(e.args[0]) is dict:
+            return e.args[0]
+        return {"GENERAL": unicode(e)}
+
+    #
+    # Call process(), answering from the response cache if the endpoint caches responses.
+    #
+    # The cache key, derived from the normalized query and index version, doubles as the response's
+    # ETag, so a GET with a matching If-None-Match (strong or weak) is answered with 304 before any work
+    # is done.
+    #
+    # Responses carrying a "next" continuation token are only good while its saved result set lives, so
+    # their ETag also carries the set's expiry, and neither a cached copy nor a 304 is handed out unless
+    # the set outlives the response's max-age. Otherwise the query is run again, saving a fresh set.
+    #
+    def processWithCache(self):
+        if not self.cacheResponses or not self.returnResponse or self.isStreaming() or self.paramCount == 0:
+            return self.process()
+
+        key = responsecache.makeKey(indexversion.currentVersion(), self.__class__.__name__, self.params, self.offset(), self.limit())
+        conditional = request.method == 'GET'
+        if conditional:
+            # If-None-Match uses weak comparison, so W/ tags (as sent back through compressing proxies) match too
+            for etag in request.if_none_match.as_set(include_weak=True):
+                if etag == key or (etag.startswith(key + '.') and self.resultSetUsable(etag[len(key) + 1:])):
+                    return self.addCacheHeaders(Response(status=304), etag, 'data')
+
+        cache = responsecache.getCache()
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None and cached.get('resultSetExpires') is not None and not self.resultSetUsable(cached['resultSetExpires']):
+            cached = None
+
+        if cached is not None:
+            resp = Response(cached['body'], status=cached['status'], mimetype=cached['mimetype'])
+            self.resultSetExpires = cached.get('resultSetExpires')
+        else:
+            self.resultSetExpires = None
+            resp = self.process()
+            if cache is not None and isinstance(resp, Response) and resp.status_code == 200 and not resp.is_streamed:
+                cache.put(key, {'body': resp.get_data(), 'status': resp.status_code, 'mimetype': resp.mimetype, 'resultSetExpires': self.resultSetExpires})
+
+        if conditional and isinstance(resp, Response) and resp.status_code == 200:
+            if self.resultSetExpires is not None:
+                key = key + '.' + str(self.resultSetExpires)
+            self.addCacheHeaders(resp, key, 'data')
+
+            # "*" matches whichever representation is current, so it's answered once that is known
+            if request.if_none_match.star_tag:
+                return self.addCacheHeaders(Response(status=304), key, 'data')
+        return resp
+
+    #
+    # Return true if a result set expiring at expires (epoch seconds) outlives the max-age of a data
+    # response sent now
+    #
+    def resultSetUsable(self, expires):
+        try:
+            expires = int(expires)
+        except ValueError:
+            return False
+        maxAge = parse_cache_control_header(self.cacheControl('data')).max_age or 0
+        return expires - time.time() >= maxAge
+
+    #
+    # Return Cache-Control value for a kind of response ("data", "description" or "error"). The
+    # cache_control config setting can override each kind, and the data value per endpoint name.
+    #
+    def cacheControl(self, kind):
+        settings = self.config.get('cache_control', {})
+        if kind == 'data' and self.__class__.__name__ in settings:
+            return settings[self.__class__.__name__]
+        return settings.get(kind, DEFAULT_CACHE_CONTROL[kind])
+
+    #
+    # Set ETag, Cache-Control and (for data responses) Last-Modified headers on a response
+    #
+    def addCacheHeaders(self, resp, etag, kind):
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = self.cacheControl(kind)
+        if kind == 'data' and indexversion.lastModified() is not None:
+            resp.last_modified = indexversion.lastModified()
+        return resp
+
+    #
+    # Return response for content that only changes when the code or config does (descriptions, the
+    # route list), pre-rendered by the registry, with a long-lived Cache-Control. Answers 304 if the
+    # client's copy is current.
+    #
+    def respondWithRendered(self, rendered, mimetype):
+        resp = Response(rendered['body'], status=200, mimetype=mimetype)
+        self.addCacheHeaders(resp, rendered['etag'], 'description')
+        return resp.make_conditional(request)
 
     #
     #
@@ -422,6 +564,7 @@ class baseResource(Resource):
                 "includeAnnotations": False,
                 "results": {},
                 "criteria": {},
+                "next": None,
                 "v": self.config['version'],
             }
 
@@ -452,41 +595,155 @@ class baseResource(Resource):
             resp['media'] = return_object['media']
 
 
-        # Get annotations by resolved PBDB Ref URL
-	if "includeAnnotations" in resp:
-          if resp['includeAnnotations']:
-            resp['annotations'] = []
-            for pb in return_object['results']['pbdb_resolved']:
-              annoCursor = self.annotations.find({"hasBody.@id": pb['url']},{"_id": False})
-              for anno in annoCursor:
-                resp['annotations'].append( anno )
+        # Get annotations by resolved PBDB Ref URL, either as a flat list or attached to each PBDB row
+        if resp.get('includeAnnotations') and 'pbdb_resolved' in resp['results']:
+            rows = resp['results']['pbdb_resolved']
+            byUrl = self.annotationsByUrl([pb['url'] for pb in rows])
+            if self.params.get('inlineAnnotations') in ['true', '1']:
+                for pb in rows:
+                    pb['annotations'] = byUrl.get(pb['url'], [])
+            else:
+                resp['annotations'] = []
+                for pb in rows:
+                    resp['annotations'].extend(byUrl.get(pb['url'], []))
 
 
         if self.returnResponse:
-            return Response(json.dumps(resp, sort_keys=True, indent=4, separators=(',', ': ')).encode('utf8'), status=status_code, mimetype=mime_type)
+            return Response(serializers.dumps(resp), status=status_code, mimetype=mime_type)
         else:
             return resp
 
     #
-    # Determine if method is defined in a subclass.
+    # Return annotations whose body is one of the given URLs, grouped by URL. URLs are looked up in
+    # batches of annotation_batch_size.
     #
-    def isMethod(self, obj, name):
-        return hasattr(obj, name) and inspect.ismethod(getattr(obj, name))
+    def annotationsByUrl(self, urls):
+        batchSize = self.config.get('annotation_batch_size', 500)
+        urls = list(collections.OrderedDict.fromkeys(urls))
+
+        byUrl = {}
+        for i in xrange(0, len(urls), batchSize):
+            for anno in self.annotations.find({"hasBody.@id": {"$in": urls[i:i + batchSize]}}, {"_id": False, "annotatedAtDate": False}):
+                byUrl.setdefault(anno['hasBody']['@id'], []).append(anno)
+        return byUrl
 
     #
-    #
+    # Return new instance of an endpoint, by name, or None if there is no such endpoint
     #
     def loadEndpoint(self, endpoint):
-        try:
-            module = importlib.import_module("." + endpoint, "epandda")
-            for x in dir(module):
-                obj = getattr(module, x)
+        return registry.create(endpoint)
 
-                if inspect.isclass(obj) and issubclass(obj, Resource) and obj is not Resource and self.isMethod(obj, "process"):
-                    return obj()
-            return None
-        except ImportError as e:
-            return None
+    #
+    # Respond with the current page of a MatchSet. If more results follow the page, the full
+    # match set is saved and a continuation token for the next page is returned as "next".
+    #
+    # return_object holds any other response fields (criteria, media, Etc.)
+    #
+    # In matches-only mode the unresolved MatchSet is returned, with criteria and record types.
+    #
+    def respondWithMatches(self, matches, return_object, pbdb_type='occs', show_type='full'):
+        if self.matchesOnly:
+            return {'matches': matches, 'counts': matches.counts(), 'criteria': return_object.get('criteria', {}), 'pbdb_type': pbdb_type, 'show_type': show_type}
+
+        if self.isStreaming():
+            return self.respondWithStream(lambda source, offset, limit: matches.get(source)[offset:offset + limit], matches.counts(), pbdb_type, show_type)
+
+        return_object['results'] = self.resolveReferences([{'matches': matches.toMatches()}], pbdb_type, show_type)
+        return_object['counts'] = matches.counts()
+
+        offset = self.offset()
+        limit = self.limit()
+        if limit > 0 and offset + limit < max(matches.count('idigbio'), matches.count('pbdb')):
+            meta = {
+                'endpoint': self.__class__.__name__,
+                'counts': return_object['counts'],
+                'criteria': return_object.get('criteria', {}),
+                'includeAnnotations': return_object.get('includeAnnotations', False),
+                'pbdb_type': pbdb_type,
+                'show_type': show_type
+            }
+            store = resultsets.getStore()
+            self.resultSetExpires = int(time.time()) + store.ttl
+            setId = store.save(matches, meta)
+            return_object['next'] = resultsets.makeToken(setId, offset + limit, limit)
+
+        return self.respond(return_object)
+
+    #
+    # Return continuation token passed with request, if any
+    #
+    def getCursor(self):
+        if self.params is None or self.paramCount == 0:
+            self.getParams()
+        return self.params.get('cursor')
+
+    #
+    # Respond with a page of a saved match set, addressed by a continuation token
+    #
+    def respondWithCursor(self, token):
+        setId, offset, limit = resultsets.parseToken(token)
+
+        store = resultsets.getStore()
+        stored = store.load(setId)
+        if stored is None or stored['meta']['endpoint'] != self.__class__.__name__:
+            raise Exception({"GENERAL": "Cursor has expired or is not valid for this endpoint"})
+
+        meta = stored['meta']
+
+        if self.isStreaming():
+            self.params['offset'] = offset
+            return self.respondWithStream(lambda source, o, l: store.readWindow(stored, source, o, l), meta['counts'], meta['pbdb_type'], meta['show_type'])
+
+        self.params['offset'] = offset
+        self.params['limit'] = limit
+
+        return_object = {
+            'counts': meta['counts'],
+            'criteria': meta['criteria'],
+            'includeAnnotations': meta['includeAnnotations'],
+            'results': self.resolveIds(store.readWindow(stored, 'idigbio', offset, limit), store.readWindow(stored, 'pbdb', offset, limit), meta['pbdb_type'], meta['show_type'])
+        }
+
+        if offset + limit < max(meta['counts']['idbCount'], meta['counts']['pbdbCount']):
+            return_object['next'] = resultsets.makeToken(setId, offset + limit, limit)
+
+        return self.respond(return_object)
+
+    #
+    # Return true if the request asks for a streamed NDJSON export (format=ndjson&stream=true).
+    # Streaming only applies to top-level responses, not sub-queries run by /query.
+    #
+    def isStreaming(self):
+        return self.returnResponse and self.params.get('format') == 'ndjson' and self.params.get('stream') in ['true', '1']
+
+    #
+    # Stream every match from the requested offset as newline-delimited JSON, one resolved record per
+    # line, tagged with its source. Ids are read with window(source, offset, limit) and records resolved
+    # in batches of stream_batch_size, honoring the usual field selection, so memory use doesn't grow
+    # with the size of the export. The limit parameter is ignored.
+    #
+    def respondWithStream(self, window, counts, pbdb_type='occs', show_type='full'):
+        batchSize = self.config.get('stream_batch_size', 1000)
+        start = self.offset()
+        totals = {'idigbio': counts['idbCount'], 'pbdb': counts['pbdbCount']}
+
+        def generate():
+            for source in ['idigbio', 'pbdb']:
+                for offset in xrange(start, totals[source], batchSize):
+                    ids = window(source, offset, batchSize)
+                    if source == 'idigbio':
+                        rows = self.resolveIds(ids, [], pbdb_type, show_type)['idigbio_resolved']
+                    else:
+                        rows = self.resolveIds([], ids, pbdb_type, show_type)['pbdb_resolved']
+
+                    lines = []
+                    for row in rows:
+                        row['source'] = source
+                        lines.append(serializers.dumps(row, True) + "\n")
+                    if lines:
+                        yield "".join(lines)
+
+        return Response(stream_with_context(generate()), status=200, mimetype="application/x-ndjson")
 
     #
     # Respond with description of endpoint. Used when user hits an endpoint with no parameters.
@@ -494,7 +751,10 @@ class baseResource(Resource):
     def respondWithDescription(self):
 
         if self.returnResponse:
-            return Response(json.dumps(self.description(), sort_keys=True, indent=4, separators=(',', ': ')).encode('utf8'), status=200, mimetype="text/json")
+            rendered = registry.renderedDescription(self.__class__.__name__)
+            if rendered is None:
+                rendered = registry.renderPayload(self.description())
+            return self.respondWithRendered(rendered, "text/json")
         else:
             return self.description()
 
@@ -519,6 +779,8 @@ class baseResource(Resource):
                 errors_filtered[i] = "Unknown error: " + errors
 
         if self.returnResponse:
-            return Response(json.dumps({"errors": errors_filtered}, sort_keys=True, indent=4, separators=(',', ': ')).encode('utf8'), status=500, mimetype="text/json")
+            resp = Response(serializers.dumps({"errors": errors_filtered}), status=500, mimetype="text/json")
+            resp.headers['Cache-Control'] = self.cacheControl('error')
+            return resp
         else:
             return {"errors": errors_filtered}
@@ -5,8 +5,6 @@ import smtplib
 from email.mime.text import MIMEText
 import json
 
-config = json.load(open('./config.json'))
-
 class bugReport(baseResource):
 	def process(self):
 	
@@ -21,8 +19,8 @@ class bugReport(baseResource):
 		email['From'] = sender
 		email['To'] = 'michael@whirl-i-gig.com'
 		#return {'email': sender, 'msg': message, 'subject': subject}
-		s = smtplib.SMTP(config['smtp_server'], config['smtp_port'])
-		s.login(config['smtp_user'], config['smtp_pswd'])
+		s = smtplib.SMTP(self.config['smtp_server'], self.config['smtp_port'])
+		s.login(self.config['smtp_user'], self.config['smtp_pswd'])
 		s.sendmail(sender, 'michael@whirl-i-gig.com', email.as_string())
 		s.quit()
 		return {'status': 'SENT'}
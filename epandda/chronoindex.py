@@ -0,0 +1,114 @@
+import bisect
+import threading
+import connection
+import indexversion
+
+#
+# In-memory interval index over chronoStratIndex
+#
+# Stratigraphy searches ask for index documents whose unit lies within a Ma range, ie. earlyBound <= start
+# and lateBound >= end. MongoDB can only use an index for one side of that predicate, so the documents'
+# bounds, level names and match file refs are held in memory instead, in two lists sorted by earlyBound
+# and by lateBound. A search bisects both lists for documents with a bound inside the range, checks the
+# other bound of the shorter run, and returns documents in collection order, as the MongoDB query did.
+#
+# The index is loaded once per process and re-read when the index version changes. Setting
+# chrono_interval_index to false queries MongoDB instead.
+#
+
+LEVELS = ['lowStage', 'highStage', 'lowSeries', 'highSeries', 'lowSystem', 'highSystem', 'lowErathem', 'highErathem', 'upperChronostratigraphy', 'lowerChronostratigraphy']
+
+# fields kept for each document; everything the endpoint reads from a match
+FIELDS = ['_id', 'earlyBound', 'lateBound', 'pbdbGridFile', 'idbGridFile'] + LEVELS
+
+def isBound(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+class ChronoIntervalIndex(object):
+    #
+    # docs are chronoStratIndex documents, in collection order. Documents without numeric bounds can
+    # never match a range query and are left out.
+    #
+    def __init__(self, docs):
+        self.docs = [d for d in docs if isBound(d.get('earlyBound')) and isBound(d.get('lateBound'))]
+
+        # units with bounds the wrong way round don't fit the windowed search and are always checked
+        self.reversed = [i for i, d in enumerate(self.docs) if d['lateBound'] > d['earlyBound']]
+        ordered = [i for i, d in enumerate(self.docs) if d['lateBound'] <= d['earlyBound']]
+
+        byEarly = sorted(ordered, key=lambda i: self.docs[i]['earlyBound'])
+        self.earlyKeys = [self.docs[i]['earlyBound'] for i in byEarly]
+        self.earlyPos = byEarly
+
+        byLate = sorted(ordered, key=lambda i: self.docs[i]['lateBound'])
+        self.lateKeys = [self.docs[i]['lateBound'] for i in byLate]
+        self.latePos = byLate
+
+    def __len__(self):
+        return len(self.docs)
+
+    #
+    # Return positions of documents with earlyBound <= start and lateBound >= end. A unit's lateBound is
+    # never older than its earlyBound, so both bounds of a match lie in [end, start]: only the documents
+    # with one bound in that window are candidates.
+    #
+    def positions(self, start, end):
+        found = [i for i in self.reversed if self.docs[i]['earlyBound'] <= start and self.docs[i]['lateBound'] >= end]
+        if start < end:
+            return found
+        earlyLo = bisect.bisect_left(self.earlyKeys, end)
+        earlyHi = bisect.bisect_right(self.earlyKeys, start)
+        lateLo = bisect.bisect_left(self.lateKeys, end)
+        lateHi = bisect.bisect_right(self.lateKeys, start)
+
+        if earlyHi - earlyLo <= lateHi - lateLo:
+            return found + [i for i in self.earlyPos[earlyLo:earlyHi] if self.docs[i]['lateBound'] >= end]
+        return found + [i for i in self.latePos[lateLo:lateHi] if self.docs[i]['earlyBound'] <= start]
+
+    #
+    # Return documents within any of a list of (start, end) ranges, in collection order
+    #
+    def search(self, ranges):
+        found = set()
+        for start, end in ranges:
+            found.update(self.positions(start, end))
+        return [self.docs[i] for i in sorted(found)]
+
+def load(client=None):
+    if client is None:
+        client = connection.getClient()
+    projection = dict((f, True) for f in FIELDS)
+    return ChronoIntervalIndex(client.endpoints.chronoStratIndex.find({}, projection))
+
+_index = None
+_lock = threading.Lock()
+
+def _reset(version):
+    global _index
+    _index = None
+
+indexversion.onChange(_reset)
+
+#
+# Return interval index for this process, loading it on first use
+#
+def getIndex():
+    global _index
+    indexversion.currentVersion()
+    index = _index
+    if index is None:
+        with _lock:
+            if _index is None:
+                _index = load()
+            index = _index
+    return index
+
+#
+# Return chronoStratIndex documents within any of a list of (start, end) Ma ranges
+#
+def search(collection, ranges):
+    if len(ranges) == 0:
+        return []
+    if not connection.getConfig().get('chrono_interval_index', True):
+        return list(collection.find({'$or': [{'earlyBound': {'$lte': start}, 'lateBound': {'$gte': end}} for start, end in ranges]}))
+    return getIndex().search(ranges)
@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import threading
+from pymongo.errors import PyMongoError
+import connection
+import fuzzymatch
+import indexversion
+
+#
+# In-process chronostratigraphic name resolver
+#
+# Turns chronostratigraphic names (stages, series, systems, erathems) into their start_ma/end_ma bounds
+# with fuzzy matching, so the stratigraphy endpoint needs no remote lookups.
+#
+# The name table is read once per process from endpoints.chronostratLookup (documents with name,
+# start_ma and end_ma fields) or, if that collection is empty or unavailable, from the ICS table bundled
+# in data/ics_chronostrat.json. The chronostrat_source config setting selects the table:
+#
+#   "auto" (default)    endpoints.chronostratLookup, falling back to the bundled table
+#   "mongo"             endpoints.chronostratLookup only
+#   "file"              bundled table only
+#
+# The table is re-read when the index version changes.
+#
+# Names are normalized before matching: lower-cased, "early"/"late" read as "lower"/"upper", and trailing
+# rank words ("stage", "epoch", Etc.) dropped, then matched with fuzzymatch.
+#
+
+BUNDLED_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ics_chronostrat.json')
+
+SYNONYMS = {'early': 'lower', 'late': 'upper', 'mid': 'middle'}
+RANK_WORDS = set(['stage', 'age', 'series', 'epoch', 'subsystem', 'subperiod', 'system', 'period', 'erathem', 'era', 'eonothem', 'eon'])
+
+#
+# Return normalized form of a chronostratigraphic name
+#
+def normalize(name):
+    words = [SYNONYMS.get(w, w) for w in re.split(r'[^\w]+', name.lower(), flags=re.UNICODE) if w != '']
+    while len(words) > 1 and words[-1] in RANK_WORDS:
+        words.pop()
+    return ' '.join(words)
+
+class ChronostratResolver(object):
+    #
+    # entries is a list of dicts with name, start_ma and end_ma
+    #
+    def __init__(self, entries, source=None):
+        self.source = source
+        self.names = {}
+        for entry in entries:
+            key = normalize(entry['name'])
+            if key != '' and key not in self.names:
+                self.names[key] = {'name': entry['name'], 'start_ma': float(entry['start_ma']), 'end_ma': float(entry['end_ma'])}
+        self.index = fuzzymatch.FuzzyIndex(self.names.keys())
+
+    def __len__(self):
+        return len(self.names)
+
+    #
+    # Return best matching entry for a name, or None if nothing is close enough
+    #
+    def resolve(self, name):
+        key = self.index.best(normalize(name))
+        return self.names[key] if key is not None else None
+
+    #
+    # Resolve a name or "early-late" range to (start_ma, end_ma). Raises an exception naming the param
+    # if either end can't be resolved.
+    #
+    def resolveRange(self, param, early, late):
+        start = self.resolve(early)
+        if start is None:
+            raise Exception({param: "Unknown chronostratigraphic name '" + early + "'"})
+        end = self.resolve(late) if late != early else start
+        if end is None:
+            raise Exception({param: "Unknown chronostratigraphic name '" + late + "'"})
+        return start['start_ma'], end['end_ma']
+
+def loadBundled():
+    with open(BUNDLED_TABLE) as f:
+        return json.load(f)
+
+def loadLookup(client=None):
+    if client is None:
+        client = connection.getClient()
+    return list(client.endpoints.chronostratLookup.find({}, {'_id': False, 'name': True, 'start_ma': True, 'end_ma': True}))
+
+#
+# Build a resolver from the configured name table
+#
+def load():
+    source = connection.getConfig().get('chronostrat_source', 'auto')
+    if source != 'file':
+        try:
+            entries = [e for e in loadLookup() if 'name' in e and 'start_ma' in e and 'end_ma' in e]
+            if len(entries) > 0 or source == 'mongo':
+                return ChronostratResolver(entries, 'mongo')
+        except PyMongoError as e:
+            if source == 'mongo':
+                raise
+            print "Could not load endpoints.chronostratLookup, using bundled table: " + str(e)
+    return ChronostratResolver(loadBundled(), 'file')
+
+_resolver = None
+_lock = threading.Lock()
+
+def _reset(version):
+    global _resolver
+    _resolver = None
+
+indexversion.onChange(_reset)
+
+#
+# Return resolver for this process, loading the name table on first use
+#
+def getResolver():
+    global _resolver
+    indexversion.currentVersion()
+    resolver = _resolver
+    if resolver is None:
+        with _lock:
+            if _resolver is None:
+                _resolver = load()
+            resolver = _resolver
+    return resolver
@@ -0,0 +1,60 @@
+import re
+import gridfs
+import chronoindex
+import chronostrat
+import gridloader
+import termresolver
+
+#
+# Chronostratigraphic term resolution, against endpoints.chronoStratIndex
+#
+# Names ("maastrichtian", "campanian to maastrichtian") are resolved to Ma bounds with chronostrat and
+# matched to the index units within those bounds, so the canonical form of a name is its bounds: any two
+# names for the same span share a cached resolution. Full text terms search the whole hierarchy, as
+# /occurrences chronostratigraphy and /stratigraphy chronostratigraphy both do.
+#
+
+# fields the endpoints read from matched documents
+FIELDS = ['_id'] + chronoindex.LEVELS
+
+RANGE_SEPARATOR = re.compile(r'\s*(?:-|\bto\b)\s*', re.UNICODE)
+NAME_PATTERN = re.compile(r'^[\w\s]*$', re.UNICODE)
+
+#
+# Split a name or "early-late" / "early to late" range into (early, late) names, or return None if the
+# value isn't one. A single name is returned as both.
+#
+def splitRange(value):
+    parts = RANGE_SEPARATOR.split(value.strip())
+    if len(parts) > 2 or parts[0] == '' or not all(NAME_PATTERN.match(p) for p in parts):
+        return None
+    early = parts[0]
+    late = parts[1] if len(parts) > 1 and parts[1] != '' else early
+    return early, late
+
+#
+# Return (start_ma, end_ma) for a name or range. param names the request parameter in errors.
+#
+def bounds(param, value):
+    names = splitRange(value)
+    if names is None:
+        raise Exception({param: "Invalid chronostratigraphic range '" + value + "'"})
+    return chronostrat.getResolver().resolveRange(param, names[0], names[1])
+
+#
+# Resolve index units lying within a chronostratigraphic name or range
+#
+def byName(client, param, value):
+    start, end = bounds(param, value)
+
+    def compute():
+        docs = chronoindex.search(client.endpoints.chronoStratIndex, [(start, end)])
+        return gridloader.loadDocMatches(gridfs.GridFS(client.endpoints), docs), termresolver.project(docs, FIELDS)
+
+    return termresolver.resolve(('chrono', 'bounds', start, end), compute)
+
+#
+# Resolve a phrase searched across the chronostratigraphic hierarchy
+#
+def search(client, text):
+    return termresolver.searchIndex(client, 'chrono', 'chronoStratIndex', FIELDS, [], text)
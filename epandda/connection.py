@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+from pymongo import MongoClient, monitoring
+
+#
+# Process-wide API config and MongoDB client
+#
+# The config file is read once and a single MongoClient (with its connection pool) is shared by every
+# resource in the process. The client is created lazily on first use and re-created in a child process
+# after a fork, as pymongo clients must not be shared across fork.
+#
+
+CONFIG_PATH = './config.json'
+
+_config = None
+_client = None
+_clientPid = None
+_reloadCallbacks = []
+_lock = threading.RLock()
+_lockPid = os.getpid()
+
+#
+# Connection pool event counters, reported through poolStats()
+#
+class PoolListener(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {
+            "poolsCreated": 0,
+            "poolsCleared": 0,
+            "connectionsCreated": 0,
+            "connectionsClosed": 0,
+            "checkOutStarted": 0,
+            "checkOutFailed": 0,
+            "checkedOut": 0,
+            "checkedIn": 0
+        }
+
+    def incr(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def pool_created(self, event):
+        self.incr("poolsCreated")
+
+    def pool_cleared(self, event):
+        self.incr("poolsCleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.incr("connectionsCreated")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.incr("connectionsClosed")
+
+    def connection_check_out_started(self, event):
+        self.incr("checkOutStarted")
+
+    def connection_check_out_failed(self, event):
+        self.incr("checkOutFailed")
+
+    def connection_checked_out(self, event):
+        self.incr("checkedOut")
+
+    def connection_checked_in(self, event):
+        self.incr("checkedIn")
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts["open"] = counts["connectionsCreated"] - counts["connectionsClosed"]
+        counts["inUse"] = counts["checkedOut"] - counts["checkedIn"]
+        return counts
+
+_listener = PoolListener()
+
+#
+# Return lock guarding client creation. A lock inherited across fork may be held by a thread
+# that does not exist in the child, so the child gets a fresh one.
+#
+def _getLock():
+    global _lock, _lockPid
+    if _lockPid != os.getpid():
+        _lock = threading.RLock()
+        _lockPid = os.getpid()
+    return _lock
+
+#
+# Return API config, loading it from disk on first use
+#
+def getConfig():
+    global _config
+    if _config is None:
+        with _getLock():
+            if _config is None:
+                _config = json.load(open(CONFIG_PATH))
+    return _config
+
+#
+# Register callback to run (with the new config) after the config file is re-read
+#
+def onReload(callback):
+    with _getLock():
+        _reloadCallbacks.append(callback)
+
+#
+# Re-read the config file. The MongoClient is rebuilt on next use so new pool settings take effect.
+#
+def reloadConfig():
+    global _config
+    with _getLock():
+        _config = json.load(open(CONFIG_PATH))
+        callbacks = _reloadCallbacks[:]
+    resetClient()
+    for callback in callbacks:
+        callback(_config)
+    return _config
+
+#
+# MongoClient options derived from config. Unset values fall back to pymongo defaults.
+#
+def clientOptions(config=None):
+    if config is None:
+        config = getConfig()
+
+    settings = {
+        "maxPoolSize": "mongodb_pool_size",
+        "minPoolSize": "mongodb_min_pool_size",
+        "maxIdleTimeMS": "mongodb_max_idle_time_ms",
+        "waitQueueTimeoutMS": "mongodb_wait_queue_timeout_ms",
+        "connectTimeoutMS": "mongodb_connect_timeout_ms",
+        "socketTimeoutMS": "mongodb_socket_timeout_ms",
+        "serverSelectionTimeoutMS": "mongodb_server_selection_timeout_ms",
+        "readPreference": "mongodb_read_preference"
+    }
+
+    options = {}
+    for option in settings:
+        if config.get(settings[option]) is not None:
+            options[option] = config[settings[option]]
+    return options
+
+#
+# Return MongoDB connection URI for config
+#
+def mongoUri(config=None):
+    if config is None:
+        config = getConfig()
+
+    if config.get('mongodb_user'):
+        return "mongodb://" + config['mongodb_user'] + ":" + config['mongodb_password'] + "@" + config['mongodb_host']
+    return "mongodb://" + config['mongodb_host']
+
+#
+# Return the shared MongoClient, creating it on first use in this process
+#
+def getClient():
+    global _client, _clientPid, _listener
+    pid = os.getpid()
+    if _client is None or _clientPid != pid:
+        with _getLock():
+            if _client is None or _clientPid != pid:
+                # A client inherited from the parent process is abandoned rather than closed;
+                # its sockets still belong to the parent.
+                if _clientPid is not None and _clientPid != pid:
+                    _listener = PoolListener()
+                _client = MongoClient(mongoUri(), event_listeners=[_listener], **clientOptions())
+                _clientPid = pid
+    return _client
+
+#
+# Close the shared client. The next call to getClient() creates a new one.
+#
+def resetClient():
+    global _client, _clientPid
+    with _getLock():
+        if _client is not None and _clientPid == os.getpid():
+            _client.close()
+        _client = None
+        _clientPid = None
+
+#
+# Connection pool statistics for sizing the pool
+#
+def poolStats():
+    stats = _listener.snapshot()
+    stats["options"] = clientOptions() if _config is not None else {}
+    stats["pid"] = os.getpid()
+    stats["connected"] = _client is not None and _clientPid == os.getpid()
+    return stats
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ElasticsearchException
+import connection
+from matchcache import ByteLRUCache
+
+#
+# Shared Elasticsearch name lookups
+#
+# Fuzzy name lookups go through a single Elasticsearch client per process, with a timeout on every call
+# (elasticsearch_timeout_seconds) and no retries, so a slow host can't hold request threads for long.
+#
+# Results are cached per (index, query, rank) for es_cache_ttl_seconds, and lookups that found nothing
+# for es_negative_ttl_seconds, in an LRU of at most es_cache_entries entries.
+#
+# A circuit breaker opens after es_breaker_failures consecutive failed calls. While it is open lookups
+# don't call Elasticsearch at all: they are answered by the caller's local fallback if it has one, or
+# fail straight away. After es_breaker_reset_seconds a single trial call is let through, and the breaker
+# closes again if it succeeds. Expired cache entries are used in preference to the fallback.
+#
+
+DEFAULT_HOSTS = ['http://whirl.mine.nu:9200']
+DEFAULT_TIMEOUT = 2
+DEFAULT_TTL = 600
+DEFAULT_NEGATIVE_TTL = 60
+DEFAULT_ENTRIES = 10000
+DEFAULT_FAILURES = 5
+DEFAULT_RESET = 30
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+#
+# Circuit breaker over calls to a remote service
+#
+class CircuitBreaker(object):
+    def __init__(self, maxFailures, resetSeconds):
+        self.maxFailures = maxFailures
+        self.resetSeconds = resetSeconds
+        self.state = CLOSED
+        self.failures = 0
+        self.openedAt = 0
+        self.lock = threading.Lock()
+        self.counts = {'opened': 0, 'rejected': 0}
+
+    #
+    # Return True if a call may be made. Once the reset interval has passed one trial call is allowed.
+    #
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.openedAt >= self.resetSeconds:
+                self.state = HALF_OPEN
+                return True
+            self.counts['rejected'] += 1
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.maxFailures:
+                if self.state != OPEN:
+                    self.counts['opened'] += 1
+                self.state = OPEN
+                self.openedAt = time.time()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['state'] = self.state
+            stats['failures'] = self.failures
+        return stats
+
+#
+# Cached, breaker-protected lookups against an Elasticsearch host. The client is created on first use.
+#
+class LookupClient(object):
+    def __init__(self, hosts, timeout, ttl, negativeTtl, maxEntries, breaker, client=None):
+        self.hosts = hosts
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.cache = ByteLRUCache(maxEntries)
+        self.breaker = breaker
+        self.client = client
+        self.lock = threading.Lock()
+        self.counts = {'searches': 0, 'cacheHits': 0, 'negativeHits': 0, 'staleHits': 0, 'errors': 0, 'fallbacks': 0}
+
+    def incr(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def es(self):
+        if self.client is None:
+            with self.lock:
+                if self.client is None:
+                    self.client = Elasticsearch(self.hosts, timeout=self.timeout, max_retries=0, retry_on_timeout=False)
+        return self.client
+
+    #
+    # Fuzzy match query on unit names, optionally limited to a level
+    #
+    def body(self, query, rank):
+        match = {"match": {"name": {"query": query, "fuzziness": "AUTO"}}}
+        if rank:
+            return {"query": {"bool": {"must": [match, {"term": {"level": rank}}]}}}
+        return {"query": match}
+
+    #
+    # Return hits ([{'_score', '_source'}]) for a name query. If Elasticsearch can't be used, fallback
+    # (called with query and rank) supplies the hits; without one an exception is raised.
+    #
+    def search(self, index, query, rank=None, fallback=None):
+        key = (index, query, rank)
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] >= time.time():
+            self.incr('cacheHits' if len(entry[1]) > 0 else 'negativeHits')
+            return entry[1]
+
+        if self.breaker.allow():
+            self.incr('searches')
+            try:
+                res = self.es().search(index=index, body=self.body(query, rank), request_timeout=self.timeout)
+            except ElasticsearchException as e:
+                self.breaker.failure()
+                self.incr('errors')
+                print "Elasticsearch lookup failed: " + str(e)
+            else:
+                self.breaker.success()
+                hits = [{'_score': h['_score'], '_source': h['_source']} for h in res['hits']['hits']]
+                self.cache.put(key, (time.time() + (self.ttl if len(hits) > 0 else self.negativeTtl), hits), 1)
+                return hits
+
+        # an expired result is better than none
+        if entry is not None:
+            self.incr('staleHits')
+            return entry[1]
+
+        if fallback is None:
+            raise Exception({"GENERAL": "Name lookup service is unavailable, try again later"})
+        self.incr('fallbacks')
+        return fallback(query, rank)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats['cache'] = self.cache.stats()
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+_lookup = None
+_lookupPid = None
+_lock = threading.Lock()
+
+#
+# Return the lookup client for this process, configured on first use
+#
+def getLookup():
+    global _lookup, _lookupPid
+    if _lookup is None or _lookupPid != os.getpid():
+        with _lock:
+            if _lookup is None or _lookupPid != os.getpid():
+                config = connection.getConfig()
+                breaker = CircuitBreaker(config.get('es_breaker_failures', DEFAULT_FAILURES), config.get('es_breaker_reset_seconds', DEFAULT_RESET))
+                _lookup = LookupClient(
+                    config.get('elasticsearch_hosts', DEFAULT_HOSTS),
+                    config.get('elasticsearch_timeout_seconds', DEFAULT_TIMEOUT),
+                    config.get('es_cache_ttl_seconds', DEFAULT_TTL),
+                    config.get('es_negative_ttl_seconds', DEFAULT_NEGATIVE_TTL),
+                    config.get('es_cache_entries', DEFAULT_ENTRIES),
+                    breaker
+                )
+                _lookupPid = os.getpid()
+    return _lookup
+
+def search(index, query, rank=None, fallback=None):
+    return getLookup().search(index, query, rank, fallback)
+
+def stats():
+    return getLookup().stats()
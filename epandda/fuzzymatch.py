@@ -0,0 +1,92 @@
+import collections
+
+#
+# Fuzzy matching of search terms against in-memory name tables
+#
+# Candidates sharing trigrams with a term are ranked by similarity, and the closest are checked by edit
+# distance, allowing the same number of edits per word as Elasticsearch's AUTO fuzziness. Names and terms
+# are expected to be normalized by the caller.
+#
+
+# candidates by trigram similarity that are checked by edit distance
+MAX_CANDIDATES = 20
+
+def trigrams(text):
+    padded = '  ' + text + ' '
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+#
+# Levenshtein distance between two strings, giving up once it exceeds limit
+#
+def editDistance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = range(len(b) + 1)
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+#
+# Number of edits allowed when matching a name, per word as with Elasticsearch AUTO fuzziness
+#
+def allowedEdits(name):
+    edits = 0
+    for word in name.split(' '):
+        if len(word) > 5:
+            edits += 2
+        elif len(word) > 2:
+            edits += 1
+    return edits
+
+class FuzzyIndex(object):
+    def __init__(self, names):
+        self.names = set()
+        self.grams = collections.defaultdict(list)
+        for name in names:
+            if name == '' or name in self.names:
+                continue
+            self.names.add(name)
+            for gram in trigrams(name):
+                self.grams[gram].append(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    #
+    # Return (distance, name) for names within the allowed edits of term, closest first, ties in name order
+    #
+    def matches(self, term):
+        if term == '':
+            return []
+        if term in self.names:
+            return [(0, term)]
+
+        termGrams = trigrams(term)
+        shared = collections.Counter()
+        for gram in termGrams:
+            for candidate in self.grams.get(gram, []):
+                shared[candidate] += 1
+
+        def similarity(candidate):
+            common = shared[candidate]
+            return float(common) / (len(termGrams) + len(trigrams(candidate)) - common)
+
+        limit = allowedEdits(term)
+        found = []
+        for candidate in sorted(shared, key=lambda c: (-similarity(c), c))[:MAX_CANDIDATES]:
+            distance = editDistance(term, candidate, limit)
+            if distance <= limit:
+                found.append((distance, candidate))
+        return sorted(found)
+
+    #
+    # Return closest name to term, or None if nothing is close enough
+    #
+    def best(self, term):
+        found = self.matches(term)
+        return found[0][1] if len(found) > 0 else None
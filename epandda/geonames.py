@@ -1,7 +1,8 @@
 from mongo import mongoBasedResource
 from flask_restful import reqparse
-import gridfs
 import json
+import localityterms
+from matchset import MatchSet
 from bson import ObjectId
 from bson import Decimal128
 
@@ -13,16 +14,12 @@ parser.add_argument('locality', type=str, help='Locality name to to search geona
 #
 #
 class geonames(mongoBasedResource):
-	def process(self):
-		# Mongodb index for localities
-		lindex = self.client.endpoints.localityIndex
+	cacheResponses = True
 
+	def process(self):
 		# Mongodb index for geoPoints
 		pindex = self.client.endpoints.geoPointIndex
 
-		# Mongodb gridFS instance
-		grid = gridfs.GridFS(self.client.endpoints)
-
 		# returns dictionary of params as defined in endpoint description
 		# will throw exception if required param is not present
 		params = self.getParams()
@@ -37,16 +34,17 @@ class geonames(mongoBasedResource):
 
 		if self.paramCount > 0:
 			criteria = {'endpoint': 'geoname', 'parameters': {}, 'matchPoints': [], 'matchTerms': {'stateProvinceNames': [], 'countryNames': [], 'countyNames': [], 'localityNames': [], 'originalStates': [], 'originalCountries': [], 'originalCounties': [], 'originalLocalities': []}}
-			geoQuery = []
+			geoFields = []
+			geoText = None
 
 			for p in ['countryName', 'countryCode', 'locality', 'stateProvinceName', 'stateProvinceCode', 'county']:
 				if (params[p]):
 					criteria['parameters'][p] = params[p]
-					geoQuery.append({p: params[p]})
+					geoFields.append((p, params[p]))
 
 			if(params['geolocation']):
 				criteria['parameters']['geolocation'] = params['geolocation']
-				geoQuery.append({'$text': {'$search': '"' + params['geolocation'] + '"', '$caseSensitive': False}})
+				geoText = params['geolocation']
 
 			latLngQuery = []
 			if params['geoPoint']:
@@ -86,13 +84,10 @@ class geonames(mongoBasedResource):
 				except Exception as e:
 					return self.respondWithError({"GENERAL": "Invalid coordinates"})
 				polygonQuery = {'coordinates': {'$geoWithin': {'$geometry': {'type': "Polygon", 'coordinates': [polygon]}}}}
-			if (len(geoQuery) == 0 and 'geoPoint' not in params):
+			if (len(geoFields) == 0 and geoText is None and 'geoPoint' not in params):
 				return self.respondWithError({"GENERAL": "No parameters specified"})
 
-			if len(geoQuery) > 0:
-				res = lindex.find({'$and': geoQuery})
-			else:
-				res = None
+			resolution = localityterms.search(self.client, geoFields, geoText)
 			if params['geoPoint']:
 				geoRes = pindex.find(latLngQuery)
 			else:
@@ -100,13 +95,9 @@ class geonames(mongoBasedResource):
 					geoRes = pindex.find(polygonQuery)
 				else:
 					geoRes = None
-			d = []
-			geoMatches = {'idigbio': [], 'pbdb': []}
-			matches = {'idigbio': [], 'pbdb': []}
-			idbCount = 0
-			pbdbCount = 0
-			if res:
-				for i in res:
+			geoMatches = MatchSet()
+			if resolution.docs:
+				for i in resolution.docs:
 					if 'countryName' in i and i['countryName'] not in criteria['matchTerms']['countryNames']:
 						criteria['matchTerms']['countryNames'].append(i['countryName'])
 					if 'stateProvinceName' in i and i['stateProvinceName'] not in criteria['matchTerms']['stateProvinceNames']:
@@ -133,29 +124,7 @@ class geonames(mongoBasedResource):
 						for origLocality in i['original_locality']:
 							if origCounty not in criteria['matchTerms']['originalLocalities']:
 								criteria['matchTerms']['originalLocalities'].append(origLocality)
-					if 'pbdbGridFile' in i:
-						if type(i['pbdbGridFile']) is list:
-							pbdbGrids = i['pbdbGridFile']
-							for file in pbdbGrids:
-								pbdb_doc = grid.get(file)
-								pbdb_matches = json.loads(pbdb_doc.read())
-								matches['pbdb'] = matches['pbdb'] + pbdb_matches
-						else:
-							idb_doc = grid.get(i['idbGridFile'])
-							idb_matches = json.loads(idb_doc.read())
-							matches['idigbio'] = matches['idigbio'] + idb_matches
-
-					if 'idbGridFile' in i:
-						if type(i['idbGridFile']) is list:
-							idbGrids = i['idbGridFile']
-							for file in idbGrids:
-								idb_doc = grid.get(file)
-								idb_matches = json.loads(idb_doc.read())
-								matches['idigbio'] = matches['idigbio'] + idb_matches
-						else:
-							idb_doc = grid.get(i['idbGridFile'])
-							idb_matches = json.loads(idb_doc.read())
-							matches['idigbio'] = matches['idigbio'] + idb_matches
+			matches = resolution.matches
 
 			if geoRes:
 				for r in geoRes:
@@ -163,32 +132,14 @@ class geonames(mongoBasedResource):
 					dec_lng_lat = [str(lng_lat[0]), str(lng_lat[1])]
 					criteria['matchPoints'].append(dec_lng_lat)
 					if 'idb_data' in r:
-						for spec in r['idb_data'][0]:
-							geoMatches['idigbio'].append(spec)
+						geoMatches.add('idigbio', r['idb_data'][0])
 					if 'pbdb_data' in r:
-						for spec in r['pbdb_data'][0]:
-							geoMatches['pbdb'].append(spec)
-
-			finalMatches = {'idigbio': [], 'pbdb': []}
-			if len(geoMatches['idigbio']) > 0 and len(matches['idigbio']) > 0:
-				finalMatches['idigbio'] = set(matches['idigbio']) & set(geoMatches['idigbio'])
-			else:
-				finalMatches['idigbio'] = geoMatches['idigbio'] + matches['idigbio']
-			idbCount = len(finalMatches['idigbio'])
-			if len(geoMatches['pbdb']) > 0 and len(matches['pbdb']) > 0:
-				finalMatches['pbdb'] = set(matches['pbdb']) & set(geoMatches['pbdb'])
-			else:
-				finalMatches['pbdb'] = geoMatches['pbdb'] + matches['pbdb']
-			pbdbCount = len(finalMatches['pbdb'])
-			resolveSet = {'idigbio': finalMatches['idigbio'][offset:limit], 'pbdb':  finalMatches['pbdb'][offset:limit]}
-			item = {'matches': finalMatches}
-			d.append(item)
-			d = self.resolveReferences(d)
-
-			counts = {'totalCount': idbCount + pbdbCount, 'idbCount': idbCount, 'pbdbCount': pbdbCount}
+						geoMatches.add('pbdb', r['pbdb_data'][0])
 
+			# name and point matches are intersected when both found something for a source
+			finalMatches = MatchSet.intersection([matches, geoMatches])
 
-			return self.respond({'counts': counts, 'results': d, 'criteria': criteria})
+			return self.respondWithMatches(finalMatches, {'criteria': criteria})
 		else:
 			return self.respondWithDescription()
 
@@ -0,0 +1,90 @@
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+import connection
+import matchcache
+from matchset import MatchSet
+
+#
+# Concurrent loading of GridFS match lists referenced by index documents
+#
+# Index documents for large higher taxa or localities reference dozens of match files in their
+# pbdbGridFile/idbGridFile fields. These are fetched concurrently on a thread pool shared by the process
+# (grid_fetch_threads), with no more than grid_fetch_concurrency fetches in flight for any one request.
+# Results are always returned in the order the files are referenced.
+#
+
+DEFAULT_THREADS = 16
+DEFAULT_CONCURRENCY = 4
+
+_pool = None
+_poolPid = None
+_lock = threading.Lock()
+
+#
+# Return the shared fetch pool, creating it on first use in this process
+#
+def getPool():
+    global _pool, _poolPid
+    if _pool is None or _poolPid != os.getpid():
+        with _lock:
+            if _pool is None or _poolPid != os.getpid():
+                _pool = ThreadPool(connection.getConfig().get('grid_fetch_threads', DEFAULT_THREADS))
+                _poolPid = os.getpid()
+    return _pool
+
+#
+# Return file ids referenced by a field of an index document, which may hold a single id or a list
+#
+def fileRefs(doc, field):
+    if doc.get(field) is None:
+        return []
+    if type(doc[field]) is list:
+        return doc[field]
+    return [doc[field]]
+
+#
+# Load match lists for a list of GridFS file ids, returning them in the same order
+#
+def loadAll(grid, fileIds, maxConcurrent=None):
+    if maxConcurrent is None:
+        maxConcurrent = connection.getConfig().get('grid_fetch_concurrency', DEFAULT_CONCURRENCY)
+
+    if len(fileIds) < 2 or maxConcurrent < 2:
+        return [matchcache.loadMatches(grid, fileId) for fileId in fileIds]
+
+    slots = threading.BoundedSemaphore(maxConcurrent)
+
+    def load(fileId):
+        try:
+            return matchcache.loadMatches(grid, fileId)
+        finally:
+            slots.release()
+
+    pool = getPool()
+    pending = []
+    for fileId in fileIds:
+        slots.acquire()
+        pending.append(pool.apply_async(load, (fileId,)))
+
+    return [p.get() for p in pending]
+
+#
+# Load the iDigBio and PBDB matches referenced by a list of index documents into a MatchSet.
+# Ids are added in document order, then file order within each document.
+#
+def loadDocMatches(grid, docs, maxConcurrent=None):
+    pbdbFiles = []
+    idbFiles = []
+    for doc in docs:
+        pbdbFiles.extend(fileRefs(doc, 'pbdbGridFile'))
+        idbFiles.extend(fileRefs(doc, 'idbGridFile'))
+
+    lists = loadAll(grid, pbdbFiles + idbFiles, maxConcurrent)
+
+    matches = MatchSet()
+    for ids in lists[:len(pbdbFiles)]:
+        matches.add('pbdb', ids)
+    for ids in lists[len(pbdbFiles):]:
+        matches.add('idigbio', ids)
+    return matches
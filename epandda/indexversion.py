@@ -0,0 +1,79 @@
+import datetime
+import threading
+import time
+import uuid
+import connection
+
+#
+# Index version marker
+#
+# Index rebuild jobs bump a marker document in the endpoints database when they finish. API processes
+# poll the marker (at most once every index_version_check_seconds) and run registered callbacks when it
+# changes, so in-process caches derived from the indexes can be dropped.
+#
+
+MARKER_ID = 'indexVersion'
+
+_lock = threading.Lock()
+_version = None
+_updatedAt = None
+_checkedAt = 0
+_callbacks = []
+
+#
+# Collection holding the marker document
+#
+def markerCollection(client=None):
+    if client is None:
+        client = connection.getClient()
+    return client.endpoints.indexVersion
+
+#
+# Register callback to run (with the new version) when the index version changes
+#
+def onChange(callback):
+    with _lock:
+        _callbacks.append(callback)
+
+#
+# Return the current index version, re-reading the marker if the check interval has elapsed
+#
+def currentVersion():
+    global _version, _updatedAt, _checkedAt
+
+    interval = connection.getConfig().get('index_version_check_seconds', 30)
+    if time.time() - _checkedAt < interval:
+        return _version
+
+    with _lock:
+        if time.time() - _checkedAt < interval:
+            return _version
+
+        marker = markerCollection().find_one({'_id': MARKER_ID})
+        version = str(marker['version']) if marker is not None else None
+
+        changed = _checkedAt > 0 and version != _version
+        _version = version
+        _updatedAt = marker.get('updatedAt') if marker is not None else None
+        _checkedAt = time.time()
+        callbacks = _callbacks[:] if changed else []
+
+    for callback in callbacks:
+        callback(version)
+
+    return version
+
+#
+# Return the time the current index version was written, if known
+#
+def lastModified():
+    currentVersion()
+    return _updatedAt
+
+#
+# Write a new index version. Called by index rebuild jobs once new indexes are in place.
+#
+def bump(client=None):
+    version = uuid.uuid4().hex
+    markerCollection(client).update_one({'_id': MARKER_ID}, {'$set': {'version': version, 'updatedAt': datetime.datetime.utcnow()}}, upsert=True)
+    return version
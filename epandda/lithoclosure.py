@@ -0,0 +1,181 @@
+import collections
+import threading
+import connection
+import fuzzymatch
+import gridloader
+import indexversion
+from matchset import MatchSet
+
+#
+# Materialized lithostratigraphic hierarchy closure
+#
+# Each lithoStratIndex unit (group, formation, member or bed) gets a document in endpoints.lithoClosure
+# holding the unit and every unit below it, with the de-duplicated iDigBio and PBDB matches of all of
+# them merged in, so a search for a group is a single lookup rather than a lookup and merge of each of
+# its formations and members.
+#
+# The hierarchy is read from lithoStratIndex documents: child lists (child_formations, child_members,
+# Etc.) and parent names (group, formation, member) both add edges. Merged match lists longer than
+# CLOSURE_INLINE_LIMIT are stored as binary posting files in GridFS (referenced by idbGridFile and
+# pbdbGridFile, as in the other indexes) instead of in the document.
+#
+# The table is built by data_util/build_litho_closure.py.
+#
+# localHits() fuzzy matches unit names in process, against the names in lithoStratIndex, for use when the
+# Elasticsearch lookup is unavailable.
+#
+
+COLLECTION = 'lithoClosure'
+
+# ranks from highest to lowest
+RANKS = ['supergroup', 'group', 'formation', 'member', 'bed']
+
+CHILD_FIELDS = {'child_groups': 'group', 'child_formations': 'formation', 'child_members': 'member', 'child_beds': 'bed'}
+PARENT_FIELDS = ['supergroup', 'group', 'formation', 'member']
+
+CLOSURE_INLINE_LIMIT = 10000
+
+def normalize(name):
+    return ' '.join(unicode(name).lower().split())
+
+def nodeKey(name, rank):
+    return normalize(rank) + ':' + normalize(name)
+
+def rankOrder(rank):
+    rank = normalize(rank)
+    return RANKS.index(rank) if rank in RANKS else len(RANKS)
+
+def names(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [v for v in value if isinstance(v, basestring) and v.strip() != '']
+    return [value] if isinstance(value, basestring) and value.strip() != '' else []
+
+#
+# Build closure documents (without storage decisions) from lithoStratIndex documents. Returns a list of
+# dicts with _id, name, rank, normName, units ([{'unit', 'type'}] of the unit and its descendants, in
+# depth first order) and merged idb_matches and pbdb_matches.
+#
+def buildClosure(docs):
+    units = collections.OrderedDict()
+    for doc in docs:
+        if not names(doc.get('name')) or not names(doc.get('rank')):
+            continue
+        key = nodeKey(doc['name'], doc['rank'])
+        unit = units.get(key)
+        if unit is None:
+            unit = units[key] = {'name': doc['name'], 'rank': normalize(doc['rank']), 'matches': MatchSet(), 'children': set()}
+        unit['matches'].add('idigbio', doc.get('idb_matches') or [])
+        unit['matches'].add('pbdb', doc.get('pbdb_matches') or [])
+
+    def link(parent, child):
+        if parent in units and child in units and parent != child and rankOrder(units[parent]['rank']) < rankOrder(units[child]['rank']):
+            units[parent]['children'].add(child)
+
+    for doc in docs:
+        if not names(doc.get('name')) or not names(doc.get('rank')):
+            continue
+        key = nodeKey(doc['name'], doc['rank'])
+        for field, rank in CHILD_FIELDS.items():
+            for child in names(doc.get(field)):
+                link(key, nodeKey(child, rank))
+        for field in PARENT_FIELDS:
+            for parent in names(doc.get(field)):
+                link(nodeKey(parent, field), key)
+
+    def sortKey(key):
+        return (rankOrder(units[key]['rank']), key)
+
+    closure = []
+    for key, unit in units.items():
+        order = []
+        visited = set([key])
+        stack = [key]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            for child in sorted(units[current]['children'], key=sortKey, reverse=True):
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+
+        matches = MatchSet()
+        for k in order:
+            matches.update(units[k]['matches'])
+        closure.append({
+            '_id': key,
+            'name': unit['name'],
+            'rank': unit['rank'],
+            'normName': normalize(unit['name']),
+            'units': [{'unit': units[k]['name'], 'type': units[k]['rank']} for k in order],
+            'idb_matches': matches.get('idigbio'),
+            'pbdb_matches': matches.get('pbdb')
+        })
+    return closure
+
+#
+# Return closure documents for a list of (name, rank) units, in the same order. Units missing from the
+# table are left out.
+#
+def lookup(client, units):
+    keys = [nodeKey(name, rank) for name, rank in units]
+    docs = dict((d['_id'], d) for d in client.endpoints[COLLECTION].find({'_id': {'$in': keys}}))
+    return [docs[k] for k in keys if k in docs]
+
+#
+# Load merged matches of closure documents, inline or from GridFS, into a MatchSet
+#
+def loadMatches(grid, docs):
+    matches = MatchSet()
+    for doc in docs:
+        for source, field, fileField in [('idigbio', 'idb_matches', 'idbGridFile'), ('pbdb', 'pbdb_matches', 'pbdbGridFile')]:
+            if field in doc:
+                matches.add(source, doc[field])
+            else:
+                for ids in gridloader.loadAll(grid, gridloader.fileRefs(doc, fileField)):
+                    matches.add(source, ids)
+    return matches
+
+_names = None
+_namesLock = threading.Lock()
+
+def _reset(version):
+    global _names
+    _names = None
+
+indexversion.onChange(_reset)
+
+#
+# Return (fuzzy index, units by normalized name) of lithoStratIndex units, loading them on first use
+#
+def getNames():
+    global _names
+    indexversion.currentVersion()
+    loaded = _names
+    if loaded is None:
+        with _namesLock:
+            if _names is None:
+                units = collections.defaultdict(list)
+                projection = dict((f, True) for f in ['name', 'rank'] + CHILD_FIELDS.keys())
+                for doc in connection.getClient().endpoints.lithoStratIndex.find({}, projection):
+                    if names(doc.get('name')) and names(doc.get('rank')):
+                        source = dict((f, doc[f]) for f in CHILD_FIELDS if f in doc)
+                        source.update({'name': doc['name'], 'level': doc['rank']})
+                        units[normalize(doc['name'])].append(source)
+                _names = (fuzzymatch.FuzzyIndex(units.keys()), units)
+            loaded = _names
+    return loaded
+
+#
+# Return Elasticsearch-style hits for units matching a name, optionally limited to a rank. Closer matches
+# score higher.
+#
+def localHits(query, rank=None):
+    index, units = getNames()
+    hits = []
+    for distance, name in index.matches(normalize(query)):
+        for source in units[name]:
+            if not rank or normalize(source['level']) == normalize(rank):
+                hits.append({'_score': 1.0 / (1 + distance), '_source': source})
+    return hits
@@ -0,0 +1,59 @@
+import gridfs
+import eslookup
+import lithoclosure
+import termresolver
+
+#
+# Lithostratigraphic term resolution
+#
+# Unit names are fuzzy matched with Elasticsearch (or in process when it is unavailable), optionally
+# limited to a rank. Every unit tied for the best score is used, in name order, and expanded to the units
+# below it through the closure table. The resolution's docs are the matched units, as {'unit', 'type'}.
+#
+
+# ranks as stored in the Elasticsearch index's (unanalyzed) level field, by normalized name
+RANK_NAMES = dict((rank, rank.capitalize()) for rank in lithoclosure.RANKS)
+
+#
+# Return the canonical form of a rank (request parameters arrive lower-cased), or the rank as given if
+# it isn't a known one
+#
+def canonicalRank(rank):
+    if not rank:
+        return None
+    return RANK_NAMES.get(lithoclosure.normalize(rank), rank)
+
+def resolve(client, term, rank=None):
+    term = ' '.join(term.lower().split())
+    rank = canonicalRank(rank)
+
+    def compute():
+        hits = eslookup.search("litholookup", term, rank, lithoclosure.localHits)
+
+        best = max([hit['_score'] for hit in hits] or [0])
+        units = sorted([hit['_source'] for hit in hits if hit['_score'] == best], key=lambda u: (u['name'], u.get('level')))
+
+        closure = lithoclosure.lookup(client, [(u['name'], u.get('level', '')) for u in units])
+        matches = lithoclosure.loadMatches(gridfs.GridFS(client.endpoints), closure)
+        docs = []
+        for c in closure:
+            docs.extend(t for t in c['units'] if t not in docs)
+
+        # units not in the table (eg. if it hasn't been built) are expanded from their child lists
+        found = set(c['_id'] for c in closure)
+        names = []
+        for unit in units:
+            if lithoclosure.nodeKey(unit['name'], unit.get('level', '')) not in found:
+                names.append(unit['name'])
+                names.extend(unit.get('child_formations', []))
+                names.extend(unit.get('child_members', []))
+
+        if len(names) > 0:
+            for i in client.endpoints.lithoStratIndex.find({'name': {'$in': names}}):
+                docs.append({'unit': i['name'], 'type': i['rank']})
+                matches.add('pbdb', i.get('pbdb_matches', []))
+                matches.add('idigbio', i.get('idb_matches', []))
+
+        return matches, docs
+
+    return termresolver.resolve(('litho', term, rank), compute)
@@ -0,0 +1,14 @@
+import termresolver
+
+#
+# Locality term resolution, against endpoints.localityIndex
+#
+# Terms are place field values (eg. countryName) and/or a phrase searched across all place names.
+# /occurrences locality and /geonames geolocation are the same full text search.
+#
+
+# fields the endpoints read from matched documents
+FIELDS = ['_id', 'countryName', 'stateProvinceName', 'county', 'locality', 'originalStateProvinceName', 'originalCountryName', 'original_country', 'original_county', 'original_locality']
+
+def search(client, fields=[], text=None):
+    return termresolver.searchIndex(client, 'locality', 'localityIndex', FIELDS, fields, text)
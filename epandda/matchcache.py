@@ -0,0 +1,150 @@
+import collections
+import sys
+import threading
+import connection
+import indexversion
+import postings
+
+#
+# In-process cache of decoded GridFS match lists
+#
+# Taxon, locality and chronostratigraphic index documents point at GridFS files holding the iDigBio and
+# PBDB ids they match. Popular terms hit the same (often multi-megabyte) files on every request, so
+# decoded lists are kept in a least-recently-used cache bounded by approximate memory size in bytes.
+#
+# Entries are keyed by GridFS file id and upload date, so a file replaced under the same id is never
+# served stale. The whole cache is dropped when the index version marker changes.
+#
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+#
+# Least-recently-used cache bounded by the total size of its values, in bytes
+#
+class ByteLRUCache(object):
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    #
+    # Return cached value for key, or None on a miss
+    #
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # re-insert to mark as most recently used
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    #
+    # Add value to cache, evicting least recently used entries until it fits.
+    # Values larger than the whole cache are not stored.
+    #
+    def put(self, key, value, size):
+        if size > self.maxBytes:
+            return False
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+
+            while self.entries and self.bytes + size > self.maxBytes:
+                evictedKey, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted[1]
+                self.evictions += 1
+
+            self.entries[key] = (value, size)
+            self.bytes += size
+        return True
+
+    #
+    # Drop a single key, or every entry if no key is given
+    #
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+                self.bytes = 0
+            else:
+                old = self.entries.pop(key, None)
+                if old is not None:
+                    self.bytes -= old[1]
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "maxBytes": self.maxBytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+_cache = None
+_cacheLock = threading.Lock()
+
+#
+# Return the shared match list cache, sized from config on first use
+#
+def getCache():
+    global _cache
+    if _cache is None:
+        with _cacheLock:
+            if _cache is None:
+                _cache = ByteLRUCache(connection.getConfig().get('grid_cache_bytes', DEFAULT_MAX_BYTES))
+                indexversion.onChange(lambda version: _cache.invalidate())
+    return _cache
+
+#
+# Approximate in-memory size of a decoded match list. Sizes of a sample of elements are
+# extrapolated, as walking multi-million element lists on every insert would cost more than it saves.
+#
+def estimateSize(matches):
+    size = sys.getsizeof(matches)
+    if len(matches) > 0:
+        sample = matches[:100]
+        size += len(matches) * sum(sys.getsizeof(m) for m in sample) // len(sample)
+    return size
+
+#
+# Return decoded match list for a GridFS file, reading it from GridFS only on a cache miss.
+# The returned list is shared between requests and must not be modified by the caller.
+#
+def loadMatches(grid, fileId):
+    cache = getCache()
+    indexversion.currentVersion()
+
+    # grid.get() only reads the file document; chunks are fetched by read()
+    gridOut = grid.get(fileId)
+    key = (fileId, gridOut.upload_date)
+
+    matches = cache.get(key)
+    if matches is None:
+        matches = postings.decode(gridOut.read())
+        cache.put(key, matches, estimateSize(matches))
+    return matches
+
+#
+# Drop all cached match lists, eg. after indexes have been rebuilt
+#
+def invalidate():
+    getCache().invalidate()
+
+def stats():
+    return getCache().stats()
@@ -0,0 +1,129 @@
+#
+# Set of iDigBio and PBDB ids matched by a query
+#
+# Ids are appended in place and de-duplicated as they are added, keeping first-seen order so result
+# pages are stable. Each source keeps a list (for ordering and paging) and a set (for membership).
+#
+
+SOURCES = ('idigbio', 'pbdb')
+
+class MatchSet(object):
+    def __init__(self, idigbio=None, pbdb=None):
+        self.ids = {}
+        self.seen = {}
+        for source in SOURCES:
+            self.ids[source] = []
+            self.seen[source] = set()
+
+        if idigbio is not None:
+            self.add('idigbio', idigbio)
+        if pbdb is not None:
+            self.add('pbdb', pbdb)
+
+    #
+    # Append ids not already in the set for source
+    #
+    def add(self, source, ids):
+        seen = self.seen[source]
+
+        # common case of ids that are unique and new is handled with set operations alone
+        if seen.isdisjoint(ids):
+            fresh = set(ids)
+            if len(fresh) == len(ids):
+                self.ids[source].extend(ids)
+                seen.update(fresh)
+                return self
+
+        add = seen.add
+        self.ids[source].extend([i for i in ids if i not in seen and not add(i)])
+        return self
+
+    #
+    # Append all ids of another match set
+    #
+    def update(self, other):
+        for source in SOURCES:
+            self.add(source, other.ids[source])
+        return self
+
+    def get(self, source):
+        return self.ids[source]
+
+    def count(self, source):
+        return len(self.ids[source])
+
+    def counts(self):
+        idbCount = self.count('idigbio')
+        pbdbCount = self.count('pbdb')
+        return {'totalCount': idbCount + pbdbCount, 'idbCount': idbCount, 'pbdbCount': pbdbCount}
+
+    def isEmpty(self):
+        return all(len(self.ids[source]) == 0 for source in SOURCES)
+
+    def __contains__(self, item):
+        source, id = item
+        return id in self.seen[source]
+
+    def __len__(self):
+        return sum(len(self.ids[source]) for source in SOURCES)
+
+    #
+    # Return matches in the {'idigbio': [...], 'pbdb': [...]} form used by resolveReferences()
+    #
+    def toMatches(self):
+        return {'idigbio': self.ids['idigbio'], 'pbdb': self.ids['pbdb']}
+
+    #
+    # Return new match set holding ids in both sets
+    #
+    def intersect(self, other):
+        return MatchSet.intersection([self, other], ignoreEmpty=False)
+
+    #
+    # Return new match set holding ids in either set
+    #
+    def union(self, other):
+        return MatchSet().update(self).update(other)
+
+    #
+    # Return new match set holding ids in this set but not in other
+    #
+    def difference(self, other):
+        result = MatchSet()
+        for source in SOURCES:
+            exclude = other.seen[source]
+            result.add(source, [i for i in self.ids[source] if i not in exclude])
+        return result
+
+    def __and__(self, other):
+        return self.intersect(other)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    #
+    # Intersect match sets per source, starting from the smallest set and stopping as soon as the
+    # result is empty. With ignoreEmpty, a set with no ids for a source doesn't constrain that source
+    # (ie. a dimension that wasn't searched, or matched nothing in one of the sources).
+    #
+    @staticmethod
+    def intersection(matchSets, ignoreEmpty=True):
+        result = MatchSet()
+        for source in SOURCES:
+            candidates = [m for m in matchSets if not (ignoreEmpty and m.count(source) == 0)]
+            if len(candidates) == 0:
+                continue
+
+            candidates.sort(key=lambda m: m.count(source))
+            ids = candidates[0].ids[source]
+            for m in candidates[1:]:
+                if len(ids) == 0:
+                    break
+                seen = m.seen[source]
+                ids = [i for i in ids if i in seen]
+
+            result.add(source, ids)
+        return result
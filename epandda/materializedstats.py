@@ -0,0 +1,167 @@
+import datetime
+import os
+import threading
+import time
+import uuid
+from pymongo.errors import DuplicateKeyError, PyMongoError
+import connection
+
+#
+# Materialized API statistics
+#
+# Record totals and exact distinct counts of each place type are expensive to compute (the distinct
+# counts need aggregation over the whole locality index), so they are computed on a schedule and stored
+# in a single document in endpoints.apiStats, which /stats reads.
+#
+# Each API process runs a background thread that refreshes the document once it is older than
+# stats_refresh_seconds (0 disables the thread). A lease document ensures only one process at a time
+# does the work. data_util/materialize_stats.py refreshes the document on demand.
+#
+
+STATS_ID = 'stats'
+LEASE_ID = 'statsLease'
+DEFAULT_REFRESH_SECONDS = 6 * 3600
+
+# fields of localityIndex holding each place type
+PLACE_FIELDS = {'localities': 'locality', 'counties': 'county', 'stateProvinces': 'stateProvinceName', 'countries': 'countryName'}
+
+_thread = None
+_threadPid = None
+_lock = threading.Lock()
+
+def statsCollection(client=None):
+    if client is None:
+        client = connection.getClient()
+    return client.endpoints.apiStats
+
+#
+# Return number of distinct non-empty values of a field (which may hold a single value or a list)
+#
+def distinctCount(collection, field):
+    res = list(collection.aggregate([
+        {'$unwind': '$' + field},
+        {'$match': {field: {'$nin': [None, '']}}},
+        {'$group': {'_id': '$' + field}},
+        {'$count': 'count'}
+    ], allowDiskUse=True))
+    return res[0]['count'] if len(res) > 0 else 0
+
+#
+# Compute exact statistics
+#
+def compute(client):
+    idbCount = client.idigbio.occurrence.count_documents({})
+    pbdbCount = client.pbdb.pbdb_occurrences.count_documents({})
+
+    counts = {
+        'totalRecords': idbCount + pbdbCount,
+        'specimens': idbCount,
+        'occurrences': pbdbCount,
+        'geoPoints': client.endpoints.geoPointIndex.count_documents({}),
+        'taxonomies': client.endpoints.taxonIndex.count_documents({})
+    }
+    for place, field in PLACE_FIELDS.items():
+        counts[place] = distinctCount(client.endpoints.localityIndex, field)
+    return counts
+
+#
+# Return fast estimates of the statistics, from collection metadata. Distinct place counts can't be
+# estimated this way and are None.
+#
+def estimate(client):
+    idbCount = client.idigbio.occurrence.estimated_document_count()
+    pbdbCount = client.pbdb.pbdb_occurrences.estimated_document_count()
+
+    counts = {
+        'totalRecords': idbCount + pbdbCount,
+        'specimens': idbCount,
+        'occurrences': pbdbCount,
+        'geoPoints': client.endpoints.geoPointIndex.estimated_document_count(),
+        'taxonomies': client.endpoints.taxonIndex.estimated_document_count()
+    }
+    for place in PLACE_FIELDS:
+        counts[place] = None
+    return counts
+
+#
+# Compute statistics and store them
+#
+def materialize(client=None):
+    if client is None:
+        client = connection.getClient()
+
+    start = time.time()
+    counts = compute(client)
+    doc = {'_id': STATS_ID, 'counts': counts, 'computedAt': datetime.datetime.utcnow(), 'durationSeconds': round(time.time() - start, 1)}
+    statsCollection(client).replace_one({'_id': STATS_ID}, doc, upsert=True)
+    return doc
+
+#
+# Return stored statistics, or estimated counts if they haven't been computed yet. The result
+# includes computedAt and ageSeconds (None for estimates) and whether the counts are estimated.
+#
+def load(client=None):
+    if client is None:
+        client = connection.getClient()
+
+    doc = statsCollection(client).find_one({'_id': STATS_ID})
+    if doc is None:
+        return {'counts': estimate(client), 'estimated': True, 'computedAt': None, 'ageSeconds': None}
+
+    age = (datetime.datetime.utcnow() - doc['computedAt']).total_seconds()
+    return {'counts': doc['counts'], 'estimated': False, 'computedAt': doc['computedAt'].isoformat() + 'Z', 'ageSeconds': int(age)}
+
+#
+# Take the refresh lease if no other process holds it. Returns True if the lease was taken.
+#
+def acquireLease(client, seconds):
+    now = datetime.datetime.utcnow()
+    try:
+        statsCollection(client).update_one(
+            {'_id': LEASE_ID, 'expiresAt': {'$lt': now}},
+            {'$set': {'expiresAt': now + datetime.timedelta(seconds=seconds), 'owner': uuid.uuid4().hex}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+#
+# Refresh stored statistics if they are older than interval seconds and no other process is doing so
+#
+def refreshIfStale(interval):
+    client = connection.getClient()
+    doc = statsCollection(client).find_one({'_id': STATS_ID}, {'computedAt': True})
+    if doc is not None and (datetime.datetime.utcnow() - doc['computedAt']).total_seconds() < interval:
+        return False
+
+    # the lease outlives any reasonable refresh, and expires if the process dies mid-way
+    if not acquireLease(client, interval):
+        return False
+
+    materialize(client)
+    return True
+
+def refreshLoop(interval):
+    while True:
+        try:
+            refreshIfStale(interval)
+        except PyMongoError as e:
+            print "Could not refresh API statistics: " + str(e)
+        time.sleep(min(interval, 300))
+
+#
+# Start the background refresh thread for this process, if it isn't running already
+#
+def ensureRefresher():
+    global _thread, _threadPid
+    interval = connection.getConfig().get('stats_refresh_seconds', DEFAULT_REFRESH_SECONDS)
+    if interval <= 0 or (_thread is not None and _threadPid == os.getpid()):
+        return
+
+    with _lock:
+        if _thread is None or _threadPid != os.getpid():
+            _thread = threading.Thread(target=refreshLoop, args=(interval,), name='stats-refresh')
+            _thread.daemon = True
+            _thread.start()
+            _threadPid = os.getpid()
@@ -1,7 +1,12 @@
 from mongo import mongoBasedResource
 from flask_restful import reqparse
-import gridfs
 import json
+import chronoterms
+import localityterms
+import lithoterms
+import taxonterms
+import termresolver
+from matchset import MatchSet
 
 parser = reqparse.RequestParser()
 
@@ -15,13 +20,9 @@ parser.add_argument('institution_code', type=str, help='The abbreviated code sub
 #
 #
 class occurrences(mongoBasedResource):
-	def process(self):
+	cacheResponses = True
 
-		lindex = self.client.endpoints.localityIndex                       # Mongodb index for localities
-		tindex = self.client.endpoints.taxonIndex						     # Mongodb index for taxa
-		cindex = self.client.endpoints.chronoStratIndex					 # Mongodb index for chronostratigraphy
-		ltindex = self.client.endpoints.lithoStratIndex
-		grid = gridfs.GridFS(self.client.endpoints)
+	def process(self):
 
 		# returns dictionary of params as defined in endpoint description
 		# will throw exception if required param is not present
@@ -31,81 +32,45 @@ class occurrences(mongoBasedResource):
 		limit = self.limit()
 
 		if self.paramCount > 0:
-			chronoRes = None
-			localityRes = None
-			res = None
-			lithoRes = None
 			criteria = {'endpoint': 'occurrences', 'parameters': {}, 'matchTerms': {'scientificNames': [], 'stateProvinceNames': [], 'countryNames': [], 'countyNames': [], 'localityNames': [], 'originalStates': [], 'originalCountries': [], 'originalCounties': [], 'originalLocalities': [], 'chronostratigraphy': [], 'lithostratigraphy': []}}
-			taxonQuery = []
-			localityQuery = []
-			lithQuery = []
-			stratQuery = []
+			# each dimension is resolved as by its own endpoint, sharing cached resolutions with it
+			empty = termresolver.Resolution(MatchSet(), [])
+			taxonRes = localityRes = chronoRes = lithoRes = empty
 			if params['taxon_name']:
-				taxon_name = params['taxon_name']
-				res = tindex.find({"$text": {"$search": '"' + taxon_name + '"'}})
+				taxonRes = taxonterms.search(self.client, [], params['taxon_name'])
 
 			if params['locality']:
-				locality = params['locality']
-				localityRes = lindex.find({'$text': {'$search': '"' + locality + '"'}})
+				localityRes = localityterms.search(self.client, [], params['locality'])
 
 			if params['chronostratigraphy']:
-				chronoStrat = params['chronostratigraphy']
-				chronoRes = cindex.find({'$text': {'$search': '"' + chronoStrat + '"'}})
+				chronoRes = chronoterms.search(self.client, params['chronostratigraphy'])
 
 			if params['lithostratigraphy']:
-				lithoStrat = params['lithostratigraphy']
-				lithoRes = ltindex.find({'$text': {'$search': '"' + lithoStrat + '"'}})
+				lithoRes = lithoterms.resolve(self.client, params['lithostratigraphy'])
 
-			d = []
-			matches = {'idigbio': [], 'pbdb': []}
-			taxonMatches = {'idigbio': [], 'pbdb': []}
-			chronoMatches = {'idigbio': [], 'pbdb': []}
-			lithoMatches = {'idigbio': [], 'pbdb': []}
-			idbCount = 0
-			pbdbCount = 0
 			# taxonomy
-			if res:
-				for i in res:
-					for i in res:
-						taxonomy = i['taxonomy']
-						scientificNames = i['scientificNames']
-						for sciName in scientificNames:
-							if sciName not in criteria['matchTerms']['scientificNames']:
-								criteria['matchTerms']['scientificNames'].append(sciName)
-						taxon_ranks = taxonomy.keys()
-						for rank in taxon_ranks:
-							if rank in criteria['matchTerms']:
-								for term in taxonomy[rank]:
-									if term not in criteria['matchTerms'][rank]:
-										criteria['matchTerms'][rank].append(term)
-							else:
-								criteria['matchTerms'][rank] = []
-								for term in taxonomy[rank]:
+			if taxonRes.docs:
+				for i in taxonRes.docs:
+					taxonomy = i['taxonomy']
+					scientificNames = i['scientificNames']
+					for sciName in scientificNames:
+						if sciName not in criteria['matchTerms']['scientificNames']:
+							criteria['matchTerms']['scientificNames'].append(sciName)
+					taxon_ranks = taxonomy.keys()
+					for rank in taxon_ranks:
+						if rank in criteria['matchTerms']:
+							for term in taxonomy[rank]:
+								if term not in criteria['matchTerms'][rank]:
 									criteria['matchTerms'][rank].append(term)
-
-						if 'pbdbGridFile' in i:
-							pbdbGrids = i['pbdbGridFile']
-							for file in pbdbGrids:
-								pbdb_doc = grid.get(file)
-								pbdb_matches = json.loads(pbdb_doc.read())
-								taxonMatches['pbdb'] = taxonMatches['pbdb'] + pbdb_matches
-
-						if 'idbGridFile' in i:
-							if type(i['idbGridFile']) is list:
-								idbGrids = i['idbGridFile']
-								for file in idbGrids:
-									idb_doc = grid.get(file)
-									idb_matches = json.loads(idb_doc.read())
-									taxonMatches['idigbio'] = taxonMatches['idigbio'] + idb_matches
-							else:
-								idb_doc = grid.get(i['idbGridFile'])
-								idb_matches = json.loads(idb_doc.read())
-								taxonMatches['idigbio'] = taxonMatches['idigbio'] + idb_matches
+						else:
+							criteria['matchTerms'][rank] = []
+							for term in taxonomy[rank]:
+								criteria['matchTerms'][rank].append(term)
+			taxonMatches = taxonRes.matches
 
 			# locality
-			geoMatches = {'idigbio': [], 'pbdb': []}
-			if localityRes:
-				for i in localityRes:
+			if localityRes.docs:
+				for i in localityRes.docs:
 					if 'countryName' in i and i['countryName'] not in criteria['matchTerms']['countryNames']:
 						criteria['matchTerms']['countryNames'].append(i['countryName'])
 					if 'stateProvinceName' in i and i['stateProvinceName'] not in criteria['matchTerms']['stateProvinceNames']:
@@ -132,112 +97,33 @@ class occurrences(mongoBasedResource):
 						for origLocality in i['original_locality']:
 							if origCounty not in criteria['matchTerms']['originalLocalities']:
 								criteria['matchTerms']['originalLocalities'].append(origLocality)
-					if 'pbdbGridFile' in i:
-						if type(i['pbdbGridFile']) is list:
-							pbdbGrids = i['pbdbGridFile']
-							for file in pbdbGrids:
-								pbdb_doc = grid.get(file)
-								pbdb_matches = json.loads(pbdb_doc.read())
-								geoMatches['pbdb'] = geoMatches['pbdb'] + pbdb_matches
-						else:
-							idb_doc = grid.get(i['pbdbGridFile'])
-							idb_matches = json.loads(idb_doc.read())
-							geoMatches['pbdb'] = geoMatches['pbdb'] + idb_matches
-
-					if 'idbGridFile' in i:
-						if type(i['idbGridFile']) is list:
-							idbGrids = i['idbGridFile']
-							for file in idbGrids:
-								idb_doc = grid.get(file)
-								idb_matches = json.loads(idb_doc.read())
-								geoMatches['idigbio'] = geoMatches['idigbio'] + idb_matches
-						else:
-							idb_doc = grid.get(i['idbGridFile'])
-							idb_matches = json.loads(idb_doc.read())
-							geoMatches['idigbio'] = geoMatches['idigbio'] + idb_matches
+			geoMatches = localityRes.matches
 
 			# chronostratigraphy
-			if chronoRes:
-				for i in chronoRes:
+			if chronoRes.docs:
+				for i in chronoRes.docs:
 					temp_doc = {}
 					for level in ['lowStage', 'highStage', 'lowSeries', 'highSeries', 'lowSystem', 'highSystem', 'lowErathem', 'highErathem', 'upperChronostratigraphy', 'lowerChronostratigraphy']:
 						if level in i:
 							temp_doc[level] = i[level]
 					criteria['matchTerms']['chronostratigraphy'].append(temp_doc)
-
-					if 'pbdbGridFile' in i:
-						pbdbGrids = i['pbdbGridFile']
-						for file in pbdbGrids:
-							pbdb_doc = grid.get(file)
-							pbdb_matches = json.loads(pbdb_doc.read())
-							chronoMatches['pbdb'] = chronoMatches['pbdb'] + pbdb_matches
-
-					if 'idbGridFile' in i:
-						if type(i['idbGridFile']) is list:
-							idbGrids = i['idbGridFile']
-							for file in idbGrids:
-								idb_doc = grid.get(file)
-								idb_matches = json.loads(idb_doc.read())
-								chronoMatches['idigbio'] = chronoMatches['idigbio'] + idb_matches
-						else:
-							idb_doc = grid.get(i['idbGridFile'])
-							idb_matches = json.loads(idb_doc.read())
-							chronoMatches['idigbio'] = chronoMatches['idigbio'] + idb_matches
+			chronoMatches = chronoRes.matches
 
 			# lithostratigraphy
-			if lithoRes:
-				for i in lithoRes:
-					temp_doc = {}
-
-					criteria['matchTerms']['lithostratigraphy'].append({'name': i['name'], 'rank': i['rank']})
-
-					if 'pbdb_matches' in i:
-						pbdb_matches = i['pbdb_matches']
-						lithoMatches['pbdb'] = lithoMatches['pbdb'] + pbdb_matches
-
-					if 'idb_matches' in i:
-						idb_matches = i['idb_matches']
-						lithoMatches['idigbio'] = lithoMatches['idigbio'] + idb_matches
-
-			print 'Locality Counts: ' + str(len(geoMatches['idigbio'])) + ' | ' + str(len(geoMatches['pbdb']))
-			print 'Taxon Counts: ' + str(len(taxonMatches['idigbio'])) + ' | ' + str(len(taxonMatches['pbdb']))
-			print 'Chrono Counts: ' + str(len(chronoMatches['idigbio'])) + ' | ' + str(len(chronoMatches['pbdb']))
-			print 'Litho Counts: ' + str(len(lithoMatches['idigbio'])) + ' | ' + str(len(lithoMatches['pbdb']))
-
-			idbGeoSet = set(geoMatches['idigbio'])
-			pbdbGeoSet = set(geoMatches['pbdb'])
-			idbTaxonSet = set(taxonMatches['idigbio'])
-			pbdbTaxonSet = set(taxonMatches['pbdb'])
-			idbChronoSet = set(chronoMatches['idigbio'])
-			pbdbChronoSet = set(chronoMatches['pbdb'])
-			idbLithoSet = set(lithoMatches['idigbio'])
-			pbdbLithoSet = set(lithoMatches['pbdb'])
-
-			idbMatches = idbGeoSet | idbTaxonSet | idbChronoSet | idbLithoSet
-
-			for idbMatchSet in  [idbGeoSet, idbTaxonSet, idbChronoSet, idbLithoSet]:
-				if len(idbMatchSet) < 1:
-					continue
-				idbMatches = idbMatches & idbMatchSet
-
-			pbdbMatches = pbdbGeoSet | pbdbTaxonSet | pbdbChronoSet | pbdbLithoSet
-			for pbdbMatchSet in  [pbdbGeoSet, pbdbTaxonSet, pbdbChronoSet, pbdbLithoSet]:
-				if len(pbdbMatchSet) < 1:
-					continue
-				pbdbMatches = pbdbMatches & pbdbMatchSet
+			if lithoRes.docs:
+				for i in lithoRes.docs:
+					criteria['matchTerms']['lithostratigraphy'].append({'name': i['unit'], 'rank': i['type']})
+			lithoMatches = lithoRes.matches
 
-			matches['idigbio'] = list(idbMatches)
-			matches['pbdb'] = list(pbdbMatches)
+			print 'Locality Counts: ' + str(geoMatches.count('idigbio')) + ' | ' + str(geoMatches.count('pbdb'))
+			print 'Taxon Counts: ' + str(taxonMatches.count('idigbio')) + ' | ' + str(taxonMatches.count('pbdb'))
+			print 'Chrono Counts: ' + str(chronoMatches.count('idigbio')) + ' | ' + str(chronoMatches.count('pbdb'))
+			print 'Litho Counts: ' + str(lithoMatches.count('idigbio')) + ' | ' + str(lithoMatches.count('pbdb'))
 
-			idbCount = len(matches['idigbio'])
-			pbdbCount = len(matches['pbdb'])
+			# dimensions with no matches for a source don't constrain that source
+			matches = MatchSet.intersection([geoMatches, taxonMatches, chronoMatches, lithoMatches])
 
-			item = {'matches': {'idigbio': matches['idigbio'], 'pbdb': matches['pbdb']}}
-			d.append(item)
-			d = self.resolveReferences(d)
-			counts = {'totalCount': idbCount + pbdbCount, 'idbCount': idbCount, 'pbdbCount': pbdbCount}
-			d['pbdb_resolved'] = d['pbdb_resolved'][offset:limit]
-			return self.respond({'counts': counts, 'results': d, 'criteria': criteria})
+			return self.respondWithMatches(matches, {'criteria': criteria})
 		else:
 			return self.respondWithDescription()
 
@@ -0,0 +1,169 @@
+import binascii
+import json
+import struct
+import uuid
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Compact binary posting lists for GridFS match files
+#
+# Match files were written as JSON arrays of iDigBio UUID strings or PBDB occurrence numbers. The binary
+# format stores the same lists as:
+#
+#   header    "EPPL", format version (1 byte), kind (1 byte), flags (1 byte), reserved (1 byte),
+#             element count (uint32, little endian)
+#   payload   KIND_UUID: 16 bytes per UUID, in list order
+#             KIND_INT:  sorted integers as varint-encoded deltas from the previous value
+#
+# If FLAG_ZLIB is set the payload is zlib compressed. Files without the magic prefix are decoded as JSON,
+# so old and new files can be mixed freely.
+#
+
+MAGIC = b'EPPL'
+VERSION = 1
+
+KIND_UUID = 1
+KIND_INT = 2
+
+FLAG_ZLIB = 0x01
+
+HEADER = struct.Struct('<4sBBBBI')
+
+#
+# Return True if data is in the binary posting list format
+#
+def isPostingList(data):
+    return data[:len(MAGIC)] == MAGIC
+
+#
+# Encode list of ids. All ids must be UUID strings or all must be non-negative integers;
+# a ValueError is raised for anything else.
+#
+def encode(ids, compress=False):
+    if len(ids) > 0 and all(isinstance(i, (int, long)) for i in ids):
+        kind = KIND_INT
+        payload = encodeInts(ids)
+    else:
+        kind = KIND_UUID
+        try:
+            payload = b''.join(uuid.UUID(i).bytes for i in ids)
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("Posting lists can only hold UUID strings or non-negative integers")
+
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+
+    return HEADER.pack(MAGIC, VERSION, kind, flags, 0, len(ids)) + payload
+
+#
+# Encode integers as sorted varint deltas
+#
+def encodeInts(ids):
+    out = bytearray()
+    previous = 0
+    for i in sorted(ids):
+        if i < 0:
+            raise ValueError("Posting lists can only hold UUID strings or non-negative integers")
+        delta = i - previous
+        previous = i
+        while delta >= 0x80:
+            out.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+#
+# Parse header, returning (kind, count, payload)
+#
+def readHeader(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Posting list is truncated")
+
+    magic, version, kind, flags, reserved, count = HEADER.unpack_from(data)
+    if version > VERSION:
+        raise ValueError("Unsupported posting list version " + str(version))
+
+    payload = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return kind, count, payload
+
+#
+# Decode a match file (binary or JSON) to a list of ids
+#
+def decode(data):
+    if not isPostingList(data):
+        return json.loads(data)
+
+    kind, count, payload = readHeader(data)
+
+    if kind == KIND_UUID:
+        # hex encode the whole payload once rather than building a UUID object per element
+        h = binascii.hexlify(payload)
+        return ['%s-%s-%s-%s-%s' % (h[o:o + 8], h[o + 8:o + 12], h[o + 12:o + 16], h[o + 16:o + 20], h[o + 20:o + 32]) for o in xrange(0, count * 32, 32)]
+
+    if kind == KIND_INT:
+        ids = []
+        value = 0
+        delta = 0
+        shift = 0
+        for b in bytearray(payload):
+            delta |= (b & 0x7f) << shift
+            if b & 0x80:
+                shift += 7
+            else:
+                value += delta
+                ids.append(value)
+                delta = 0
+                shift = 0
+        return ids
+
+    raise ValueError("Unknown posting list kind " + str(kind))
+
+#
+# Decode a match file to a numpy array without creating a Python object per element.
+# UUIDs are returned as a (count, 16) uint8 array of raw UUID bytes, integers as an int64 array.
+# JSON files are supported but are necessarily parsed element by element.
+#
+def decodeArray(data):
+    if numpy is None:
+        raise ImportError("numpy is required to decode posting lists to arrays")
+
+    if not isPostingList(data):
+        ids = json.loads(data)
+        if len(ids) > 0 and isinstance(ids[0], basestring):
+            return numpy.frombuffer(b''.join(uuid.UUID(i).bytes for i in ids), dtype=numpy.uint8).reshape(-1, 16)
+        return numpy.array(ids, dtype=numpy.int64)
+
+    kind, count, payload = readHeader(data)
+
+    if kind == KIND_UUID:
+        return numpy.frombuffer(payload, dtype=numpy.uint8, count=count * 16).reshape(count, 16)
+
+    if kind == KIND_INT:
+        if count == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        b = numpy.frombuffer(payload, dtype=numpy.uint8)
+
+        # the last byte of each varint has its high bit clear
+        ends = numpy.flatnonzero(b < 0x80)
+        starts = numpy.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+
+        # shift each byte by 7 bits per position within its varint, then sum bytes of each varint
+        positions = numpy.arange(len(b)) - numpy.repeat(starts, ends - starts + 1)
+        parts = (b & 0x7f).astype(numpy.uint64) << (positions * 7).astype(numpy.uint64)
+        deltas = numpy.add.reduceat(parts, starts)
+
+        return numpy.cumsum(deltas).astype(numpy.int64)
+
+    raise ValueError("Unknown posting list kind " + str(kind))
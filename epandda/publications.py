@@ -1,6 +1,7 @@
 import re
 from mongo import mongoBasedResource
 from flask_restful import reqparse
+from matchset import MatchSet
 
 parser = reqparse.RequestParser()
 
@@ -16,6 +17,8 @@ parser.add_argument('locality', type=str, help='Locality name to filter describe
 #
 #
 class publications(mongoBasedResource):
+    cacheResponses = True
+
     def process(self):
 
         # Mongodb index for Publication
@@ -104,10 +107,8 @@ class publications(mongoBasedResource):
 
               criteria['parameters'][p] = str(params[p]).lower()
 
-          d = []
-          matches = {'idigbio': [], 'pbdb': [], 'faceted_matches': []}
-          idbCount = 0
-          pbdbCount = 0
+          matches = MatchSet()
+          faceted_matches = []
 
           res = pubIndex.find({"$and":  pubQuery })
           if res:
@@ -118,10 +119,10 @@ class publications(mongoBasedResource):
 
                 for idb in i['vetted']:
                   
-                  matches['faceted_matches'].append({ 'pbdb_id': i['pid'], 'idigbio_uuid': idb['uuid'], 'matchedOn': idb['matched_on'], 'score': idb['score']}) 
-                  matches['idigbio'].append( idb['uuid'] )
+                  faceted_matches.append({ 'pbdb_id': i['pid'], 'idigbio_uuid': idb['uuid'], 'matchedOn': idb['matched_on'], 'score': idb['score']}) 
+                  matches.add('idigbio', [idb['uuid']])
 
-              matches['pbdb'].append( i['pid'] )
+              matches.add('pbdb', [i['pid']])
 
               if 'countryName' in i and i['countryName'] not in criteria['matchTerms']['countryNames']:
                 criteria['matchTerms']['countryNames'].append(i['countryName'])
@@ -157,34 +158,12 @@ class publications(mongoBasedResource):
                   if origLocality not in criteria['matchTerms']['originalLocalities']:
                     criteria['matchTerms']['originalLocalities'].append(origLocality)
 
-          finalMatches = {'idigbio': [], 'pbdb': []}
-          finalMatches['idigbio'] = matches['idigbio']
-          finalMatches['pbdb'] = matches['pbdb']
-
-          idbCount = len(finalMatches['idigbio'])
-          pbdbCount = len(finalMatches['pbdb'])
-
-          resolveSet = { 'idigbio': finalMatches['idigbio'],
-                         'pbdb': finalMatches['pbdb']}
-
-
-          d.append({'matches': finalMatches})
-          d = self.resolveReferences(d,'refs', 'both' )
-
-          counts = {
-            'totalCount': idbCount + pbdbCount, 
-            'idbCount': idbCount,
-            'pbdbCount': pbdbCount
-          }
-
           print "Responding data package ..."
-          return self.respond({
-              'counts': counts, 
-              'results': d,
+          return self.respondWithMatches(matches, {
               'criteria': criteria,
               'includeAnnotations': params['includeAnnotations'],
-              'faceted_matches': matches['faceted_matches']
-          })
+              'faceted_matches': faceted_matches
+          }, 'refs', 'both')
         else:
 
           return self.respondWithDescription()
@@ -252,4 +231,11 @@ class publications(mongoBasedResource):
                     "type": "boolean",
                     "required": False,
                     "description": "Toggles if OpenAnnotations section should be included or not"
+                },
+                {
+                    "name": "inlineAnnotations",
+                    "label": "Inline Annotations",
+                    "type": "boolean",
+                    "required": False,
+                    "description": "With includeAnnotations, attach annotations to the PBDB record they annotate rather than returning them as a separate list"
                 }]}
@@ -1,40 +1,232 @@
 from flask_restful import Resource, Api
-from flask import current_app, url_for
+from flask import current_app, url_for, copy_current_request_context
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 from base import baseResource
+from matchset import MatchSet
+import os
+import threading
+import time
+import connection
+
+DEFAULT_THREADS = 8
+DEFAULT_TIMEOUT = 30
+
+_pool = None
+_poolPid = None
+_lock = threading.Lock()
+
+#
+# Return the shared sub-query pool, creating it on first use in this process. Sub-queries get their
+# own pool (query_threads) as they in turn use the GridFS fetch pool.
+#
+def getPool():
+    global _pool, _poolPid
+    if _pool is None or _poolPid != os.getpid():
+        with _lock:
+            if _pool is None or _poolPid != os.getpid():
+                _pool = ThreadPool(connection.getConfig().get('query_threads', DEFAULT_THREADS))
+                _poolPid = os.getpid()
+    return _pool
 
 #
 # Boolean
 #
+# Sub-queries run concurrently. Each is given query_timeout_seconds (or its own shorter "timeout" value) to
+# complete; a sub-query that fails or times out is reported with an "errors" entry in its place. (A timed
+# out sub-query keeps its worker thread until it finishes, as threads can't be interrupted.) Sub-queries
+# can't themselves be /query requests.
+#
+# A "queries" list returns the results of each sub-query, in request order, each with its run time in
+# seconds as "queryTime".
+#
+# An "expression" combines sub-queries server-side into a single result set, eg.
+#
+#   {"and": [{"endpoint": "taxonomy", "parameters": {...}},
+#            {"endpoint": "geonames", "parameters": {...}},
+#            {"not": {"endpoint": "stratigraphy", "parameters": {...}}}]}
+#
+# Nodes are "and" and "or" lists, "not" (only as a member of an "and") and sub-queries. Sub-queries
+# return their raw iDigBio/PBDB match sets, which are combined before any records are resolved; only
+# the requested page of the final set is resolved, and later pages are available by cursor.
+#
 class query(baseResource):
     def process(self):
+        r_as_json = self.getRequest().get_json(silent=True)
+        if r_as_json is not None and "expression" in r_as_json:
+            return self.processExpression(r_as_json['expression'])
 
-        query_list = self.getQueryList()
+        queries = self.collect(self.submit(self.getQueryList()))
 
-        queries = []
+        return self.respond({
+          'queries': queries
+        }, "queries")
+
+    #
+    # Evaluate a boolean expression over sub-queries and respond with a page of the combined match set
+    #
+    def processExpression(self, expression):
+        leaves = []
+        self.findLeaves(expression, leaves)
+        if len(leaves) == 0:
+            raise Exception({"GENERAL": "Expression does not include any queries"})
+
+        results = self.collect(self.submit(leaves, True))
+
+        types = set()
+        for i, res in enumerate(results):
+            if 'errors' in res:
+                raise Exception({"GENERAL": ["Query " + str(i + 1) + " (" + unicode(res['endpoint']) + ") failed"] + [unicode(e) for errors in res['errors'].values() for e in (errors if type(errors) is list else [errors])]})
+            if 'matches' not in res:
+                raise Exception({"GENERAL": "Query " + str(i + 1) + " (" + unicode(res['endpoint']) + ") did not return matches; check its parameters"})
+            types.add((res['pbdb_type'], res['show_type']))
+
+        # PBDB ids are occurrence numbers for most endpoints but reference ids for publications
+        if len(types) > 1:
+            raise Exception({"GENERAL": "Publication queries can't be combined with occurrence queries"})
+        pbdb_type, show_type = types.pop()
+
+        matches = self.evaluate(expression, iter([res['matches'] for res in results]))
+
+        criteria = {'endpoint': 'query', 'expression': expression, 'queries': []}
+        for res in results:
+            criteria['queries'].append({'endpoint': res['endpoint'], 'criteria': res['criteria'], 'counts': res['counts'], 'queryTime': res['queryTime']})
+
+        return self.respondWithMatches(matches, {'criteria': criteria}, pbdb_type, show_type)
+
+    #
+    # Collect sub-queries of an expression, in the order evaluate() consumes them
+    #
+    def findLeaves(self, node, leaves):
+        if type(node) is not dict:
+            raise Exception({"GENERAL": "Invalid expression node: " + unicode(node)})
+
+        if "and" in node or "or" in node:
+            children = node.get("and", node.get("or"))
+            if type(children) is not list or len(children) == 0:
+                raise Exception({"GENERAL": "Expression and/or nodes must hold a non-empty list"})
+            if "or" in node and any(type(c) is dict and "not" in c for c in children):
+                raise Exception({"GENERAL": "Expression not nodes can only be used within and nodes"})
+            if "and" in node and all(type(c) is dict and "not" in c for c in children):
+                raise Exception({"GENERAL": "Expression and nodes need at least one term that isn't negated"})
+            for c in children:
+                self.findLeaves(c["not"] if type(c) is dict and "not" in c else c, leaves)
+        elif "not" in node:
+            raise Exception({"GENERAL": "Expression not nodes can only be used within and nodes"})
+        else:
+            leaves.append(node)
+
+    #
+    # Evaluate expression node, taking sub-query match sets in order from results. AND intersects
+    # its terms smallest first, stopping as soon as the result is empty, then removes negated terms.
+    #
+    def evaluate(self, node, results):
+        if "and" in node:
+            terms = []
+            excluded = []
+            for c in node["and"]:
+                if "not" in c:
+                    excluded.append(self.evaluate(c["not"], results))
+                else:
+                    terms.append(self.evaluate(c, results))
+
+            matches = MatchSet.intersection(terms, ignoreEmpty=False)
+            for m in excluded:
+                if matches.isEmpty():
+                    break
+                matches = matches - m
+            return matches
+
+        if "or" in node:
+            matches = MatchSet()
+            for c in node["or"]:
+                matches.update(self.evaluate(c, results))
+            return matches
+
+        return next(results)
+
+    #
+    # Start running a list of sub-queries. With matchesOnly, sub-queries return raw match sets
+    # rather than resolved pages.
+    #
+    def submit(self, query_list, matchesOnly=False):
+        maxTimeout = float(self.config.get('query_timeout_seconds', DEFAULT_TIMEOUT))
+
+        pending = []
         for q in query_list:
-            if "endpoint" not in q or "parameters" not in q:
+            if type(q) is not dict or "endpoint" not in q or "parameters" not in q:
+                pending.append((q, None, 0, {"errors": {"GENERAL": ["Query must specify endpoint and parameters"]}}))
+                continue
+
+            try:
+                timeout = float(q.get('timeout', maxTimeout))
+            except (TypeError, ValueError):
+                timeout = None
+            if timeout is None or not 0 < timeout:
+                pending.append((q, None, 0, {"errors": {"GENERAL": ["Query timeout must be a positive number of seconds"]}}))
                 continue
 
             try:
                 endpoint = self.loadEndpoint(q['endpoint'])
             except Exception as e:
+                endpoint = None
+
+            if endpoint is None:
+                pending.append((q, None, 0, {"errors": {"GENERAL": ["Unknown endpoint " + unicode(q['endpoint'])]}}))
                 continue
 
-            if endpoint is not None:
-                endpoint.returnResponse = False
-                endpoint.setParams(q['parameters'])
+            # sub-queries wait on the shared pool, so a nested /query could tie up every worker thread
+            if isinstance(endpoint, query) or not hasattr(endpoint, 'process'):
+                pending.append((q, None, 0, {"errors": {"GENERAL": ["Endpoint " + unicode(q['endpoint']) + " can't be used in a query"]}}))
+                continue
 
-                queries.append(endpoint.process())
+            endpoint.returnResponse = False
+            endpoint.matchesOnly = matchesOnly
+            pending.append((q, getPool().apply_async(copy_current_request_context(self.runQuery), (endpoint, q['parameters'])), time.time() + min(timeout, maxTimeout), None))
+
+        return pending
+
+    #
+    # Wait for submitted sub-queries, returning their results in request order
+    #
+    def collect(self, pending):
+        queries = []
+        for q, result, deadline, error in pending:
+            if result is None:
+                error['endpoint'] = q.get('endpoint') if type(q) is dict else None
+                error['queryTime'] = 0
+                queries.append(error)
+                continue
+
+            try:
+                queries.append(result.get(max(0, deadline - time.time())))
+            except TimeoutError:
+                queries.append({"endpoint": q['endpoint'], "errors": {"GENERAL": ["Query timed out"]}, "queryTime": None})
+
+        return queries
+
+    #
+    # Run a sub-query on a worker thread, returning its response or errors, with timing
+    #
+    def runQuery(self, endpoint, parameters):
+        start = time.time()
+        try:
+            endpoint.setParams(parameters)
+            resp = endpoint.process()
+        except Exception as e:
+            errors = e.args[0] if len(e.args) > 0 and type(e.args[0]) is dict else {"GENERAL": unicode(e)}
+            resp = endpoint.respondWithError(errors)
+
+        resp['endpoint'] = endpoint.__class__.__name__
+        resp['queryTime'] = round(time.time() - start, 4)
+        return resp
 
-        return self.respond({
-          'queries': queries
-        }, "queries")
     def description(self):
         return {
             'name': 'Query builder',
             'maintainer': 'Seth Kaufman',
             'maintainer_email': 'seth@epandda.org',
-            'description': 'Generates result sets based upon combinations of endpoint queries',
+            'description': 'Generates result sets based upon combinations of endpoint queries. POST a "queries" list to run several endpoint queries at once, or an "expression" combining endpoint queries with "and", "or" and "not" to get a single result set.',
             'params': [
                 {
                     "name": "xxx",
@@ -0,0 +1,137 @@
+import collections
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+import connection
+import serializers
+
+#
+# Registry of API endpoints
+#
+# Built once by api.py after its resources have been added to the app. Maps endpoint names to resource
+# classes, URLs, methods and descriptions, so /query can dispatch and / can list routes without importing
+# modules or creating resources on each request. Names are matched case-insensitively.
+#
+# The route list served by / and each endpoint's description are rendered to bytes (with ETags) when the
+# registry is built and whenever the config is reloaded. The rendered catalog is also written to
+# catalog_path for documentation/documentation-generator.py.
+#
+
+DEFAULT_CATALOG_PATH = './static/api-catalog.json'
+
+_endpoints = collections.OrderedDict()
+_banner = None
+
+#
+# Register every resource added to a Flask app. Resources that don't implement process() are skipped.
+#
+def build(app):
+    _endpoints.clear()
+    for rule in app.url_map.iter_rules():
+        cls = getattr(app.view_functions.get(rule.endpoint), 'view_class', None)
+        if cls is None or 'process' not in dir(cls):
+            continue
+
+        # descriptions are static, so are read without creating a resource (and touching the database)
+        desc = cls.__new__(cls).description()
+
+        _endpoints[rule.endpoint.lower()] = {
+            'name': rule.endpoint,
+            'cls': cls,
+            'url': re.sub(r'<(?:[^:>]*:)?([^>]*)>', r'[\1]', rule.rule),
+            'methods': ",".join(rule.methods),
+            'description': desc
+        }
+
+    render()
+    connection.onReload(lambda config: render())
+
+#
+# Return rendered body and ETag for data. Keys in ignore (eg. time stamps) don't contribute to the ETag.
+#
+def renderPayload(data, ignore=[]):
+    etag = hashlib.sha1(serializers.dumps(dict((k, v) for k, v in data.items() if k not in ignore), True, 'json')).hexdigest()
+    return {'data': data, 'body': serializers.dumps(data), 'etag': etag}
+
+#
+# Render the route list and endpoint descriptions, and write them to the catalog file
+#
+def render():
+    global _banner
+    config = connection.getConfig()
+
+    routes = []
+    for entry in _endpoints.values():
+        entry['rendered'] = renderPayload(entry['description'])
+        routes.append({'url': entry['url'], 'methods': entry['methods'], 'name': entry['description']['name'], 'description': entry['description']['description']})
+
+    _banner = renderPayload({
+        'description': 'ePANDDA REST API guide',
+        'routes': routes,
+        'timeReturned': str(datetime.datetime.now()),
+        'v': config['version']
+    }, ['timeReturned'])
+
+    writeCatalog(config.get('catalog_path', DEFAULT_CATALOG_PATH))
+
+#
+# Write the route list and descriptions (keyed by URL) to a JSON file. Failure to write the file
+# is reported but doesn't stop the API.
+#
+def writeCatalog(path):
+    if not path:
+        return
+    catalog = {'banner': _banner['data'], 'descriptions': collections.OrderedDict((e['url'], e['description']) for e in _endpoints.values())}
+    directory = os.path.dirname(path) or '.'
+    tmp = None
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # each worker process writes its own temporary file, then atomically replaces the catalog
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.api-catalog-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(catalog, f, indent=4, separators=(',', ': '))
+        os.chmod(tmp, 0644)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        print "Could not write API catalog to " + path + ": " + str(e)
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+
+#
+# Return rendered route list, or None if the registry hasn't been built
+#
+def banner():
+    return _banner
+
+#
+# Return rendered description for an endpoint name, or None if there is no such endpoint
+#
+def renderedDescription(name):
+    entry = get(name)
+    return entry['rendered'] if entry is not None else None
+
+#
+# Return registry entry for an endpoint name, or None if there is no such endpoint
+#
+def get(name):
+    if not isinstance(name, basestring):
+        return None
+    return _endpoints.get(name.lower())
+
+#
+# Return new resource instance for an endpoint name, or None if there is no such endpoint
+#
+def create(name):
+    entry = get(name)
+    return entry['cls']() if entry is not None else None
+
+#
+# Return registry entries in the order routes were added
+#
+def entries():
+    return _endpoints.values()
@@ -0,0 +1,166 @@
+import datetime
+import hashlib
+import json
+import threading
+import time
+from bson import Binary
+import connection
+import indexversion
+from matchcache import ByteLRUCache
+
+#
+# Cache of complete endpoint responses
+#
+# Much of the API's traffic is the portal's canned searches, so identical requests are answered from a
+# cache instead of re-running index lookups, GridFS loads and record resolution. Endpoints opt in by
+# setting cacheResponses = True.
+#
+# Entries are keyed by endpoint, the canonical (lower-cased, non-empty) request parameters with
+# normalized offset and limit, and the index version, so a rebuilt index never serves a stale response.
+# Backends are selected with the response_cache config setting:
+#
+#   "local" (default)   in-process LRU cache bounded by response_cache_bytes
+#   "mongo"             shared by all API processes, in the endpoints.responseCache collection
+#   "none"              responses are not cached
+#
+# Entries expire after response_cache_ttl_seconds. Responses carrying a continuation token record when
+# its saved result set expires (resultSetExpires), and baseResource stops serving them before then.
+#
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300
+
+# largest response stored in the shared cache; MongoDB documents are limited to 16MB
+MAX_SHARED_ENTRY_BYTES = 8 * 1024 * 1024
+
+#
+# Return cache key for a request to an endpoint, under the given index version
+#
+def makeKey(version, endpoint, params, offset, limit):
+    canonical = {}
+    for name, value in params.items():
+        if name in ['offset', 'limit', 'cursor'] or value is None:
+            continue
+        value = value.strip() if isinstance(value, basestring) else value
+        if value != '':
+            canonical[name] = value
+    canonical['offset'] = offset
+    canonical['limit'] = limit
+
+    blob = json.dumps([version, endpoint, canonical], sort_keys=True, default=str)
+    return hashlib.sha1(blob).hexdigest()
+
+#
+# In-process response cache
+#
+class LocalResponseCache(object):
+    def __init__(self, maxBytes, ttl):
+        self.ttl = ttl
+        self.cache = ByteLRUCache(maxBytes)
+        self.expired = 0
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self.cache.invalidate(key)
+            self.expired += 1
+            return None
+        return entry[1]
+
+    def put(self, key, response):
+        self.cache.put(key, (time.time() + self.ttl, response), len(response['body']) + 200)
+
+    def invalidate(self):
+        self.cache.invalidate()
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['backend'] = 'local'
+        stats['expired'] = self.expired
+        return stats
+
+#
+# Response cache shared by API processes through a MongoDB collection (expired by a TTL index).
+# Any collection with the pymongo find_one/replace_one/delete_many interface can be passed in.
+#
+class MongoResponseCache(object):
+    def __init__(self, ttl, collection=None):
+        self.ttl = ttl
+        self.collection = collection
+        self.indexed = False
+        self.lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'puts': 0, 'skipped': 0}
+
+    def entries(self):
+        if self.collection is not None:
+            return self.collection
+        entries = connection.getClient().endpoints.responseCache
+        if not self.indexed:
+            entries.create_index('createdAt', expireAfterSeconds=self.ttl)
+            self.indexed = True
+        return entries
+
+    def incr(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def get(self, key):
+        doc = self.entries().find_one({'_id': key})
+
+        # the TTL monitor only runs once a minute, so expiry is checked here too
+        if doc is None or doc['createdAt'] < datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl):
+            self.incr('misses')
+            return None
+
+        self.incr('hits')
+        return {'body': str(doc['body']), 'status': doc['status'], 'mimetype': doc['mimetype'], 'resultSetExpires': doc.get('resultSetExpires')}
+
+    def put(self, key, response):
+        if len(response['body']) > MAX_SHARED_ENTRY_BYTES:
+            self.incr('skipped')
+            return
+
+        doc = {'_id': key, 'createdAt': datetime.datetime.utcnow(), 'body': Binary(response['body']), 'status': response['status'], 'mimetype': response['mimetype'], 'resultSetExpires': response.get('resultSetExpires')}
+        self.entries().replace_one({'_id': key}, doc, upsert=True)
+        self.incr('puts')
+
+    # keys include the index version, so old entries are never read again; this just frees the space
+    def invalidate(self):
+        self.entries().delete_many({})
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats['backend'] = 'mongo'
+        return stats
+
+_cache = None
+_cacheLock = threading.Lock()
+
+#
+# Return response cache configured for this process, or None if response caching is disabled
+#
+def getCache():
+    global _cache
+    if _cache is None:
+        with _cacheLock:
+            if _cache is None:
+                config = connection.getConfig()
+                backend = config.get('response_cache', 'local')
+                ttl = config.get('response_cache_ttl_seconds', DEFAULT_TTL)
+                if backend == 'none':
+                    return None
+                if backend == 'mongo':
+                    _cache = MongoResponseCache(ttl)
+                else:
+                    _cache = LocalResponseCache(config.get('response_cache_bytes', DEFAULT_MAX_BYTES), ttl)
+                    indexversion.onChange(lambda version: _cache.invalidate())
+    return _cache
+
+def stats():
+    cache = getCache()
+    if cache is None:
+        return {'backend': 'none'}
+    return cache.stats()
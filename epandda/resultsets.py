@@ -0,0 +1,243 @@
+import base64
+import binascii
+import datetime
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+import gridfs
+import connection
+from matchset import SOURCES
+
+#
+# Materialized match sets for cursor-based paging
+#
+# When a data response has more results than fit on the page, the full match set is saved and the
+# response carries an opaque "next" token. Requesting the endpoint with cursor=<token> resolves the next
+# window straight from the saved set, without re-running index lookups, GridFS loads and intersections.
+#
+# Ids are saved as fixed-width records (16 byte UUIDs, 8 byte integers or space padded strings) in list
+# order, so a window is read by seeking to offset * width without reading the rest of the set.
+#
+# Two stores are available, selected with the result_store config setting:
+#
+#   "mongo" (default)   metadata in endpoints.resultSets (expired by a TTL index), ids in the
+#                       resultSetData GridFS bucket
+#   "local"             metadata and id files in the result_store_path directory
+#
+# Saved sets expire after result_set_ttl_seconds.
+#
+
+DEFAULT_TTL = 3600
+
+KIND_UUID = 'uuid'
+KIND_INT = 'int'
+KIND_STR = 'str'
+
+#
+# Encode ids as fixed-width records. Returns (kind, width, data).
+#
+def encodeRecords(ids):
+    if len(ids) == 0:
+        return KIND_STR, 1, b''
+
+    if all(isinstance(i, (int, long)) for i in ids):
+        try:
+            return KIND_INT, 8, struct.pack('>%dq' % len(ids), *ids)
+        except struct.error:
+            pass
+
+    strings = [i if isinstance(i, str) else unicode(i).encode('utf8') for i in ids]
+    joined = b''.join(strings)
+
+    # hex digits with hyphens in the canonical places: pack to 16 bytes each
+    if len(joined) == 36 * len(ids) and all(joined[p::36] == b'-' * len(ids) for p in (8, 13, 18, 23)):
+        try:
+            return KIND_UUID, 16, binascii.unhexlify(joined.replace(b'-', b''))
+        except (TypeError, binascii.Error):
+            pass
+
+    width = max(len(s) for s in strings)
+    return KIND_STR, width, b''.join(s.ljust(width) for s in strings)
+
+#
+# Decode fixed-width records back to ids
+#
+def decodeRecords(kind, width, data):
+    count = len(data) // width
+
+    if kind == KIND_INT:
+        return list(struct.unpack('>%dq' % count, data[:count * 8]))
+
+    if kind == KIND_UUID:
+        h = binascii.hexlify(data)
+        return ['%s-%s-%s-%s-%s' % (h[o:o + 8], h[o + 8:o + 12], h[o + 12:o + 16], h[o + 16:o + 20], h[o + 20:o + 32]) for o in xrange(0, count * 32, 32)]
+
+    return [data[o:o + width].rstrip().decode('utf8') for o in xrange(0, count * width, width)]
+
+#
+# Continuation tokens encode set id, offset and limit. Tokens are base32 so they survive the
+# lower-casing applied to request parameters.
+#
+def makeToken(setId, offset, limit):
+    return base64.b32encode('%s:%d:%d' % (setId, offset, limit)).rstrip('=').lower()
+
+def parseToken(token):
+    try:
+        token = str(token).upper()
+        setId, offset, limit = base64.b32decode(token + '=' * (-len(token) % 8)).split(':')
+        offset = int(offset)
+        limit = int(limit)
+    except (TypeError, ValueError, UnicodeError):
+        raise Exception({"GENERAL": "Invalid cursor"})
+
+    # tokens are only ever made for a page following another, so anything else has been tampered with
+    if offset < 0 or limit < 1:
+        raise Exception({"GENERAL": "Invalid cursor"})
+    return setId, offset, limit
+
+#
+# Result sets stored in MongoDB
+#
+class MongoResultStore(object):
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.indexed = False
+        self.sweptAt = 0
+
+    def sets(self):
+        return connection.getClient().endpoints.resultSets
+
+    def grid(self):
+        return gridfs.GridFS(connection.getClient().endpoints, collection='resultSetData')
+
+    def save(self, matches, meta):
+        if not self.indexed:
+            self.sets().create_index('createdAt', expireAfterSeconds=self.ttl)
+            self.indexed = True
+        self.sweep()
+
+        grid = self.grid()
+        setId = uuid.uuid4().hex
+        doc = {'_id': setId, 'createdAt': datetime.datetime.utcnow(), 'meta': meta, 'sources': {}}
+        for source in SOURCES:
+            kind, width, data = encodeRecords(matches.get(source))
+            fileId = grid.put(data, metadata={'resultSet': setId})
+            doc['sources'][source] = {'kind': kind, 'width': width, 'count': matches.count(source), 'file': fileId}
+
+        self.sets().insert_one(doc)
+        return setId
+
+    def load(self, setId):
+        doc = self.sets().find_one({'_id': setId})
+        if doc is None or doc['createdAt'] < datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl):
+            return None
+        return doc
+
+    def readWindow(self, doc, source, offset, limit):
+        s = doc['sources'][source]
+        if offset >= s['count']:
+            return []
+        if limit < 1:
+            limit = s['count'] - offset
+
+        f = self.grid().get(s['file'])
+        f.seek(offset * s['width'])
+        return decodeRecords(s['kind'], s['width'], f.read(limit * s['width']))
+
+    #
+    # Delete id files left behind by expired sets, at most once every ten minutes
+    #
+    def sweep(self):
+        if time.time() - self.sweptAt < 600:
+            return
+        self.sweptAt = time.time()
+
+        grid = self.grid()
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl * 2)
+        for f in connection.getClient().endpoints['resultSetData.files'].find({'uploadDate': {'$lt': cutoff}}, {'_id': True}):
+            grid.delete(f['_id'])
+
+#
+# Result sets stored as files in a local directory
+#
+class LocalResultStore(object):
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.sweptAt = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def save(self, matches, meta):
+        self.sweep()
+
+        setId = uuid.uuid4().hex
+        doc = {'_id': setId, 'createdAt': time.time(), 'meta': meta, 'sources': {}}
+        for source in SOURCES:
+            kind, width, data = encodeRecords(matches.get(source))
+            with open(os.path.join(self.path, setId + '.' + source), 'wb') as f:
+                f.write(data)
+            doc['sources'][source] = {'kind': kind, 'width': width, 'count': matches.count(source)}
+
+        # metadata is written last; a set without it is incomplete and never loaded
+        with open(os.path.join(self.path, setId + '.json'), 'w') as f:
+            json.dump(doc, f)
+        return setId
+
+    def load(self, setId):
+        if not setId.isalnum():
+            return None
+        try:
+            doc = json.load(open(os.path.join(self.path, setId + '.json')))
+        except IOError:
+            return None
+        if doc['createdAt'] < time.time() - self.ttl:
+            return None
+        return doc
+
+    def readWindow(self, doc, source, offset, limit):
+        s = doc['sources'][source]
+        if offset >= s['count']:
+            return []
+        if limit < 1:
+            limit = s['count'] - offset
+
+        with open(os.path.join(self.path, doc['_id'] + '.' + source), 'rb') as f:
+            f.seek(offset * s['width'])
+            return decodeRecords(s['kind'], s['width'], f.read(limit * s['width']))
+
+    def sweep(self):
+        if time.time() - self.sweptAt < 600:
+            return
+        self.sweptAt = time.time()
+
+        cutoff = time.time() - self.ttl * 2
+        for name in os.listdir(self.path):
+            name = os.path.join(self.path, name)
+            try:
+                if os.path.getmtime(name) < cutoff:
+                    os.remove(name)
+            except OSError:
+                pass
+
+_store = None
+_storeLock = threading.Lock()
+
+#
+# Return result store configured for this process
+#
+def getStore():
+    global _store
+    if _store is None:
+        with _storeLock:
+            if _store is None:
+                config = connection.getConfig()
+                ttl = config.get('result_set_ttl_seconds', DEFAULT_TTL)
+                if config.get('result_store', 'mongo') == 'local':
+                    _store = LocalResultStore(config.get('result_store_path', '/tmp/epandda-resultsets'), ttl)
+                else:
+                    _store = MongoResultStore(ttl)
+    return _store
@@ -0,0 +1,120 @@
+import datetime
+import json
+import uuid
+from bson import Binary, ObjectId
+from bson.decimal128 import Decimal128
+import connection
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+#
+# JSON serialization of API responses
+#
+# Responses are written by one of several backends, chosen with the json_backend config setting:
+#
+#   "auto" (default)    ujson if installed, then simplejson, then the standard library json module
+#   "ujson"             ujson (falls back to "auto" if not installed)
+#   "simplejson"        simplejson (falls back to "auto" if not installed)
+#   "json"              standard library json module
+#
+# With json_compact set responses are written without indentation or key sorting, which is
+# considerably faster for pages of thousands of records. The default is indented output with sorted keys.
+#
+# BSON values found in records (ObjectId, Decimal128, datetime, Etc.) are converted directly to
+# JSON-friendly values rather than round-tripping through bson.json_util: ObjectIds and UUIDs become
+# strings, datetimes ISO 8601 strings and Decimal128 values decimal strings, so no precision is lost.
+#
+
+#
+# Return JSON-friendly value for a value the JSON encoders don't handle natively
+#
+def toSerializable(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, Binary):
+        return obj.encode('hex')
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, 'next') or hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(repr(obj) + " is not JSON serializable")
+
+#
+# Return copy of data with all values converted to types the JSON encoders handle natively.
+# Mongo cursors and other iterables are converted to lists.
+#
+def convert(data):
+    if isinstance(data, dict):
+        return dict((k, convert(v)) for k, v in data.iteritems())
+    if isinstance(data, list):
+        return [convert(v) for v in data]
+    if data is None or isinstance(data, (basestring, bool, int, long, float)):
+        return data
+    return convert(toSerializable(data))
+
+def _jsonDumps(data, compact):
+    if compact:
+        return json.dumps(data, separators=(',', ':'), default=toSerializable)
+    return json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '), default=toSerializable)
+
+def _simplejsonDumps(data, compact):
+    if compact:
+        return simplejson.dumps(data, separators=(',', ':'), default=toSerializable)
+    return simplejson.dumps(data, sort_keys=True, indent=4, separators=(',', ': '), default=toSerializable)
+
+# ujson has no hook for unsupported types, so values are converted up front
+def _ujsonDumps(data, compact):
+    if compact:
+        return ujson.dumps(convert(data), escape_forward_slashes=False)
+    return ujson.dumps(convert(data), sort_keys=True, indent=4, escape_forward_slashes=False)
+
+BACKENDS = {
+    'json': _jsonDumps,
+    'simplejson': _simplejsonDumps,
+    'ujson': _ujsonDumps
+}
+
+#
+# Return names of backends that can be used in this process
+#
+def availableBackends():
+    available = ['json']
+    if simplejson is not None:
+        available.append('simplejson')
+    if ujson is not None:
+        available.append('ujson')
+    return available
+
+#
+# Return name of configured backend, or the fastest installed one
+#
+def backendName():
+    name = connection.getConfig().get('json_backend', 'auto')
+    if name not in availableBackends():
+        name = availableBackends()[-1]
+    return name
+
+#
+# Serialize data as a JSON byte string. If compact is None the json_compact config setting is used.
+#
+def dumps(data, compact=None, backend=None):
+    if compact is None:
+        compact = connection.getConfig().get('json_compact', False)
+    out = BACKENDS[backend or backendName()](data, compact)
+    if isinstance(out, unicode):
+        out = out.encode('utf8')
+    return out
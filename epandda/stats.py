@@ -1,56 +1,52 @@
 from flask_restful import Resource, Api
 from base import baseResource
+import connection
+import matchcache
+import materializedstats
+import responsecache
+import eslookup
+import termresolver
 #
 # Emit API stats
 #
 class stats(baseResource):
     def process(self):
-        
-        localityFields = {'localities': 'originalLocality', 'counties': 'county', 'stateProvinces': 'stateProvinceName', 'countries': 'countryName'}
+        # keep stored figures fresh in the background
+        materializedstats.ensureRefresher()
+
         # Get any supplied parameters
         # There are no required parameters at this time 
         params = self.getParams()
         if self.paramCount > 0:
             criteria = {'endpoint': 'stats', 'parameters': []}
-            pbdb = self.client.pbdb
-            idb = self.client.idigbio
-            endpoints = self.client.endpoints
             response = {}
-            if params['totalRecords']:
-                pbdbIndex = pbdb.pbdb_occurrences
-                idbIndex = idb.occurrence
-                pbdbCount = pbdbIndex.find().count()
-                idbCount = idbIndex.find().count()
-                totalCount = pbdbCount + idbCount
-                criteria['parameters'].append('totalRecords')
-                response['totalRecords'] = totalCount
-                response['specimens'] = idbCount
-                response['occurrences'] = pbdbCount
-           
-            localityIndex = endpoints.localityIndex
-            for place in ['countries', 'stateProvinces', 'counties', 'localities']:
-            	if params[place]:
-            		placeTerm = localityFields[place]
-            		#placeCount = len(list(localityIndex.aggregate([{'$group': {'_id': {'localities': '$' + placeTerm}}}])))
-                	placeCount = localityIndex.count()
-                	criteria['parameters'].append(place)
-                	response[place] = placeCount
 
-            if params['geoPoints']:
-                geoPointIndex = endpoints.geoPointIndex
-                geoCount = geoPointIndex.find().count()
-                criteria['parameters'].append('geoPoints')
-                response['geoPoints'] = geoCount
-           		
-            if params['taxonomies']:
-                taxonIndex = endpoints.taxonIndex
-                taxonCount = taxonIndex.find().count()
-                criteria['parameters'].append('taxonomies')
-                response['taxonomies'] = taxonCount
+            # figures are read from the materialized statistics document (see materializedstats.py)
+            requested = [p for p in ['totalRecords', 'countries', 'stateProvinces', 'counties', 'localities', 'geoPoints', 'taxonomies'] if params[p]]
+            if len(requested) > 0:
+                stored = materializedstats.load(self.client)
+                for p in requested:
+                    criteria['parameters'].append(p)
+                    response[p] = stored['counts'][p]
+                    if p == 'totalRecords':
+                        response['specimens'] = stored['counts']['specimens']
+                        response['occurrences'] = stored['counts']['occurrences']
+
+                response['estimated'] = stored['estimated']
+                response['computedAt'] = stored['computedAt']
+                response['ageSeconds'] = stored['ageSeconds']
+
+            if params['runtimeStats']:
+                criteria['parameters'].append('runtimeStats')
+                response['runtimeStats'] = {
+                    'mongoPool': connection.poolStats(),
+                    'gridMatchCache': matchcache.stats(),
+                    'responseCache': responsecache.stats(),
+                    'elasticsearch': eslookup.stats(),
+                    'termCache': termresolver.stats()
+                }
         else:
           return self.respondWithDescription()
-        # Indexes for querying stats from
-        # TODO: Cache these results
         return self.respond({'results': response, 'criteria': criteria})
 
     def description(self):
@@ -108,6 +104,13 @@ class stats(baseResource):
                 "type": "boolean",
                 "required": False,
                 "description": "The number of unique taxonomic hierarchies represented in the collections"
+            },
+            {
+                "name": "runtimeStats",
+                "label": "Runtime Statistics",
+                "type": "boolean",
+                "required": False,
+                "description": "Connection pool, cache and Elasticsearch lookup statistics for the API process serving the request"
             }
             ]
         }
@@ -1,7 +1,7 @@
 from mongo import mongoBasedResource
 from flask_restful import reqparse
-import gridfs
 import json
+import taxonterms
 from bson import ObjectId
 import requests
 from requests.exceptions import ConnectionError
@@ -15,12 +15,11 @@ parser.add_argument('taxnomy', type=str, help='Taxon hierarchy to search on')
 #
 #
 class taxonomy(mongoBasedResource):
+	cacheResponses = True
+
 	def process(self):
 		# Mongodb index for localities
-		tindex = self.client.endpoints.taxonIndex
 		mindex = self.client.endpoints.mediaIndex3
-		# Mongodb gridFS instance
-		grid = gridfs.GridFS(self.client.endpoints)                   
 
 		# returns dictionary of params as defined in endpoint description
 		# will throw exception if required param is not present
@@ -31,15 +30,15 @@ class taxonomy(mongoBasedResource):
 
 		if self.paramCount > 0:
 			imageRes = None
-			res = None
 			criteria = {'endpoint': 'taxonomy', 'parameters': {}, 'matchTerms': {'scientificNames': []}}
-			taxonQuery = []
+			taxonFields = []
+			taxonText = None
 			for p in [{'scientificName': ['scientificNames', 'originalScientificName']}, {'species': ['species', 'taxonomy.species']}, {'genus': ['genus', 'taxonomy.genus']}, {'family': ['family', 'taxonomy.family']}, {'order': ['order', 'taxonomy.order']}, {'class': ['class', 'taxonomy.class']}, {'family': ['family', 'taxonomy.family']}, {'phylum': ['phylum', 'taxonomy.phylum']}, {'kingdom': ['kingdom', 'taxonomy.kingdom']}, {'other': ['taxonomy.noRank']}]:
 				val = p.keys()[0]
 				if (params[val]):
 					criteria['parameters'][val] = params[val]
 					for field in p[val]:
-						taxonQuery.append({field: params[val]})
+						taxonFields.append((field, params[val]))
 			#for p in ['scientificNames', 'species', 'genus', 'family', 'order', 'class', 'family', 'phylum', 'kingdom', 'other']:
 			#	if (params[p]):
 			#		criteria['parameters'][p] = params[p]
@@ -47,20 +46,15 @@ class taxonomy(mongoBasedResource):
 			
 			if(params['fullTaxonomy']):
 				criteria['parameters']['fullTaxonomy'] = params['fullTaxonomy']
-				taxonQuery.append({'$text': {'$search': '"' + params['fullTaxonomy'] + '"', '$caseSensitive': False}})
+				taxonText = params['fullTaxonomy']
 			
 			
-			if (len(taxonQuery) == 0):
+			if (len(taxonFields) == 0 and taxonText is None):
 				return self.respondWithError({"GENERAL": "No valid parameters specified"})
-			if len(taxonQuery) > 0:
-				res = tindex.find({'$and': taxonQuery})
+			resolution = taxonterms.search(self.client, taxonFields, taxonText)
 			
-			d = []
-			matches = {'idigbio': [], 'pbdb': []}
-			idbCount = 0
-			pbdbCount = 0
-			if res:
-				for i in res:
+			if resolution.docs:
+				for i in resolution.docs:
 					if 'scientificNames' in i:
 						scientificNames = i['scientificNames']
 						for sciName in scientificNames:
@@ -78,31 +72,12 @@ class taxonomy(mongoBasedResource):
 								criteria['matchTerms'][rank] = []
 								for term in taxonomy[rank]:
 									criteria['matchTerms'][rank].append(term)
+			matches = resolution.matches
 
-					if 'pbdbGridFile' in i:
-						pbdbGrids = i['pbdbGridFile']
-						for file in pbdbGrids:
-							pbdb_doc = grid.get(file)
-							pbdb_matches = json.loads(pbdb_doc.read())
-							matches['pbdb'] = matches['pbdb'] + pbdb_matches
-
-					if 'idbGridFile' in i:
-						if type(i['idbGridFile']) is list:
-							idbGrids = i['idbGridFile']
-							for file in idbGrids:
-								idb_doc = grid.get(file)
-								idb_matches = json.loads(idb_doc.read())
-								matches['idigbio'] = matches['idigbio'] + idb_matches
-						else:
-							idb_doc = grid.get(i['idbGridFile'])
-							idb_matches = json.loads(idb_doc.read())
-							matches['idigbio'] = matches['idigbio'] + idb_matches
-			
-			
 			imageQuery = []
 			media = []
 			if(params['images'] == 'true'):
-				imgRes = mindex.find({'idigbio_uuids': {'$in': matches['idigbio']}})
+				imgRes = mindex.find({'idigbio_uuids': {'$in': matches.get('idigbio')}})
 				for res in imgRes:
 					imgSpecimens = res['mediaURIs']
 					for specimen in imgSpecimens:
@@ -112,16 +87,8 @@ class taxonomy(mongoBasedResource):
 							if [url, link] in media:
 								continue
 							media.append([url, link])
-			
-			idbCount = len(matches['idigbio'])
-			pbdbCount = len(matches['pbdb'])
-
-			item = {'matches': {'idigbio': matches['idigbio'], 'pbdb': matches['pbdb']}}
-			d.append(item)
-			d = self.resolveReferences(d)
-			counts = {'totalCount': idbCount + pbdbCount, 'idbCount': idbCount, 'pbdbCount': pbdbCount}
 
-			return self.respond({'counts': counts, 'results': d, 'criteria': criteria, 'media': media})
+			return self.respondWithMatches(matches, {'criteria': criteria, 'media': media})
 
 		else:
 			return self.respondWithDescription()
@@ -0,0 +1,14 @@
+import termresolver
+
+#
+# Taxon term resolution, against endpoints.taxonIndex
+#
+# Terms are taxon field values (eg. taxonomy.genus) and/or a phrase searched across the full taxonomy.
+# /occurrences taxon_name and /taxonomy fullTaxonomy are the same full text search.
+#
+
+# fields the endpoints read from matched documents
+FIELDS = ['_id', 'scientificNames', 'taxonomy']
+
+def search(client, fields=[], text=None):
+    return termresolver.searchIndex(client, 'taxon', 'taxonIndex', FIELDS, fields, text)
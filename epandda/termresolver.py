@@ -0,0 +1,96 @@
+import collections
+import threading
+import gridfs
+from bson import BSON
+import connection
+import gridloader
+import indexversion
+import matchcache
+from matchcache import ByteLRUCache
+from matchset import MatchSet
+
+#
+# Shared, cached resolution of search terms to matches
+#
+# Each search dimension has a resolver module (taxonterms, localityterms, chronoterms, lithoterms) that
+# turns a term into the index documents it matches and their merged MatchSet, the same way for every
+# endpoint. Resolutions are cached here under the dimension's canonical key for the term, so a taxon
+# resolved for /occurrences is reused by /taxonomy and the other way round.
+#
+# The cache is bounded by term_cache_bytes and dropped when the index version changes. Documents are
+# only held with the fields the endpoints read from them (each dimension's FIELDS), and are charged at
+# their BSON size. Cached resolutions are shared between requests: callers must not modify their
+# matches or docs.
+#
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+# fields referencing an index document's GridFS match files
+GRID_FIELDS = ['pbdbGridFile', 'idbGridFile']
+
+# rough per-document overhead of the decoded dict, on top of its BSON size
+DOC_OVERHEAD_BYTES = 280
+
+Resolution = collections.namedtuple('Resolution', ['matches', 'docs'])
+
+_cache = None
+_cacheLock = threading.Lock()
+
+#
+# Return the shared resolution cache, sized from config on first use
+#
+def getCache():
+    global _cache
+    if _cache is None:
+        with _cacheLock:
+            if _cache is None:
+                _cache = ByteLRUCache(connection.getConfig().get('term_cache_bytes', DEFAULT_MAX_BYTES))
+                indexversion.onChange(lambda version: _cache.invalidate())
+    return _cache
+
+def estimateSize(resolution):
+    size = sum(matchcache.estimateSize(resolution.matches.get(source)) for source in ['idigbio', 'pbdb'])
+    return size + sum(len(BSON.encode(doc)) + DOC_OVERHEAD_BYTES for doc in resolution.docs)
+
+#
+# Return copies of docs holding only the given fields
+#
+def project(docs, fields):
+    return [dict((f, doc[f]) for f in fields if f in doc) for doc in docs]
+
+#
+# Return the resolution cached under key, or compute it with compute() (returning matches and docs)
+#
+def resolve(key, compute):
+    cache = getCache()
+    key = (indexversion.currentVersion(),) + tuple(key)
+
+    resolution = cache.get(key)
+    if resolution is None:
+        matches, docs = compute()
+        resolution = Resolution(matches, docs)
+        cache.put(key, resolution, estimateSize(resolution))
+    return resolution
+
+def stats():
+    return getCache().stats()
+
+#
+# Resolve field values and/or a full text phrase against an endpoints index collection, loading the
+# GridFS matches of the documents found. Fields are (field, value) pairs, all of which must match.
+# Documents are kept with only the keep fields.
+#
+def searchIndex(client, dimension, collection, keep, fields=[], text=None):
+    fields = tuple(sorted(set(fields)))
+    text = ' '.join(text.lower().split()) if text else None
+
+    def compute():
+        query = [{field: value} for field, value in fields]
+        if text:
+            query.append({'$text': {'$search': '"' + text + '"'}})
+        if len(query) == 0:
+            return MatchSet(), []
+        docs = list(client.endpoints[collection].find({'$and': query}, dict.fromkeys(keep + GRID_FIELDS, True)))
+        return gridloader.loadDocMatches(gridfs.GridFS(client.endpoints), docs), project(docs, keep)
+
+    return resolve((dimension, fields, text), compute)
@@ -0,0 +1,88 @@
+# Elasticsearch lookup cache and circuit breaker tests
+import unittest
+from elasticsearch.exceptions import ConnectionTimeout
+
+from epandda import eslookup
+
+#
+# Stand-in for the Elasticsearch client, failing while down is set
+#
+class FakeElasticsearch(object):
+
+  def __init__(self):
+    self.calls = []
+    self.down = False
+
+  def search(self, index, body, request_timeout=None):
+    self.calls.append(body)
+    if self.down:
+      raise ConnectionTimeout("TIMEOUT", "timed out", None)
+    name = body["query"]["match"]["name"]["query"] if "match" in body["query"] else None
+    if name == "nothing":
+      return {"hits": {"hits": []}}
+    return {"hits": {"hits": [{"_score": 1.5, "_source": {"name": "Hell Creek", "level": "formation"}, "_index": index}]}}
+
+class ESLookupTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.es = FakeElasticsearch()
+    self.breaker = eslookup.CircuitBreaker(2, 60)
+    self.lookup = eslookup.LookupClient([], 1, 60, 60, 100, self.breaker, self.es)
+
+  def fallback(self, query, rank):
+    return [{"_score": 1.0, "_source": {"name": "local " + query, "level": rank}}]
+
+  def test_cached(self):
+    hits = self.lookup.search("litholookup", "hell creek")
+    assert hits == [{"_score": 1.5, "_source": {"name": "Hell Creek", "level": "formation"}}]
+    assert self.lookup.search("litholookup", "hell creek") == hits
+    assert len(self.es.calls) == 1
+    assert self.lookup.stats()["cacheHits"] == 1
+
+  def test_negative_cached(self):
+    assert self.lookup.search("litholookup", "nothing") == []
+    assert self.lookup.search("litholookup", "nothing") == []
+    assert len(self.es.calls) == 1
+    assert self.lookup.stats()["negativeHits"] == 1
+
+  def test_rank_query(self):
+    self.lookup.search("litholookup", "hell creek", "formation")
+    assert self.es.calls[0]["query"]["bool"]["must"][1] == {"term": {"level": "formation"}}
+
+  def test_breaker_opens_and_falls_back(self):
+    self.es.down = True
+    for i in range(2):
+      assert self.lookup.search("litholookup", "q" + str(i), None, self.fallback)[0]["_source"]["name"] == "local q" + str(i)
+    assert self.breaker.stats()["state"] == eslookup.OPEN
+
+    # open breaker answers from the fallback without calling Elasticsearch
+    self.lookup.search("litholookup", "q3", None, self.fallback)
+    assert len(self.es.calls) == 2
+    assert self.lookup.stats()["fallbacks"] == 3
+    self.assertRaises(Exception, self.lookup.search, "litholookup", "q4")
+
+  def test_breaker_half_open(self):
+    self.es.down = True
+    for i in range(2):
+      self.lookup.search("litholookup", "q" + str(i), None, self.fallback)
+    self.breaker.openedAt -= 61
+
+    # a failed trial reopens the breaker, a successful one closes it
+    self.lookup.search("litholookup", "q5", None, self.fallback)
+    assert self.breaker.stats()["state"] == eslookup.OPEN
+    self.breaker.openedAt -= 61
+    self.es.down = False
+    self.lookup.search("litholookup", "q6", None, self.fallback)
+    assert self.breaker.stats()["state"] == eslookup.CLOSED
+    assert self.breaker.stats()["opened"] == 2
+
+  def test_stale_entry_used(self):
+    self.lookup.search("litholookup", "hell creek")
+    self.lookup.ttl = -1
+    self.lookup.cache.put(("litholookup", "hell creek", None), (0, [{"_score": 1.0, "_source": {"name": "old"}}]), 1)
+    self.es.down = True
+    assert self.lookup.search("litholookup", "hell creek", None, self.fallback)[0]["_source"]["name"] == "old"
+    assert self.lookup.stats()["staleHits"] == 1
+
+if __name__ == '__main__':
+  unittest.main()
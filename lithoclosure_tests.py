@@ -0,0 +1,49 @@
+# Lithostratigraphic closure tests
+import unittest
+
+from epandda import lithoclosure
+
+class LithoClosureTestCase(unittest.TestCase):
+
+  def docs(self):
+    return [
+      {"name": "Montana Group", "rank": "Group", "child_formations": ["Two Medicine", "Judith River"], "pbdb_matches": [1]},
+      {"name": "Two Medicine", "rank": "formation", "child_members": ["Upper Two Medicine"], "idb_matches": ["a", "b"], "pbdb_matches": [2, 3]},
+      {"name": "Judith River", "rank": "formation", "idb_matches": ["b", "c"], "pbdb_matches": [3, 4]},
+      {"name": "Upper Two Medicine", "rank": "member", "idb_matches": ["d"], "pbdb_matches": [5]},
+      {"name": "Coal Ridge", "rank": "bed", "member": "Upper Two Medicine", "pbdb_matches": [6, 2]}
+    ]
+
+  def closure(self, docs):
+    return dict((c["_id"], c) for c in lithoclosure.buildClosure(docs))
+
+  def test_group_closure(self):
+    group = self.closure(self.docs())["group:montana group"]
+    assert [u["unit"] for u in group["units"]] == ["Montana Group", "Judith River", "Two Medicine", "Upper Two Medicine", "Coal Ridge"]
+    assert group["idb_matches"] == ["b", "c", "a", "d"]
+    assert group["pbdb_matches"] == [1, 3, 4, 2, 5, 6]
+
+  def test_leaf_and_parent_links(self):
+    closure = self.closure(self.docs())
+    assert [u["unit"] for u in closure["bed:coal ridge"]["units"]] == ["Coal Ridge"]
+    assert [u["type"] for u in closure["member:upper two medicine"]["units"]] == ["member", "bed"]
+    assert closure["formation:judith river"]["pbdb_matches"] == [3, 4]
+
+  def test_order_independent(self):
+    forward = self.closure(self.docs())
+    backward = self.closure(list(reversed(self.docs())))
+    for key in forward:
+      assert forward[key]["units"] == backward[key]["units"]
+      assert sorted(forward[key]["pbdb_matches"]) == sorted(backward[key]["pbdb_matches"])
+
+  def test_cycles_and_rank_order(self):
+    docs = [
+      {"name": "A", "rank": "formation", "child_members": ["B"], "group": "B"},
+      {"name": "B", "rank": "member", "child_formations": ["A"]}
+    ]
+    closure = self.closure(docs)
+    assert [u["unit"] for u in closure["formation:a"]["units"]] == ["A", "B"]
+    assert [u["unit"] for u in closure["member:b"]["units"]] == ["B"]
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,41 @@
+# Match set tests
+import unittest
+
+from epandda.matchset import MatchSet
+
+class MatchSetTestCase(unittest.TestCase):
+
+  def test_add_deduplicates_in_order(self):
+    m = MatchSet(idigbio=["a", "b"])
+    m.add("idigbio", ["c", "a", "c", "d"])
+    m.add("pbdb", [1, 2, 1])
+    assert m.get("idigbio") == ["a", "b", "c", "d"]
+    assert m.get("pbdb") == [1, 2]
+    assert m.counts() == {"totalCount": 6, "idbCount": 4, "pbdbCount": 2}
+    assert ("idigbio", "c") in m and ("pbdb", "c") not in m
+
+  def test_union(self):
+    m = MatchSet(["a", "b"], [1]) | MatchSet(["b", "c"], [2])
+    assert m.toMatches() == {"idigbio": ["a", "b", "c"], "pbdb": [1, 2]}
+
+  def test_difference(self):
+    m = MatchSet(["a", "b", "c"], [1, 2]) - MatchSet(["b"], [3])
+    assert m.toMatches() == {"idigbio": ["a", "c"], "pbdb": [1, 2]}
+
+  def test_intersection_keeps_first_order(self):
+    m = MatchSet(["c", "b", "a"], [1, 2]) & MatchSet(["a", "b", "d"], [2])
+    assert m.toMatches() == {"idigbio": ["b", "a"], "pbdb": [2]}
+
+  def test_intersection_ignore_empty(self):
+    # a set with no ids for a source doesn't constrain that source
+    sets = [MatchSet(["a", "b"], [1, 2]), MatchSet(["b"]), MatchSet(["b", "c"], [2, 3])]
+    assert MatchSet.intersection(sets).toMatches() == {"idigbio": ["b"], "pbdb": [2]}
+    assert MatchSet.intersection(sets, ignoreEmpty=False).toMatches() == {"idigbio": ["b"], "pbdb": []}
+
+  def test_intersection_empty(self):
+    assert MatchSet.intersection([]).isEmpty()
+    assert MatchSet.intersection([MatchSet(["a"]), MatchSet(["b"])]).isEmpty()
+    assert len(MatchSet.intersection([MatchSet(["a", "b"]), MatchSet(["b", "a"])])) == 2
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,76 @@
+# Materialized statistics tests
+import unittest
+
+from epandda import materializedstats
+
+#
+# Stand-in for a pymongo collection, supporting distinct() and the aggregation stages used by
+# materializedstats.distinctCount
+#
+class FakeCollection(object):
+
+  def __init__(self, docs):
+    self.docs = docs
+
+  def count_documents(self, query):
+    return len(self.docs)
+
+  def distinct(self, field):
+    values = []
+    for doc in self.docs:
+      if field not in doc:
+        continue
+      for v in (doc[field] if type(doc[field]) is list else [doc[field]]):
+        if v not in values:
+          values.append(v)
+    return values
+
+  def aggregate(self, pipeline, allowDiskUse=False):
+    docs = [dict(d) for d in self.docs]
+    for stage in pipeline:
+      op, arg = stage.items()[0]
+      if op == '$unwind':
+        field = arg[1:]
+        docs = [dict(d, **{field: v}) for d in docs if field in d for v in (d[field] if type(d[field]) is list else [d[field]])]
+      elif op == '$match':
+        field, cond = arg.items()[0]
+        docs = [d for d in docs if d.get(field) not in cond['$nin']]
+      elif op == '$group':
+        docs = [{'_id': v} for v in set(d.get(arg['_id'][1:]) for d in docs)]
+      elif op == '$count':
+        docs = [{arg: len(docs)}] if docs else []
+    return iter(docs)
+
+class FakeDatabase(object):
+
+  def __init__(self, **collections):
+    self.__dict__.update(collections)
+
+class FakeClient(object):
+
+  def __init__(self, localities):
+    self.idigbio = FakeDatabase(occurrence=FakeCollection([{}] * 3))
+    self.pbdb = FakeDatabase(pbdb_occurrences=FakeCollection([{}] * 2))
+    self.endpoints = FakeDatabase(localityIndex=FakeCollection(localities), geoPointIndex=FakeCollection([]), taxonIndex=FakeCollection([{}]))
+
+class MaterializedStatsTestCase(unittest.TestCase):
+
+  def test_place_counts_match_distinct(self):
+    localityIndex = [
+      {'locality': 'hell creek', 'county': 'garfield', 'stateProvinceName': 'montana', 'countryName': 'united states'},
+      {'locality': 'hell creek', 'county': ['garfield', 'mccone'], 'stateProvinceName': 'montana', 'countryName': 'united states'},
+      {'locality': 'ghost ranch', 'county': 'rio arriba', 'stateProvinceName': 'new mexico', 'countryName': 'united states'},
+      {'locality': '', 'county': None, 'stateProvinceName': 'alberta', 'countryName': 'canada'},
+      {'countryName': 'canada'}
+    ]
+    client = FakeClient(localityIndex)
+    counts = materializedstats.compute(client)
+
+    for place, field in materializedstats.PLACE_FIELDS.items():
+      live = [v for v in client.endpoints.localityIndex.distinct(field) if v not in [None, '']]
+      assert counts[place] == len(live), place
+    assert (counts['localities'], counts['counties'], counts['stateProvinces'], counts['countries']) == (2, 3, 3, 2)
+    assert counts['totalRecords'] == 5
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,51 @@
+# Posting list encoding tests
+import json
+import uuid
+import unittest
+
+from epandda import postings
+
+class PostingsTestCase(unittest.TestCase):
+
+  def test_uuid_round_trip(self):
+    ids = [str(uuid.uuid4()) for i in range(50)]
+
+    for compress in [False, True]:
+      data = postings.encode(ids, compress)
+      assert postings.isPostingList(data)
+      assert postings.decode(data) == ids
+
+  def test_int_round_trip(self):
+    ids = [5, 1, 300, 70000, 2 ** 40, 300]
+
+    for compress in [False, True]:
+      data = postings.encode(ids, compress)
+      assert postings.decode(data) == sorted(ids)
+
+  def test_empty_list(self):
+    assert postings.decode(postings.encode([])) == []
+
+  def test_json_files_still_decode(self):
+    ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    assert postings.decode(json.dumps(ids)) == ids
+    assert postings.decode(json.dumps([3, 1, 2])) == [3, 1, 2]
+
+  def test_rejects_other_ids(self):
+    self.assertRaises(ValueError, postings.encode, ["not-a-uuid"])
+    self.assertRaises(ValueError, postings.encode, [1, -2])
+
+  def test_decode_array(self):
+    if postings.numpy is None:
+      return
+
+    ints = [9, 128, 16384, 1, 2 ** 35]
+    assert postings.decodeArray(postings.encode(ints, True)).tolist() == sorted(ints)
+    assert postings.decodeArray(json.dumps(ints)).tolist() == ints
+
+    ids = [str(uuid.uuid4()) for i in range(10)]
+    arr = postings.decodeArray(postings.encode(ids))
+    assert arr.shape == (10, 16)
+    assert [str(uuid.UUID(bytes=row.tostring())) for row in arr] == ids
+
+if __name__ == '__main__':
+  unittest.main()
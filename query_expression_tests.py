@@ -0,0 +1,82 @@
+# /query boolean expression tests
+import json
+import unittest
+from flask import Flask
+from flask_restful import Api
+
+from epandda.matchset import MatchSet
+from epandda.query import query
+
+class QueryExpressionTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.query = query()
+
+  def leaf(self, name):
+    return {"endpoint": name, "parameters": {}}
+
+  def evaluate(self, expression, sets):
+    leaves = []
+    self.query.findLeaves(expression, leaves)
+    assert [l["endpoint"] for l in leaves] == sorted(sets.keys())
+    return self.query.evaluate(expression, iter([sets[l["endpoint"]] for l in leaves]))
+
+  def test_and_not(self):
+    sets = {
+      "a": MatchSet(range(0, 20), ["x", "y"]),
+      "b": MatchSet(range(5, 25), ["y"]),
+      "c": MatchSet(range(8, 10), [])
+    }
+    result = self.evaluate({"and": [self.leaf("a"), self.leaf("b"), {"not": self.leaf("c")}]}, sets)
+    assert result.get("idigbio") == [5, 6, 7] + range(10, 20)
+    assert result.get("pbdb") == ["y"]
+
+  def test_or_within_and(self):
+    sets = {
+      "a": MatchSet(range(0, 5), []),
+      "b": MatchSet([3], []),
+      "c": MatchSet(range(20, 25), [])
+    }
+    result = self.evaluate({"and": [self.leaf("a"), {"or": [self.leaf("b"), self.leaf("c")]}]}, sets)
+    assert result.get("idigbio") == [3]
+
+  def test_empty_and(self):
+    sets = {"a": MatchSet([1], [1]), "b": MatchSet([2], [])}
+    assert self.evaluate({"and": [self.leaf("a"), self.leaf("b")]}, sets).isEmpty()
+
+  def test_invalid(self):
+    for expression in [{"not": self.leaf("a")}, {"or": [self.leaf("a"), {"not": self.leaf("b")}]}, {"and": [{"not": self.leaf("a")}]}, {"and": []}, "a"]:
+      self.assertRaises(Exception, self.query.findLeaves, expression, [])
+
+  def test_rejected_sub_queries(self):
+    self.query.loadEndpoint = lambda name: query() if name == "query" else None
+    queries = [
+      {"endpoint": "query", "parameters": {"queries": []}},
+      {"endpoint": "taxonomy", "parameters": {}, "timeout": "soon"},
+      {"endpoint": "taxonomy", "parameters": {}, "timeout": -1},
+      {"endpoint": "nothing", "parameters": {}}
+    ]
+    results = self.query.collect(self.query.submit(queries))
+    assert [r["errors"]["GENERAL"][0] for r in results] == [
+      "Endpoint query can't be used in a query",
+      "Query timeout must be a positive number of seconds",
+      "Query timeout must be a positive number of seconds",
+      "Unknown endpoint nothing"
+    ]
+
+  def test_numeric_json_parameters(self):
+    app = Flask(__name__)
+    Api(app).add_resource(query, '/query')
+    client = app.test_client()
+
+    body = {"queries": [{"endpoint": "nothing", "parameters": {}}], "limit": 10, "offset": 0}
+    resp = client.post('/query', data=json.dumps(body), content_type='application/json')
+    assert resp.status_code == 200
+    assert json.loads(resp.data)["queries"][0]["errors"] == {"GENERAL": ["Unknown endpoint nothing"]}
+
+    body = {"expression": {"endpoint": "nothing", "parameters": {}}, "limit": 10}
+    resp = client.post('/query', data=json.dumps(body), content_type='application/json')
+    assert json.loads(resp.data)["errors"]["GENERAL"][0] == "Query 1 (nothing) failed"
+
+if __name__ == '__main__':
+  unittest.main()
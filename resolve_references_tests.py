@@ -0,0 +1,129 @@
+# resolveReferences paging tests
+import unittest
+from bson import ObjectId
+
+from epandda.base import baseResource
+
+#
+# Minimal stand-in for a pymongo collection supporting the {field: {"$in": [...]}} queries
+# made by resolveReferences, and recording the ids that were looked up
+#
+class FakeCollection(object):
+
+  def __init__(self, records):
+    self.records = records
+    self.queried = []
+    self.projections = []
+
+  def find(self, query, projection=None):
+    field = query.keys()[0]
+    ids = query[field]["$in"]
+    self.queried.extend(ids)
+    self.projections.append(projection)
+    return [dict(r) for r in self.records if r.get(field) in ids]
+
+class ResolveReferencesTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.resource = baseResource()
+    self.resource.returnResponse = False
+
+  def setPage(self, offset, limit, **params):
+    params.update({"offset": offset, "limit": limit})
+    self.resource.paramCount = 0
+    self.resource.setParams(params)
+
+  def uuidData(self):
+    uuids = ["00000000-0000-0000-0000-%012d" % i for i in range(25)]
+    self.resource.idigbio = FakeCollection([{"idigbio:uuid": u, "dwc:genus": "g" + u[-2:]} for u in uuids])
+    self.resource.pbdb = FakeCollection([{"occurrence_no": i, "genus_name": "g" + str(i)} for i in range(100, 120)])
+
+    # split across several items, as endpoints combining index documents do
+    return uuids, [
+      {"matches": {"idigbio": uuids[:7], "pbdb": range(100, 103)}},
+      {"matches": {"idigbio": uuids[7:20], "pbdb": range(103, 115)}},
+      {"matches": {"idigbio": uuids[20:], "pbdb": range(115, 120)}}
+    ]
+
+  def test_uuid_page_window(self):
+    uuids, data = self.uuidData()
+
+    for offset, limit in [(0, 10), (5, 10), (10, 10), (18, 10), (24, 10), (30, 10)]:
+      self.setPage(offset, limit)
+      resolved = self.resource.resolveReferences(data)
+
+      assert [r["uuid"] for r in resolved["idigbio_resolved"]] == uuids[offset:offset + limit]
+      assert [r["dwc:genus"] for r in resolved["idigbio_resolved"]] == ["g" + u[-2:] for u in uuids[offset:offset + limit]]
+
+      pbdb_ids = range(100, 120)[offset:offset + limit]
+      assert len(resolved["pbdb_resolved"]) == len(pbdb_ids)
+      assert [r["genus_name"] for r in resolved["pbdb_resolved"]] == ["g" + str(i) for i in pbdb_ids]
+
+  def test_only_page_is_fetched(self):
+    uuids, data = self.uuidData()
+    self.setPage(10, 5)
+    self.resource.resolveReferences(data)
+
+    assert self.resource.idigbio.queried == uuids[10:15]
+    assert self.resource.pbdb.queried == range(110, 115)
+
+  def test_rows_not_multiplied_by_items(self):
+    uuids, data = self.uuidData()
+    self.setPage(0, 100)
+    resolved = self.resource.resolveReferences(data)
+
+    assert len(resolved["idigbio_resolved"]) == 25
+    assert len(resolved["pbdb_resolved"]) == 20
+
+  def test_no_limit(self):
+    uuids, data = self.uuidData()
+    self.setPage(20, 0)
+    resolved = self.resource.resolveReferences(data)
+
+    assert [r["uuid"] for r in resolved["idigbio_resolved"]] == uuids[20:]
+
+  def test_object_id_page_window(self):
+    idb_ids = [ObjectId() for i in range(12)]
+    pbdb_ids = [ObjectId() for i in range(12)]
+    self.resource.idigbio = FakeCollection([{"_id": i, "dwc:genus": str(i)} for i in idb_ids])
+    self.resource.pbdb = FakeCollection([{"_id": i, "genus_name": str(i)} for i in pbdb_ids])
+
+    data = [
+      {"matches": {"idigbio": [str(i) for i in idb_ids[:4]], "pbdb": [str(i) for i in pbdb_ids[:6]]}},
+      {"matches": {"idigbio": [str(i) for i in idb_ids[4:]], "pbdb": [str(i) for i in pbdb_ids[6:]]}}
+    ]
+
+    for offset, limit in [(0, 5), (3, 5), (10, 5)]:
+      self.setPage(offset, limit)
+      resolved = self.resource.resolveReferences(data)
+
+      expected = [str(i) for i in idb_ids[offset:offset + limit]]
+      assert [r["uuid"] for r in resolved["idigbio_resolved"]] == expected
+      assert [r["dwc:genus"] for r in resolved["idigbio_resolved"]] == expected
+      assert [r["genus_name"] for r in resolved["pbdb_resolved"]] == [str(i) for i in pbdb_ids[offset:offset + limit]]
+      assert self.resource.idigbio.queried[-len(expected):] == idb_ids[offset:offset + limit]
+
+  def test_requested_fields_projected(self):
+    uuids, data = self.uuidData()
+    self.setPage(0, 5, idigbio_fields="dwc:genus,idigbio:geopoint,nosuchfield")
+    resolved = self.resource.resolveReferences(data)
+
+    projection = self.resource.idigbio.projections[0]
+    assert projection == {"_id": True, "dwc:genus": True, "idigbio:geoPoint": True, "idigbio:uuid": True}
+    assert self.resource.pbdb.projections[0]["occurrence_no"] is True
+    assert self.resource.pbdb.projections[0]["_id"] is False
+    assert [r["dwc:genus"] for r in resolved["idigbio_resolved"]] == ["g" + u[-2:] for u in uuids[:5]]
+
+  def test_fields_none(self):
+    uuids, data = self.uuidData()
+    self.setPage(0, 5, fields="none")
+    resolved = self.resource.resolveReferences(data)
+
+    assert self.resource.idigbio.queried == []
+    assert self.resource.pbdb.queried == []
+    assert [r["uuid"] for r in resolved["idigbio_resolved"]] == uuids[:5]
+    assert sorted(resolved["idigbio_resolved"][0].keys()) == ["url", "uuid"]
+    assert resolved["pbdb_resolved"][0].keys() == ["url"]
+
+if __name__ == '__main__':
+  unittest.main()
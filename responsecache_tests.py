@@ -0,0 +1,144 @@
+# Response cache tests
+import datetime
+import time
+import unittest
+from flask import Flask, Response
+
+from epandda import indexversion, responsecache
+from epandda.base import baseResource
+
+#
+# Stand-in for the shared cache collection
+#
+class FakeCollection(object):
+
+  def __init__(self):
+    self.docs = {}
+
+  def find_one(self, query):
+    return self.docs.get(query['_id'])
+
+  def replace_one(self, query, doc, upsert=False):
+    self.docs[query['_id']] = doc
+
+  def delete_many(self, query):
+    self.docs = {}
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+  def response(self, body):
+    return {'body': body, 'status': 200, 'mimetype': 'application/json', 'resultSetExpires': None}
+
+  def test_key_canonical(self):
+    key = responsecache.makeKey('v1', 'taxonomy', {'genus': 'canis', 'family': None, 'species': '', 'cursor': None, 'offset': '0'}, 0, 10)
+    assert key == responsecache.makeKey('v1', 'taxonomy', {'genus': ' canis', 'limit': None}, 0, 10)
+    assert key != responsecache.makeKey('v1', 'taxonomy', {'genus': 'canis'}, 10, 10)
+    assert key != responsecache.makeKey('v1', 'geonames', {'genus': 'canis'}, 0, 10)
+    assert key != responsecache.makeKey('v2', 'taxonomy', {'genus': 'canis'}, 0, 10)
+    assert key != responsecache.makeKey('v1', 'taxonomy', {'genus': 'canis', 'idigbio_fields': 'dwc:genus'}, 0, 10)
+
+  def test_local_ttl(self):
+    cache = responsecache.LocalResponseCache(1024 * 1024, 60)
+    cache.put('a', self.response('{}'))
+    assert cache.get('a')['body'] == '{}'
+
+    cache.ttl = -1
+    cache.put('b', self.response('{}'))
+    assert cache.get('b') is None
+    assert cache.stats()['expired'] == 1
+
+  def test_local_bytes_bound(self):
+    cache = responsecache.LocalResponseCache(1600, 60)
+    for key in ['a', 'b', 'c']:
+      cache.put(key, self.response('x' * 300))
+    cache.get('a')
+    cache.put('d', self.response('x' * 300))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('d') is not None
+
+  def test_shared(self):
+    collection = FakeCollection()
+    cache = responsecache.MongoResponseCache(60, collection)
+    cache.put('a', self.response('{"x": 1}'))
+    assert cache.get('a') == self.response('{"x": 1}')
+    assert cache.get('b') is None
+
+    collection.docs['a']['createdAt'] = datetime.datetime.utcnow() - datetime.timedelta(seconds=120)
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+#
+# Cached endpoint whose responses carry a continuation token for a result set living setTtl seconds
+#
+class PagedResource(baseResource):
+  cacheResponses = True
+
+  def __init__(self, setTtl):
+    super(PagedResource, self).__init__()
+    self.setTtl = setTtl
+    self.runs = 0
+
+  def process(self):
+    self.runs += 1
+    self.resultSetExpires = int(time.time()) + self.setTtl
+    return Response('{"next": "token%d"}' % self.runs, status=200, mimetype='application/json')
+
+class ConditionalResponseTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.app = Flask(__name__)
+    self.currentVersion = indexversion.currentVersion
+    self.lastModified = indexversion.lastModified
+    indexversion.currentVersion = lambda: 'v1'
+    indexversion.lastModified = lambda: None
+    self.cache = responsecache._cache
+    responsecache._cache = responsecache.LocalResponseCache(1024 * 1024, 600)
+
+  def tearDown(self):
+    indexversion.currentVersion = self.currentVersion
+    indexversion.lastModified = self.lastModified
+    responsecache._cache = self.cache
+
+  def get(self, resource, etag=None, ifNoneMatch=None):
+    headers = {'If-None-Match': ifNoneMatch or '"' + etag + '"'} if etag or ifNoneMatch else {}
+    with self.app.test_request_context('/?genus=canis', headers=headers):
+      resource.paramCount = 0
+      resource.setParams({'genus': 'canis'})
+      return resource.processWithCache()
+
+  def test_token_outlives_max_age(self):
+    resource = PagedResource(3600)
+    first = self.get(resource)
+    etag = first.get_etag()[0]
+    assert etag.endswith('.' + str(resource.resultSetExpires))
+
+    assert self.get(resource).get_data() == first.get_data()
+    assert self.get(resource, etag).status_code == 304
+    assert resource.runs == 1
+
+  def test_weak_and_star(self):
+    resource = PagedResource(3600)
+    etag = self.get(resource).get_etag()[0]
+
+    # compressing proxies weaken the ETags they pass on
+    assert self.get(resource, ifNoneMatch='W/"' + etag + '"').status_code == 304
+    assert self.get(resource, ifNoneMatch='W/"other", W/"' + etag + '"').status_code == 304
+    assert self.get(resource, ifNoneMatch='W/"other"').status_code == 200
+
+    star = self.get(resource, ifNoneMatch='*')
+    assert star.status_code == 304 and star.get_etag()[0] == etag
+    assert resource.runs == 1
+
+  def test_expiring_token_reissued(self):
+    # the saved set would expire within the 300s max-age: run the query again rather than reuse it
+    resource = PagedResource(100)
+    first = self.get(resource)
+    etag = first.get_etag()[0]
+
+    second = self.get(resource, etag)
+    assert second.status_code == 200 and second.get_data() == '{"next": "token2"}'
+    assert resource.runs == 2
+
+if __name__ == '__main__':
+  unittest.main()
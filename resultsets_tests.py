@@ -0,0 +1,24 @@
+# Result set continuation token tests
+import base64
+import unittest
+
+from epandda import resultsets
+
+class ResultSetsTestCase(unittest.TestCase):
+
+  def craft(self, text):
+    return base64.b32encode(text).rstrip('=').lower()
+
+  def test_token_round_trip(self):
+    token = resultsets.makeToken('0123456789abcdef', 20, 10)
+    assert resultsets.parseToken(token) == ('0123456789abcdef', 20, 10)
+    assert resultsets.parseToken(token.upper()) == ('0123456789abcdef', 20, 10)
+
+  def test_invalid_tokens(self):
+    for token in ['not a token', self.craft('abc:1'), self.craft('abc:x:10'), self.craft('abc:-10:10'), self.craft('abc:10:0'), self.craft('abc:10:-5')]:
+      with self.assertRaises(Exception) as raised:
+        resultsets.parseToken(token)
+      assert raised.exception.args[0] == {"GENERAL": "Invalid cursor"}, token
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,42 @@
+# Response serializer tests
+import datetime
+import json
+import unittest
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+from epandda import serializers
+
+class SerializersTestCase(unittest.TestCase):
+
+  def record(self):
+    return {
+      "_id": ObjectId("5a0c6b4e2f8e4a1b2c3d4e5f"),
+      "lat": Decimal128("41.25"),
+      "modified": datetime.datetime(2017, 11, 15, 12, 30),
+      "ids": set([1]),
+      "name": u"Caf\u00e9"
+    }
+
+  def test_bson_types_converted(self):
+    converted = serializers.convert([self.record()])
+    assert converted == [{"_id": "5a0c6b4e2f8e4a1b2c3d4e5f", "lat": "41.25", "modified": "2017-11-15T12:30:00", "ids": [1], "name": u"Caf\u00e9"}]
+
+  def test_decimal_exact(self):
+    assert serializers.convert(Decimal128("0.1000000000000000000000000000000001")) == "0.1000000000000000000000000000000001"
+
+  def test_backends_agree(self):
+    expected = serializers.convert({"results": [self.record()], "next": None})
+    for backend in serializers.availableBackends():
+      for compact in [False, True]:
+        out = serializers.dumps({"results": [self.record()], "next": None}, compact, backend)
+        assert isinstance(out, str)
+        assert json.loads(out) == expected
+
+  def test_compact(self):
+    out = serializers.dumps({"b": 1, "a": [1, 2]}, True, "json")
+    assert "\n" not in out and ": " not in out
+    assert serializers.dumps({"b": 1, "a": [1, 2]}, False, "json") == '{\n    "a": [\n        1,\n        2\n    ],\n    "b": 1\n}'
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+# Shared term resolution tests
+import unittest
+
+from epandda import indexversion, termresolver, taxonterms, localityterms, lithoterms
+from epandda.matchset import MatchSet
+
+#
+# Stand-in for the endpoints database, recording queries made to each index collection
+#
+class FakeCollection(object):
+
+  def __init__(self, docs):
+    self.docs = docs
+    self.queries = []
+    self.projections = []
+
+  def find(self, query, projection=None):
+    self.queries.append(query)
+    self.projections.append(projection)
+    return [dict(d) for d in self.docs]
+
+class FakeClient(object):
+
+  def __init__(self):
+    self.endpoints = {
+      "taxonIndex": FakeCollection([{"_id": 1, "scientificNames": ["tyrannosaurus rex"], "taxonomy": {"genus": ["tyrannosaurus"]}, "notes": "x" * 5000}]),
+      "localityIndex": FakeCollection([{"_id": 2, "countryName": "united states"}])
+    }
+
+class TermResolverTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.version = "v1"
+    self.currentVersion = indexversion.currentVersion
+    self.gridFS = termresolver.gridfs.GridFS
+    self.lithoFunctions = (lithoterms.eslookup.search, lithoterms.lithoclosure.lookup, lithoterms.lithoclosure.loadMatches)
+    indexversion.currentVersion = lambda: self.version
+    termresolver.gridfs.GridFS = lambda db: None
+    termresolver.getCache().invalidate()
+    self.client = FakeClient()
+
+  def tearDown(self):
+    indexversion.currentVersion = self.currentVersion
+    termresolver.gridfs.GridFS = self.gridFS
+    lithoterms.eslookup.search, lithoterms.lithoclosure.lookup, lithoterms.lithoclosure.loadMatches = self.lithoFunctions
+
+  def test_shared_between_endpoints(self):
+    # /occurrences taxon_name and /taxonomy fullTaxonomy
+    first = taxonterms.search(self.client, [], "Tyrannosaurus  rex")
+    second = taxonterms.search(self.client, [], "tyrannosaurus rex")
+    assert second is first
+    assert self.client.endpoints["taxonIndex"].queries == [{"$and": [{"$text": {"$search": '"tyrannosaurus rex"'}}]}]
+    assert [d["_id"] for d in first.docs] == [1]
+
+  def test_docs_projected(self):
+    resolution = taxonterms.search(self.client, [], "tyrannosaurus rex")
+    assert resolution.docs == [{"_id": 1, "scientificNames": ["tyrannosaurus rex"], "taxonomy": {"genus": ["tyrannosaurus"]}}]
+    assert "notes" not in self.client.endpoints["taxonIndex"].projections[0]
+    assert "idbGridFile" in self.client.endpoints["taxonIndex"].projections[0]
+    assert termresolver.estimateSize(resolution) < 1000
+
+  def test_fields_canonical(self):
+    first = taxonterms.search(self.client, [("genus", "tyrannosaurus"), ("taxonomy.genus", "tyrannosaurus"), ("genus", "tyrannosaurus")])
+    second = taxonterms.search(self.client, [("taxonomy.genus", "tyrannosaurus"), ("genus", "tyrannosaurus")])
+    assert second is first
+    assert self.client.endpoints["taxonIndex"].queries == [{"$and": [{"genus": "tyrannosaurus"}, {"taxonomy.genus": "tyrannosaurus"}]}]
+
+  def test_dimensions_separate(self):
+    taxonterms.search(self.client, [], "montana")
+    localityterms.search(self.client, [], "montana")
+    assert len(self.client.endpoints["taxonIndex"].queries) == 1
+    assert len(self.client.endpoints["localityIndex"].queries) == 1
+
+  def test_index_version(self):
+    first = localityterms.search(self.client, [], "montana")
+    self.version = "v2"
+    assert localityterms.search(self.client, [], "montana") is not first
+    assert len(self.client.endpoints["localityIndex"].queries) == 2
+
+  def test_litho_rank_canonical(self):
+    ranks = []
+    lithoterms.eslookup.search = lambda index, query, rank, fallback: ranks.append(rank) or []
+    lithoterms.lithoclosure.lookup = lambda client, units: []
+    lithoterms.lithoclosure.loadMatches = lambda grid, docs: MatchSet()
+
+    # request parameters are lower-cased; Elasticsearch is sent the rank as indexed
+    lithoterms.resolve(self.client, "hell creek", "formation")
+    lithoterms.resolve(self.client, "hell creek", " Member ")
+    lithoterms.resolve(self.client, "hell creek", None)
+    lithoterms.resolve(self.client, "hell creek", "stratum")
+    assert ranks == ["Formation", "Member", None, "stratum"]
+
+  def test_empty_query(self):
+    resolution = localityterms.search(self.client, [])
+    assert resolution.docs == [] and resolution.matches.isEmpty()
+    assert self.client.endpoints["localityIndex"].queries == []
+
+if __name__ == '__main__':
+  unittest.main()